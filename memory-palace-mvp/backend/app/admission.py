@@ -0,0 +1,167 @@
+"""生成请求准入控制 - 全局并发上限 + 有界等待队列 + 按客户端的令牌桶限流
+
+每个生成请求都会调用付费且很慢的 LLM：同时进行的生成数有上限，超出的请求按先来先到排队，
+队列满或排队超时立即返回 429 + Retry-After，而不是让所有请求一起拖到超时；
+每个 IP（游客）/ 用户一个令牌桶，按单词数扣减，单个脚本刷接口只会把自己限住。
+"""
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict, deque
+
+from .metrics import Histogram
+
+GEN_MAX_CONCURRENT = int(os.getenv("GEN_MAX_CONCURRENT", "8"))       # 同时进行的生成请求数
+GEN_MAX_QUEUE = int(os.getenv("GEN_MAX_QUEUE", "32"))                # 最多排队的请求数，超出直接 429
+GEN_QUEUE_TIMEOUT = float(os.getenv("GEN_QUEUE_TIMEOUT", "30"))      # 最长排队秒数，超时 429
+GEN_RATE_GUEST = float(os.getenv("GEN_RATE_GUEST", "600"))           # 游客每分钟单词数（按 IP，0 不限）
+GEN_RATE_USER = float(os.getenv("GEN_RATE_USER", "2000"))            # 注册用户每分钟单词数（0 不限）
+GEN_RATE_BURST = float(os.getenv("GEN_RATE_BURST", "2"))             # 桶容量 = 每分钟额度 × 该倍数
+TRUST_PROXY = os.getenv("TRUST_PROXY", "0") == "1"                   # 部署在反向代理后时按 X-Forwarded-For 识别客户端
+
+QUEUE_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60, math.inf)
+MAX_CLIENTS = 10000
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, retry_after, detail, reason):
+        self.retry_after, self.detail, self.reason = max(1, math.ceil(retry_after)), detail, reason
+        super().__init__(detail)
+
+
+class RateLimiter:
+    """按客户端的令牌桶：容量 burst，每秒补充 rate_per_min / 60；LRU 保留最近活跃的客户端"""
+    def __init__(self, rate_per_min, burst_factor=GEN_RATE_BURST, max_clients=MAX_CLIENTS):
+        self.rate = rate_per_min / 60
+        self.capacity = rate_per_min * burst_factor
+        self.max_clients = max_clients
+        self.buckets = OrderedDict()  # key -> [tokens, 上次补充时间]
+        self.limited = self.refunded = 0
+
+    def take(self, key, cost):
+        """扣减 cost 个令牌，成功返回 0，否则返回需要等待的秒数；超过桶容量的请求按容量计"""
+        if self.rate <= 0: return 0
+        cost, now = min(cost, self.capacity), time.monotonic()
+        b = self.buckets.pop(key, None) or [self.capacity, now]
+        b[0] = min(self.capacity, b[0] + (now - b[1]) * self.rate)
+        b[1] = now
+        self.buckets[key] = b
+        if len(self.buckets) > self.max_clients: self.buckets.popitem(last=False)
+        if b[0] >= cost:
+            b[0] -= cost
+            return 0
+        self.limited += 1
+        return (cost - b[0]) / self.rate
+
+    def refund(self, key, cost):
+        """退回 take 成功扣掉的令牌（请求随后被拒绝、没有真正执行）"""
+        if self.rate <= 0: return
+        b = self.buckets.get(key)
+        if b: b[0] = min(self.capacity, b[0] + min(cost, self.capacity))
+        self.refunded += 1
+
+
+class AdmissionController:
+    """全局并发上限 + FIFO 有界等待队列；名额释放时直接转交给队首，不会被新来的请求插队"""
+    def __init__(self, max_concurrent=GEN_MAX_CONCURRENT, max_queue=GEN_MAX_QUEUE, queue_timeout=GEN_QUEUE_TIMEOUT):
+        self.max_concurrent, self.max_queue, self.queue_timeout = max_concurrent, max_queue, queue_timeout
+        self.active = 0
+        self.waiters = deque()
+        self.queue_wait = Histogram(QUEUE_BUCKETS)
+        self.service_avg = 5.0  # 单个生成耗时的滑动平均（秒），用于估算 Retry-After
+        self.admitted = self.rejected_full = self.rejected_timeout = self.peak_queue = 0
+        self.guests, self.users = RateLimiter(GEN_RATE_GUEST), RateLimiter(GEN_RATE_USER)
+
+    def _limiter(self, user_id, ip):
+        return (self.users, f"u{user_id}") if user_id else (self.guests, ip or "-")
+
+    def check_rate(self, user_id, ip, words):
+        """按单词数扣减客户端令牌，不足时抛 AdmissionRejected"""
+        limiter, key = self._limiter(user_id, ip)
+        wait = limiter.take(key, max(1, words))
+        if wait: raise AdmissionRejected(wait, "请求过于频繁，请稍后再试", "rate_limited")
+
+    def refund_rate(self, user_id, ip, words):
+        """check_rate 之后请求没被执行（排队满、排队超时、任务队列满）：退回扣掉的令牌，429 不消耗额度"""
+        limiter, key = self._limiter(user_id, ip)
+        limiter.refund(key, max(1, words))
+
+    def _retry_after(self):
+        return self.service_avg * (len(self.waiters) + 1) / self.max_concurrent
+
+    async def acquire(self):
+        """取得一个生成名额，返回开始时间（交给 release）；队列满或排队超时抛 AdmissionRejected"""
+        t = time.monotonic()
+        if self.active < self.max_concurrent and not self.waiters:
+            self.active += 1
+        else:
+            if len(self.waiters) >= self.max_queue:
+                self.rejected_full += 1
+                raise AdmissionRejected(self._retry_after(), "生成请求过多，请稍后再试", "queue_full")
+            fut = asyncio.get_running_loop().create_future()
+            self.waiters.append(fut)
+            self.peak_queue = max(self.peak_queue, len(self.waiters))
+            try:
+                await asyncio.wait_for(fut, self.queue_timeout)
+            except asyncio.TimeoutError:
+                self._forget(fut)
+                self.rejected_timeout += 1
+                raise AdmissionRejected(self._retry_after(), "排队超时，请稍后再试", "queue_timeout")
+            except asyncio.CancelledError:
+                # 客户端断开；如果名额恰好已转交过来，继续转交给下一个
+                if fut.done() and not fut.cancelled(): self.release(None)
+                else: self._forget(fut)
+                raise
+        self.admitted += 1
+        now = time.monotonic()
+        self.queue_wait.observe(now - t)
+        return now
+
+    def _forget(self, fut):
+        try: self.waiters.remove(fut)
+        except ValueError: pass
+
+    def release(self, started):
+        if started is not None: self.service_avg = 0.9 * self.service_avg + 0.1 * (time.monotonic() - started)
+        while self.waiters:
+            fut = self.waiters.popleft()
+            if not fut.done():
+                fut.set_result(None)  # 名额直接转交，active 不变
+                return
+        self.active -= 1
+
+    def stats(self):
+        return {"max_concurrent": self.max_concurrent, "max_queue": self.max_queue, "queue_timeout": self.queue_timeout,
+                "active": self.active, "queued": len(self.waiters), "peak_queue": self.peak_queue, "admitted": self.admitted,
+                "rejected_queue_full": self.rejected_full, "rejected_timeout": self.rejected_timeout,
+                "rate_limited": {"guest": self.guests.limited, "user": self.users.limited},
+                "rate_refunded": {"guest": self.guests.refunded, "user": self.users.refunded},
+                "queue_wait": self.queue_wait.to_dict(), "service_avg": round(self.service_avg, 2)}
+
+    def prometheus(self, prefix="memory_palace_admission"):
+        out = [f"# TYPE {prefix}_active gauge", f"{prefix}_active {self.active}",
+               f"# TYPE {prefix}_queued gauge", f"{prefix}_queued {len(self.waiters)}",
+               f"# TYPE {prefix}_requests_total counter",
+               f'{prefix}_requests_total{{result="admitted"}} {self.admitted}',
+               f'{prefix}_requests_total{{result="queue_full"}} {self.rejected_full}',
+               f'{prefix}_requests_total{{result="queue_timeout"}} {self.rejected_timeout}',
+               f'{prefix}_requests_total{{result="rate_limited"}} {self.guests.limited + self.users.limited}',
+               f"# TYPE {prefix}_queue_wait_seconds histogram"]
+        acc = 0
+        for b, n in zip(self.queue_wait.buckets, self.queue_wait.counts):
+            acc += n
+            out.append(f'{prefix}_queue_wait_seconds_bucket{{le="{"+Inf" if math.isinf(b) else f"{b:g}"}"}} {acc}')
+        out.append(f"{prefix}_queue_wait_seconds_sum {self.queue_wait.sum:.3f}")
+        out.append(f"{prefix}_queue_wait_seconds_count {self.queue_wait.count}")
+        return "\n".join(out) + "\n"
+
+
+def client_ip(request):
+    if TRUST_PROXY:
+        fwd = request.headers.get("x-forwarded-for")
+        if fwd: return fwd.split(",")[0].strip()
+    return request.client.host if request.client else None
+
+
+admission = AdmissionController()
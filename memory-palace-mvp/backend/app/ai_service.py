@@ -1,19 +1,29 @@
 ﻿# -*- coding: utf-8 -*-
 """AI Service - Memory Palace with 50 Predefined Scenes"""
-import json, os, re, time, math
+import asyncio, hashlib, importlib, json, os, re, time, math
 from typing import Optional
 from dataclasses import dataclass
-from openai import OpenAI
-from anthropic import Anthropic
+from .highlight import get_highlighter
+from .scene_format import word_table, compact_paragraph
+from .stream_json import SceneStreamParser, loads_lenient
+from .completeness import Coverage, CompletenessStats, FOLLOWUP_ROUNDS, salvage_scenes
+from .cache import GenerationCache
+from .fragments import FragmentStore
+from .failover import FailoverChain, AllProvidersFailed, transient
+from .metrics import ProviderMetrics
+from .http_pool import ConnectionPools, HTTP_WARM_ON_START
+from .shared_state import shared
+from .assets import assets
 
 @dataclass
 class TokenUsage:
     provider: str
     model: str
-    input_tokens: int
+    input_tokens: int  # 未命中提示缓存的输入 token（含缓存写入）
     output_tokens: int
     cost: float
     timestamp: float
+    cached_input_tokens: int = 0  # 命中提供商提示缓存的输入 token
 
 # 50 Predefined Scenes - scene_id maps to image
 SCENES = {
@@ -69,17 +79,18 @@ SCENES = {
     50: {"title_zh": "火山口", "title_en": "Volcano", "url": "https://images.unsplash.com/photo-1462332420958-a05d1e002413?w=1920&q=80", "kw": ["volcano","lava","eruption","power"]},
 }
 
-SCENE_LIST = "\n".join([f"{k}. {v['title_en']} - {','.join(v['kw'])}" for k,v in SCENES.items()])
+SCENE_LIST = "\n".join([f"{k}|{v['title_en']}|{','.join(v['kw'])}" for k,v in SCENES.items()])
 
-PROMPT = """你是记忆宫殿专家。将英文单词分配到场景中创作双语故事。
+# 提示词拆成两段：稳定前缀（角色、场景库、输出格式、规则）逐字不变，可被提供商提示缓存命中；
+# 可变部分只有单词表。前缀作为 system 发送，单词表作为 user 消息发送。
+PROMPT_PREFIX = """你是记忆宫殿专家。将用户给出的英文单词分配到场景中创作双语故事。
 
-任务: 处理{word_count}个单词，选择1-5个场景，创作记忆故事。
+任务: 处理用户给出的全部单词，选择1-5个场景，创作记忆故事。
 
-场景列表:
+场景列表(id|英文名|关键词):
 {scene_list}
 
-单词({word_count}个，必须全部使用):
-{words}
+单词格式: 每行一个，单词|词性|释义，空字段省略
 
 输出JSON:
 {{"scenes": [{{"scene_id": 1, "words_in_scene": ["word1"], "paragraphs": [{{"zh": "中文故事[[englishWord]]标记", "en": "English [[word]] story", "zh_pure": "纯中文翻译"}}]}}]}}
@@ -89,35 +100,76 @@ PROMPT = """你是记忆宫殿专家。将英文单词分配到场景中创作
 2. 中文故事示例: "一位[[magnanimous]]宽宏大量的老人..."
 3. 每个单词必须出现在words_in_scene和故事中
 4. scene_id 1-50，不重复，最多5场景
-5. 只输出JSON"""
+5. 只输出JSON""".format(scene_list=SCENE_LIST)
 
-PRICING = {"MiniMax-Text-01": {"input": 0.0001, "output": 0.0011}}
-CONFIG_FILE = os.path.join(os.path.dirname(__file__), ".ai_config.json")
+PROMPT_WORDS = """单词({word_count}个，必须全部使用):
+{words}"""
+
+# PROMPT 或场景库变化时版本号随之变化，旧缓存自动失效
+PROMPT_VERSION = hashlib.sha1((PROMPT_PREFIX + PROMPT_WORDS).encode('utf-8')).hexdigest()[:12]
+
+# 支持显式提示缓存的提供商（Anthropic 兼容接口）：前缀块标记为 ephemeral 缓存
+SYSTEM_CACHED = [{"type": "text", "text": PROMPT_PREFIX, "cache_control": {"type": "ephemeral"}}]
+
+MODELS = {"minimax": "MiniMax-Text-01", "zhipu": "glm-4-flash", "deepseek": "deepseek-chat"}
+# 接口地址可用环境变量覆盖（例如指向 bench/stub_llm.py 本地桩服务）
+BASE_URLS = {"minimax": os.getenv("MINIMAX_BASE_URL", "https://api.minimaxi.com/anthropic"),
+             "zhipu": os.getenv("ZHIPU_BASE_URL", "https://open.bigmodel.cn/api/paas/v4/"),
+             "deepseek": os.getenv("DEEPSEEK_BASE_URL", "https://api.deepseek.com/v1")}
+# SDK 按需导入（模块名, 类名）：只处理 /track、/parse-file 的 worker 不加载 openai / anthropic
+CLIENT_TYPES = {"minimax": ("anthropic", "AsyncAnthropic"), "zhipu": ("openai", "AsyncOpenAI"), "deepseek": ("openai", "AsyncOpenAI")}
+AI_PRELOAD = os.getenv("AI_PRELOAD", "0") == "1"  # 启动完成后在后台导入 SDK 并创建客户端，首个生成请求不再等导入
+PRICING = {"MiniMax-Text-01": {"input": 0.0001, "output": 0.0011, "cached_input": 0.00001}}
+CONFIG_FILE = os.path.join(os.path.dirname(__file__), ".ai_config.json")  # 旧版配置文件，首次启动时导入共享配置
+CONFIG_KEY = "ai_config"
+CONFIG_FIELDS = ("preferred_provider", "chunk_size", "max_parallel", "spread_providers")
 
 class AIConfig:
+    """配置存放在共享状态里：任何一个 worker 修改后，其他 worker 在下一次同步时重新加载"""
     def __init__(self):
         self.preferred_provider = os.getenv("AI_PROVIDER", "auto")
         self.api_keys = {"minimax": os.getenv("MINIMAX_API_KEY", ""), "zhipu": os.getenv("ZHIPU_API_KEY", ""), "deepseek": os.getenv("DEEPSEEK_API_KEY", "")}
+        # 分块并发生成：每块单词数、同时进行的 LLM 调用数、是否把各块分散到所有可用提供商
+        self.chunk_size = int(os.getenv("AI_CHUNK_SIZE", "60"))
+        self.max_parallel = int(os.getenv("AI_MAX_PARALLEL", "4"))
+        self.spread_providers = os.getenv("AI_SPREAD_PROVIDERS", "0") == "1"
+        self.on_change = []  # callback(api_key 有变化的提供商集合)，配置被其他 worker 修改后调用
         self._load()
+        shared.watch(CONFIG_KEY, self._reload)
     def _load(self):
         try:
-            if os.path.exists(CONFIG_FILE):
-                with open(CONFIG_FILE) as f:
-                    d = json.load(f)
-                    self.preferred_provider = d.get("preferred_provider", self.preferred_provider)
-                    for k,v in d.get("api_keys",{}).items():
-                        if k in self.api_keys and v: self.api_keys[k] = v
-        except: pass
-    def _save(self):
-        try:
-            with open(CONFIG_FILE,'w') as f: json.dump({"preferred_provider": self.preferred_provider, "api_keys": self.api_keys}, f)
-        except: pass
-    def to_dict(self): return {"preferred_provider": self.preferred_provider, "api_keys_status": {k: bool(v) for k,v in self.api_keys.items()}}
+            _, d = shared.get(CONFIG_KEY)
+            if d is None and os.path.exists(CONFIG_FILE):
+                with open(CONFIG_FILE) as f: _, d = shared.update(CONFIG_KEY, json.load(f))
+            self._apply(d or {}, initial=True)
+        except Exception as e: print(f"[AI] Config load error: {e}")
+    def _apply(self, d, initial=False):
+        """应用共享配置，返回 api_key 有变化的提供商；启动时空 key 不覆盖环境变量（与以前的配置文件一致）"""
+        for k in CONFIG_FIELDS: setattr(self, k, d.get(k, getattr(self, k)))
+        changed = set()
+        for k, v in d.get("api_keys", {}).items():
+            if k in self.api_keys and (v or not initial) and v != self.api_keys[k]:
+                self.api_keys[k] = v
+                changed.add(k)
+        return changed
+    def _reload(self, d):
+        changed = self._apply(d)
+        if changed:
+            for cb in self.on_change: cb(changed)
+    def _save(self, patch):
+        # 合并后的配置可能还带着其他 worker 刚改、本 worker 还没同步到的 key
+        try: self._reload(shared.update(CONFIG_KEY, patch)[1])
+        except Exception as e: print(f"[AI] Config save error: {e}")
+    def to_dict(self): return {"preferred_provider": self.preferred_provider, "chunk_size": self.chunk_size, "max_parallel": self.max_parallel, "spread_providers": self.spread_providers, "api_keys_status": {k: bool(v) for k,v in self.api_keys.items()}}
     def update(self, d):
-        if "preferred_provider" in d: self.preferred_provider = d["preferred_provider"]
-        self._save()
+        patch = {}
+        if "preferred_provider" in d: patch["preferred_provider"] = d["preferred_provider"]
+        if d.get("chunk_size"): patch["chunk_size"] = max(1, int(d["chunk_size"]))
+        if d.get("max_parallel"): patch["max_parallel"] = max(1, int(d["max_parallel"]))
+        if "spread_providers" in d: patch["spread_providers"] = bool(d["spread_providers"])
+        if patch: self._save(patch)
     def update_api_key(self, p, k):
-        if p in self.api_keys: self.api_keys[p] = k; self._save(); return True
+        if p in self.api_keys: self._save({"api_keys": {p: k}}); return True
         return False
 
 ai_config = AIConfig()
@@ -125,108 +177,397 @@ ai_config = AIConfig()
 class AIService:
     def __init__(self, cfg):
         self.cfg = cfg
-        self.minimax = self.zhipu = self.deepseek = None
-        self.usage = []
-        self._init()
-    def _init(self):
-        k = self.cfg.api_keys
-        if k.get("minimax"): self.minimax = Anthropic(api_key=k["minimax"], base_url="https://api.minimaxi.com/anthropic")
-        if k.get("zhipu"): self.zhipu = OpenAI(api_key=k["zhipu"], base_url="https://open.bigmodel.cn/api/paas/v4/")
-        if k.get("deepseek"): self.deepseek = OpenAI(api_key=k["deepseek"], base_url="https://api.deepseek.com/v1")
-    def reinit_client(self, p): self._init()
+        self.clients = {}    # provider -> SDK 客户端，第一次用到时创建
+        self.sdk_loads = {}  # 已导入的 SDK 模块 -> 导入耗时（毫秒）
+        self._preloader = None
+        self.metrics = ProviderMetrics()  # 按 提供商/模型 的定长聚合，不保留逐次记录
+        self.cache = GenerationCache(PROMPT_VERSION)
+        self.fragments = FragmentStore(PROMPT_VERSION)
+        self.chain = FailoverChain()
+        self.completeness = CompletenessStats()
+        self.pools = ConnectionPools()  # 每个提供商一个共享连接池，重建 SDK 客户端时连接不丢
+        # 多 worker：其他 worker 改了 API Key 只重建对应客户端；清空缓存时各自丢掉内存层
+        cfg.on_change.append(lambda changed: [self.reinit_client(p) for p in changed])
+        shared.watch("cache", lambda _: self.cache.mem.clear())
+        shared.register("llm", self.metrics.counters)
+    async def _client(self, p):
+        """取提供商的 SDK 客户端；第一次用到时才导入 SDK（在线程里导入，不阻塞事件循环）并创建
+
+        异步客户端：进行中的 LLM 调用只占用协程，不占线程池
+        """
+        c = self.clients.get(p)
+        if c is not None: return c
+        k = self.cfg.api_keys.get(p)
+        if not k: raise ValueError(f"Provider unavailable: {p}")
+        mod, cls = CLIENT_TYPES[p]
+        if mod not in self.sdk_loads:
+            t = time.perf_counter()
+            await asyncio.to_thread(importlib.import_module, mod)
+            self.sdk_loads.setdefault(mod, round((time.perf_counter() - t) * 1000, 1))
+            print(f"[AI] Loaded {mod} SDK in {self.sdk_loads[mod]} ms")
+        c = self.clients.get(p)  # 导入期间可能已被其他请求创建
+        if c is None:
+            c = self.clients[p] = getattr(importlib.import_module(mod), cls)(api_key=k, base_url=BASE_URLS[p], http_client=self.pools.client(p, BASE_URLS[p]))
+        return c
+    async def preload(self, providers=None, delay=0):
+        """显式预热：导入 SDK 并创建客户端；delay 秒后再开始，不和启动过程抢 CPU"""
+        if delay: await asyncio.sleep(delay)
+        for p in providers or self.get_available_providers():
+            try: await self._client(p)
+            except Exception as e: print(f"[AI] Preload {p} failed: {e}")
+    async def start_http(self):
+        """启动时丢掉旧 SDK 客户端（连接池关闭后再启动会新建）；按配置预先导入 SDK、预热连接"""
+        self.clients.clear()
+        if HTTP_WARM_ON_START: await self.preload()
+        elif AI_PRELOAD: self._preloader = asyncio.create_task(self.preload(delay=1))
+        await self.pools.start(self.get_available_providers())
+    async def close_http(self):
+        if self._preloader is not None: self._preloader.cancel()
+        await self.pools.close()
+    def reinit_client(self, p):
+        """只重建这一个提供商的客户端（下次使用时创建），其他提供商和已建立的连接都不受影响"""
+        if p not in MODELS: return
+        self.clients.pop(p, None)
+        if not self.cfg.api_keys.get(p): self.pools.drop(p)
     def get_available_providers(self):
-        r = []
-        if self.minimax: r.append("minimax")
-        if self.zhipu: r.append("zhipu")
-        if self.deepseek: r.append("deepseek")
-        return r
-    def _record(self, p, m, i, o):
+        return [p for p in MODELS if self.cfg.api_keys.get(p)]
+    def sdk_stats(self):
+        return {"preload": AI_PRELOAD, "loaded_ms": dict(self.sdk_loads), "clients": sorted(self.clients)}
+    def _record(self, p, m, i, o, cached=0):
         pr = PRICING.get(m, {"input":0.001,"output":0.002})
-        self.usage.append(TokenUsage(p, m, i, o, (i*pr["input"]+o*pr["output"])/1000, time.time()))
-    def get_usage_stats(self): return {"calls": len(self.usage), "cost": sum(u.cost for u in self.usage)}
-
-    def generate_scene(self, words, provider="auto"):
-        if provider == "auto":
-            avail = self.get_available_providers()
-            if not avail: raise ValueError("No API Key")
-            provider = avail[0]
-        print(f"[AI] Words: {len(words)}, Provider: {provider}")
-        
+        cost = (i*pr["input"] + cached*pr.get("cached_input", pr["input"]*0.1) + o*pr["output"])/1000
+        self.metrics.add_usage(TokenUsage(p, m, i, o, cost, time.time(), cached))
+    def _record_anthropic(self, p, m, u):
+        # input_tokens 不含缓存读写；缓存写入按未命中计
+        self._record(p, m, u.input_tokens + (getattr(u, "cache_creation_input_tokens", 0) or 0), u.output_tokens, getattr(u, "cache_read_input_tokens", 0) or 0)
+    def _record_openai(self, p, m, u):
+        # prompt_tokens 含命中部分：DeepSeek 用 prompt_cache_hit_tokens，OpenAI 兼容接口用 prompt_tokens_details.cached_tokens
+        details = getattr(u, "prompt_tokens_details", None)
+        cached = getattr(u, "prompt_cache_hit_tokens", None) or (getattr(details, "cached_tokens", 0) if details else 0) or 0
+        self._record(p, m, u.prompt_tokens - cached, u.completion_tokens, cached)
+    def usage_metrics(self):
+        """所有 worker 合计的用量（最近调用列表只含本 worker）"""
+        return ProviderMetrics.from_counters(shared.merged("llm", self.metrics.counters()), self.metrics.recent)
+    def get_usage_stats(self): return self.usage_metrics().stats()
+
+    def _providers(self, provider):
+        """本次请求的故障转移顺序：指定的提供商优先，其余可用提供商依次兜底"""
+        avail = self.get_available_providers()
+        if not avail: raise ValueError("No API Key")
+        first = [provider] if provider in avail else []
+        return first + [p for p in avail if p not in first]
+
+    def _order(self, providers, i):
+        """第 i 块的提供商顺序；spread_providers 时各块轮换首选，把负载分散到所有可用提供商"""
+        if not self.cfg.spread_providers: return providers
+        k = i % len(providers)
+        return providers[k:] + providers[:k]
+
+    def _chunks(self, words):
+        """按 chunk_size 均匀切分（600 词 / 60 → 10 块各 60 词，而不是留一个很小的尾块）"""
+        n = max(1, math.ceil(len(words) / max(1, self.cfg.chunk_size)))
+        size = max(1, math.ceil(len(words) / n))
+        return [words[i:i+size] for i in range(0, len(words), size)]
+
+    def _prompt(self, words):
+        """可变部分：紧凑单词表，每行 word|pos|meaning，去掉空字段"""
+        wt = "\n".join("|".join([w['word'], w.get('pos') or '', w.get('meaning') or '']).rstrip('|') for w in words)
+        return PROMPT_WORDS.format(word_count=len(words), words=wt)
+
+    async def generate_scene(self, words, provider="auto"):
+        providers = self._providers(provider)
         wd = {w['word'].lower(): w for w in words}
-        wt = "\n".join([f"- {w['word']}: {w.get('pos','')} {w.get('meaning','')}" for w in words])
-        prompt = PROMPT.format(word_count=len(words), scene_list=SCENE_LIST, words=wt)
-        print(f"[AI] Prompt: {len(prompt)} chars")
-        
-        raw = self._call(prompt, provider)
-        if not raw: raise ValueError("AI failed")
-        
+        key = self.cache.key(words, provider)
+        cached = await self.cache.get(key)
+        if cached is not None:
+            print(f"[AI] Cache hit: {len(words)} words")
+            return {"scenes": self._build(cached, wd), "words": word_table(wd), "cached": True}
+
+        # 先用片段库拼出能覆盖的部分，只把剩下的新单词发给 LLM
+        reused, covered = await self.fragments.assemble(words)
+        todo = [w for w in words if w['word'].lower() not in covered]
+        reuse = self.fragments.report(len(wd), len(covered))
+        print(f"[AI] Fragment reuse: {len(covered)}/{len(wd)} words from store, {len(todo)} to LLM")
+
+        results = await self._generate_chunks(todo, providers) if todo else []
+        raws = [r for r, _ in results]
+        missing = [w['word'] for _, m in results for w in m]
+        await self.fragments.save({"scenes": [rs for r in raws for rs in r.get('scenes', [])]}, todo)
+
+        raw = self._merge([reused] + raws)
+        if not missing: await self.cache.put(key, words, raw)  # 不完整的结果不缓存，下次重新生成
         scenes = self._build(raw, wd)
         print(f"[AI] Scenes: {len(scenes)}, Words: {sum(len(s.get('words_used',[])) for s in scenes)}/{len(words)}")
+        result = {"scenes": scenes, "words": word_table(wd), "cached": False, "reuse": reuse}
+        if missing: result["missing"] = missing
+        return result
+
+    async def _generate_chunks(self, words, providers):
+        chunks = self._chunks(words)
+        print(f"[AI] Words: {len(words)}, Chunks: {len(chunks)}, Providers: {providers}")
+        sem = asyncio.Semaphore(max(1, self.cfg.max_parallel))
+        async def run(i, chunk):
+            async with sem:
+                order = self._order(providers, i)
+                prompt = self._prompt(chunk)
+                print(f"[AI] Chunk {i+1}/{len(chunks)}: {len(chunk)} words, {order}, prompt {len(prompt)} chars")
+                raw = await self._call(prompt, order)
+                if not raw: raise ValueError("AI failed")
+                cov = Coverage(chunk)
+                raw, salvaged = cov.check(raw), raw.get("salvaged", False)
+                return await self._complete(cov, raw, order, salvaged)
+        tasks = [asyncio.create_task(run(i, c)) for i, c in enumerate(chunks)]
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        finally:
+            # 一块失败整个请求就失败了（请求被取消时同理），其余块立即取消，不再占用提供商额度和并发名额
+            for t in tasks: t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        failed = next((t for t in tasks if t in done and not t.cancelled() and t.exception()), None)
+        if failed: raise failed.exception()
+        return [t.result() for t in tasks]
+
+    async def _complete(self, cov, raw, order, salvaged=False):
+        """漏掉的单词单独发一次小请求补齐，而不是整块重新生成；返回 (结果, 仍缺的单词)"""
+        missing = cov.missing()
+        initially = len(missing)
+        for _ in range(FOLLOWUP_ROUNDS):
+            if not missing: break
+            print(f"[AI] ⚠️ 漏掉 {len(missing)}/{len(cov.wd)} 个单词，补充生成: {', '.join(w['word'] for w in missing[:10])}")
+            self.completeness.followups += 1
+            extra = await self._call(self._prompt(missing), order)
+            if not extra: break
+            raw = {"scenes": raw["scenes"] + cov.check(extra)["scenes"]}
+            missing = cov.missing()
+        self.completeness.record(cov, initially, salvaged)
+        if missing: print(f"[AI] ⚠️ 仍有 {len(missing)} 个单词未覆盖")
+        return raw, missing
+
+    def _merge(self, raws):
+        """合并各块结果；块之间重复的 scene_id 改派到未使用且关键词最相关的场景"""
+        used, scenes = set(), []
+        for raw in raws:
+            for rs in raw.get('scenes', []):
+                sid = rs.get('scene_id', 1)
+                if sid not in SCENES or sid in used: sid = self._free_scene(rs, used, sid)
+                used.add(sid)
+                scenes.append({**rs, "scene_id": sid})
         return {"scenes": scenes}
 
-    def _build(self, raw, wd):
+    def _free_scene(self, rs, used, fallback):
+        free = [k for k in SCENES if k not in used]
+        if not free: return fallback if fallback in SCENES else 1
+        text = " ".join(rs.get('words_in_scene', []) + [p.get('en', '') for p in rs.get('paragraphs', [])]).lower()
+        return max(free, key=lambda k: (sum(kw.lower() in text for kw in SCENES[k]["kw"]), -k))
+
+    async def generate_scene_stream(self, words, provider="auto"):
+        """流式生成：各块并发读取模型的 token 流，场景对象一闭合就构建并推送
+
+        依次产出 {"type": "meta"} / {"type": "scene"}* / {"type": "error"}* / {"type": "done"}；
+        场景为紧凑格式，单词表只在 meta 中出现一次
+        """
+        providers = self._providers(provider)
+        wd = {w['word'].lower(): w for w in words}
+        key = self.cache.key(words, provider)
+        cached = await self.cache.get(key)
+        if cached is not None:
+            print(f"[AI] Stream cache hit: {len(words)} words")
+            yield {"type": "meta", "word_count": len(words), "words": word_table(wd), "chunks": 0, "cached": True}
+            for scene in self._build(cached, wd): yield {"type": "scene", "scene": scene}
+            yield {"type": "done", "scenes": len(cached.get('scenes', [])), "word_count": len(words)}
+            return
+
+        reused, covered = await self.fragments.assemble(words)
+        todo = [w for w in words if w['word'].lower() not in covered]
+        reuse = self.fragments.report(len(wd), len(covered))
+        chunks = self._chunks(todo) if todo else []
+        print(f"[AI] Stream words: {len(words)}, From store: {len(covered)}, Chunks: {len(chunks)}, Providers: {providers}")
+        yield {"type": "meta", "word_count": len(words), "words": word_table(wd), "chunks": len(chunks), "cached": False, "reuse": reuse}
+
+        used, sent, used_words = set(), 0, 0
+        raw, llm_raw, failed, missing = [], [], False, []
+        def emit(item):
+            nonlocal sent, used_words
+            sid = item.get('scene_id', 1)
+            if sid not in SCENES or sid in used: sid = self._free_scene(item, used, sid)
+            used.add(sid)
+            raw.append({**item, "scene_id": sid})
+            scene = self._build({"scenes": [raw[-1]]}, wd, start=sent)[0]
+            sent += 1; used_words += len(scene["words_used"])
+            return {"type": "scene", "scene": scene}
+
+        # 片段库拼出的场景立即推送
+        for rs in reused.get('scenes', []): yield emit(rs)
+
+        queue = asyncio.Queue()
+        sem = asyncio.Semaphore(max(1, self.cfg.max_parallel))
+        async def run(i, chunk):
+            cov, order = Coverage(chunk), self._order(providers, i)
+            try:
+                async with sem:
+                    try:
+                        async for rs in self._stream_scenes(self._prompt(chunk), order):
+                            rs = cov.add(rs)
+                            if rs is not None: await queue.put(("scene", rs))
+                    except Exception as e:
+                        if not cov.covered: raise
+                        print(f"[AI] Stream chunk {i+1} broke off after {len(cov.covered)}/{len(chunk)} words: {e}")
+                    # 流中断或漏词：只把缺的单词补充生成
+                    extra, still = await self._complete(cov, {"scenes": []}, order)
+                    for rs in extra["scenes"]: await queue.put(("scene", rs))
+                    if still: await queue.put(("missing", still))
+            except Exception as e:
+                print(f"[AI] Stream chunk {i+1} error: {e}")
+                await queue.put(("error", str(e)))
+            finally:
+                await queue.put(("end", None))
+        tasks = [asyncio.create_task(run(i, c)) for i, c in enumerate(chunks)]
+
+        pending = len(tasks)
+        try:
+            while pending:
+                kind, item = await queue.get()
+                if kind == "end": pending -= 1; continue
+                if kind == "error":
+                    failed = True
+                    yield {"type": "error", "message": item}; continue
+                if kind == "missing":
+                    missing += [w['word'] for w in item]; continue
+                llm_raw.append(item)
+                yield emit(item)
+        finally:
+            for t in tasks: t.cancel()
+        print(f"[AI] Stream scenes: {sent}, Words: {used_words}/{len(words)}")
+        await self.fragments.save({"scenes": llm_raw}, todo)
+        if not failed and not missing: await self.cache.put(key, words, {"scenes": raw})
+        done = {"type": "done", "scenes": sent, "word_count": len(words), "reuse": reuse}
+        if missing: done["missing"] = missing
+        yield done
+
+    async def _stream_scenes(self, prompt, providers):
+        """把提供商的 token 流喂给增量解析器；流中一个场景都没解析出来时整体回退到 _json
+
+        推送第一个场景之前出错可以切换到下一个提供商；之后出错只能上报。
+        """
+        errors = []
+        for p in self.chain.available(providers):
+            b, sent, t0 = self.chain.breaker(p), 0, time.monotonic()
+            probe = b.state != "closed"
+            if not b.allow(): continue  # 试探名额已被并发请求占用
+            parser, text = SceneStreamParser(), []
+            try:
+                async for delta in self._stream(prompt, p):
+                    text.append(delta)
+                    for rs in parser.feed(delta): sent += 1; yield rs
+                if not parser.count:
+                    for rs in self._json("".join(text)).get('scenes', []): sent += 1; yield rs
+                b.success()
+                self.metrics.observe(p, MODELS[p], time.monotonic() - t0)
+                return
+            except Exception as e:
+                if transient(e): b.failure()
+                self.metrics.observe(p, MODELS.get(p, p), time.monotonic() - t0, error=True)
+                print(f"[AI] Stream {p} failed: {e}")
+                if sent: raise
+                errors.append((p, str(e)))
+            finally:
+                if probe: b.release()  # 消费方提前关闭流或非 transient 错误
+        raise AllProvidersFailed(errors)
+
+    async def _stream(self, prompt, provider):
+        if provider not in self.get_available_providers(): raise ValueError(f"Provider unavailable: {provider}")
+        client = await self._client(provider)
+        if provider == "minimax":
+            m = MODELS["minimax"]
+            async with client.messages.stream(model=m, max_tokens=8192, system=SYSTEM_CACHED, messages=[{"role":"user","content":prompt}]) as st:
+                async for t in st.text_stream: yield t
+                r = await st.get_final_message()
+            self._record_anthropic("minimax", m, r.usage)
+        elif provider == "zhipu":
+            async for t in self._stream_openai(client, "zhipu", MODELS["zhipu"], prompt, stream_options={"include_usage": True}): yield t
+        else:
+            async for t in self._stream_openai(client, "deepseek", MODELS["deepseek"], prompt, stream_options={"include_usage": True}): yield t
+
+    async def _stream_openai(self, client, p, m, prompt, **extra):
+        r = await client.chat.completions.create(model=m, temperature=0.7, stream=True, messages=[{"role":"system","content":PROMPT_PREFIX},{"role":"user","content":prompt}], **extra)
+        usage = None
+        async for ch in r:
+            if getattr(ch, "usage", None): usage = ch.usage
+            if ch.choices and ch.choices[0].delta.content: yield ch.choices[0].delta.content
+        if usage: self._record_openai(p, m, usage)
+
+    def _build(self, raw, wd, start=0):
+        """原始场景 -> 紧凑场景（纯文本 + 单词标注，单词信息在响应级的 words 表里）"""
         result = []
-        for i, rs in enumerate(raw.get('scenes', [])):
+        hl = get_highlighter(wd)
+        index = {k: i for i, k in enumerate(wd)}
+        for i, rs in enumerate(raw.get('scenes', []), start):
             sid = rs.get('scene_id', 1)
             info = SCENES.get(sid, SCENES[1])
             ws = rs.get('words_in_scene', [])
-            zh, en, tr = [], [], []
-            for p in rs.get('paragraphs', []):
-                zh.append(f"<p class='mb-3'>{self._mark(p.get('zh',''), wd)}</p>")
-                en.append(f"<p class='mb-3'>{self._mark(p.get('en',''), wd)}</p>")
-                tr.append(self._mark(p.get('zh_pure',''), wd))
             result.append({
-                "id": i+1, "scene_id": sid, "icon": "fa-book", "bgImage": info["url"], "words_used": ws,
-                "zh": {"title": info["title_zh"], "anchors": "入口中央角落", "content": "".join(zh), "translationParagraphs": tr},
-                "en": {"title": info["title_en"], "anchors": "EntranceCentralCorner", "content": "".join(en)}
+                "id": i+1, "scene_id": sid, "icon": "fa-book", **assets.background(sid, info["url"]), "words_used": ws,
+                "zh": {"title": info["title_zh"], "anchors": "入口中央角落"},
+                "en": {"title": info["title_en"], "anchors": "EntranceCentralCorner"},
+                "paragraphs": [compact_paragraph(hl, p, index) for p in rs.get('paragraphs', [])]
             })
             print(f"[AI] Scene {i+1}: {info['title_en']} (id={sid}), words: {len(ws)}")
         return result
 
     def _mark(self, text, word_dict):
-        """强制高亮英文单词"""
-        if not text: return ''
-        result = re.sub(r'\[\[([^\]]+)\]\]', r'\1', text)
-        for wl, info in word_dict.items():
-            w = info['word']
-            tip = f"{w}: {info.get('pos','')} {info.get('meaning','')}".strip().replace('<','&lt;').replace('>','&gt;')
-            repl = f"<span class='word-highlight'>\\1<span class='tooltip'>{tip}</span></span>"
-            result = re.sub(r'\b(' + re.escape(w) + r')\b', repl, result, flags=re.IGNORECASE)
-        return result
+        """强制高亮英文单词（单次扫描，高亮器按词表缓存）"""
+        return get_highlighter(word_dict).mark(text)
 
-    def _call(self, prompt, provider):
+    async def _call(self, prompt, providers):
+        """沿故障转移链调用：熔断、重试退避、可选对冲都在 FailoverChain 中"""
         try:
-            if provider == "minimax" and self.minimax: return self._minimax(prompt)
-            if provider == "zhipu" and self.zhipu: return self._zhipu(prompt)
-            if provider == "deepseek" and self.deepseek: return self._deepseek(prompt)
-        except Exception as e:
-            print(f"[AI] Error: {e}")
-            import traceback; traceback.print_exc()
+            raw, p = await self.chain.call(providers, lambda p: self._call_one(prompt, p))
+            return raw
+        except AllProvidersFailed as e:
+            print(f"[AI] Error: all providers failed: {e}")
         return None
 
+    async def _call_one(self, prompt, provider):
+        """单次调用并记录耗时；每次重试、对冲都单独计入延迟和错误"""
+        fn = {"minimax": self._minimax, "zhipu": self._zhipu, "deepseek": self._deepseek}.get(provider)
+        if fn is None or not self.cfg.api_keys.get(provider): raise ValueError(f"Provider unavailable: {provider}")
+        t0 = time.monotonic()
+        try: result = await fn(prompt)
+        except asyncio.CancelledError: raise  # 对冲输家被取消，不算错误
+        except Exception:
+            self.metrics.observe(provider, MODELS[provider], time.monotonic() - t0, error=True)
+            raise
+        self.metrics.observe(provider, MODELS[provider], time.monotonic() - t0)
+        return result
+
     def _json(self, c):
+        """解析模型输出；整体不是合法 JSON（被截断、个别场景损坏）时抢救其中完整的场景，漏掉的单词之后补充生成"""
         s, e = c.find('{'), c.rfind('}')+1
         if s == -1 or e <= s: raise ValueError("No JSON")
-        try: return json.loads(c[s:e])
-        except: return json.loads(c[s:e].replace('\\"', "'"))
+        try: return loads_lenient(c[s:e])
+        except ValueError: pass
+        scenes = salvage_scenes(c[s:])
+        if not scenes: raise ValueError("Malformed JSON")
+        print(f"[AI] ⚠️ JSON 不完整，抢救出 {len(scenes)} 个场景")
+        return {"scenes": scenes, "salvaged": True}
 
-    def _minimax(self, p):
-        m = "MiniMax-Text-01"
-        r = self.minimax.messages.create(model=m, max_tokens=8192, system="Memory Palace expert. Output JSON only.", messages=[{"role":"user","content":p}])
-        self._record("minimax", m, r.usage.input_tokens, r.usage.output_tokens)
+    async def _minimax(self, p):
+        m = MODELS["minimax"]
+        r = await (await self._client("minimax")).messages.create(model=m, max_tokens=8192, system=SYSTEM_CACHED, messages=[{"role":"user","content":p}])
+        self._record_anthropic("minimax", m, r.usage)
         print(f"[AI] MiniMax: {len(r.content[0].text)} chars")
         return self._json(r.content[0].text)
 
-    def _zhipu(self, p):
-        m = "glm-4-flash"
-        r = self.zhipu.chat.completions.create(model=m, temperature=0.7, messages=[{"role":"system","content":"JSON only"},{"role":"user","content":p}])
-        self._record("zhipu", m, r.usage.prompt_tokens, r.usage.completion_tokens)
+    async def _zhipu(self, p):
+        m = MODELS["zhipu"]
+        r = await (await self._client("zhipu")).chat.completions.create(model=m, temperature=0.7, messages=[{"role":"system","content":PROMPT_PREFIX},{"role":"user","content":p}])
+        self._record_openai("zhipu", m, r.usage)
         return self._json(r.choices[0].message.content)
 
-    def _deepseek(self, p):
-        m = "deepseek-chat"
-        r = self.deepseek.chat.completions.create(model=m, temperature=0.7, messages=[{"role":"system","content":"JSON only"},{"role":"user","content":p}])
-        self._record("deepseek", m, r.usage.prompt_tokens, r.usage.completion_tokens)
+    async def _deepseek(self, p):
+        m = MODELS["deepseek"]
+        r = await (await self._client("deepseek")).chat.completions.create(model=m, temperature=0.7, messages=[{"role":"system","content":PROMPT_PREFIX},{"role":"user","content":p}])
+        self._record_openai("deepseek", m, r.usage)
         return self._json(r.choices[0].message.content)
 
 ai_service = AIService(ai_config)
@@ -1,10 +1,33 @@
-"""简单埋点和数据分析"""
+"""简单埋点和数据分析
+
+不保存事件全集：计数器增量维护，24 小时分布用按小时分桶的环形数组，
+最近事件用定长环形缓冲，内存占用与累计事件数无关。
+事件由后台线程批量写入 SQLite；计数器定期累加到共享表（shared_state），
+多个 worker 的统计合在一起，重启后也不需要回放事件。
+持久化时读取统计不查事件表，开销与事件数无关：
+- 独立用户数：写线程随事件把用户插入 analytics_users（已存在则跳过），新插入的行数作为 "users" 计数器累加；
+- 最近事件：写线程每批写完后追加到共享的定长环（shared_state 里的 analytics_recent），各 worker 同步时拿到最新内容。
+"""
+import json
+import os
+import queue
+import threading
 import time
 from dataclasses import dataclass, field
 from typing import Optional
-from collections import defaultdict
+from collections import defaultdict, deque
+
+from sqlalchemy import Integer, cast, func, insert, select
+
+from .database import engine
+from .models import AnalyticsEvent, AnalyticsUser
+from .shared_state import _insert, shared
 
-@dataclass
+RECENT_EVENTS = 50  # recent_events 保留条数
+HOURS = 24          # hourly_distribution 窗口（小时）
+RECENT_KEY = "analytics_recent"
+
+@dataclass(slots=True)
 class Event:
     name: str
     user_id: Optional[int]
@@ -12,64 +35,221 @@ class Event:
     data: dict
     timestamp: float = field(default_factory=time.time)
 
+class EventWriter:
+    """后台写线程：请求路径只做入队，攒够一批或到达间隔后在一个事务里批量插入"""
+    def __init__(self, batch_size=None, interval=None, max_pending=None):
+        self.batch_size = batch_size or int(os.getenv("ANALYTICS_BATCH_SIZE", "500"))
+        self.interval = interval or float(os.getenv("ANALYTICS_FLUSH_SECONDS", "2"))
+        self.q: queue.Queue = queue.Queue(maxsize=max_pending or int(os.getenv("ANALYTICS_MAX_PENDING", "100000")))
+        self.thread = None
+        self.written = self.dropped = self.batches = 0
+        self.new_users = 0  # 本进程插入 analytics_users 的新用户数
+        self.recent: list[Event] = []  # 共享环里的最近事件（所有 worker）
+
+    def submit(self, e: Event):
+        try:
+            self.q.put_nowait(e)
+        except queue.Full:
+            self.dropped += 1  # 写入跟不上时丢弃，不阻塞请求
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name="analytics-writer", daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        if self.thread is not None:
+            self.q.put(None)
+            self.thread.join(timeout=10)
+            self.thread = None
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch = []
+            try:
+                item = self.q.get(timeout=self.interval)
+                if item is None: stopping = True
+                else: batch.append(item)
+            except queue.Empty:
+                continue
+            deadline = time.monotonic() + self.interval
+            while not stopping and len(batch) < self.batch_size:
+                try:
+                    item = self.q.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None: stopping = True
+                else: batch.append(item)
+            if stopping:  # 退出前把队列里剩余的事件写完
+                while True:
+                    try: item = self.q.get_nowait()
+                    except queue.Empty: break
+                    if item is not None: batch.append(item)
+            self._write(batch)
+
+    def _write(self, batch):
+        if not batch: return
+        rows = [{"name": e.name, "user_id": e.user_id, "is_guest": e.is_guest,
+                 "data_json": json.dumps(e.data, ensure_ascii=False), "timestamp": e.timestamp} for e in batch]
+        users = {e.user_id: e.timestamp for e in batch if not e.is_guest and e.user_id}
+        try:
+            with engine.begin() as conn:
+                conn.execute(insert(AnalyticsEvent), rows)
+                new = conn.execute(_insert(AnalyticsUser).on_conflict_do_nothing(index_elements=["user_id"]),
+                                   [{"user_id": u, "first_seen": ts} for u, ts in users.items()]).rowcount if users else 0
+            self.written += len(rows); self.batches += 1
+            self.new_users += max(new, 0)
+        except Exception as e:
+            self.dropped += len(rows)
+            print(f"[Analytics] Write error, dropped {len(rows)} events: {e}")
+            return
+        try: self._push_recent(batch)
+        except Exception as e: print(f"[Analytics] Recent ring update failed: {e}")
+
+    def _push_recent(self, batch):
+        new = [[e.name, e.user_id, e.is_guest, e.data, e.timestamp] for e in batch[-RECENT_EVENTS:]]
+        def append(old):
+            events = (old or {}).get("events", []) + new
+            return {"events": sorted(events, key=lambda r: r[4])[-RECENT_EVENTS:]}
+        _, value = shared.update(RECENT_KEY, append)
+        self.load_recent(value)
+
+    def load_recent(self, value):
+        self.recent = [Event(*r) for r in (value or {}).get("events", [])]
+
+    def stats(self):
+        return {"pending": self.q.qsize(), "written": self.written, "batches": self.batches, "dropped": self.dropped,
+                "new_users": self.new_users}
+
 class Analytics:
-    def __init__(self):
-        self.events: list[Event] = []
+    def __init__(self, persist: Optional[bool] = None):
+        self.total_events = 0
+        self.guest_actions = 0
+        self.registered_actions = 0
+        self.unique_users: set[int] = set()  # 只在不持久化时使用；持久化时独立用户数来自 analytics_users
         self.page_views: dict[str, int] = defaultdict(int)
         self.user_actions: dict[str, int] = defaultdict(int)
-    
-    def track(self, event_name: str, user_id: Optional[int] = None, is_guest: bool = False, data: dict = None):
+        self.hour_ids = [-1] * HOURS  # 槽位对应的小时序号（时间戳 // 3600）
+        self.hour_counts = [0] * HOURS
+        self.recent: deque[Event] = deque(maxlen=RECENT_EVENTS)
+        self.writer: Optional[EventWriter] = EventWriter() if (os.getenv("ANALYTICS_PERSIST", "1") == "1" if persist is None else persist) else None
+
+    def track(self, event_name: str, user_id: Optional[int] = None, is_guest: bool = False, data: dict = None, timestamp: Optional[float] = None):
         """记录事件"""
         event = Event(
             name=event_name,
             user_id=user_id,
             is_guest=is_guest,
             data=data or {},
-            timestamp=time.time()
+            timestamp=timestamp or time.time()
         )
-        self.events.append(event)
-        self.user_actions[event_name] += 1
-    
+        self._count(event)
+        self.recent.append(event)
+        if self.writer: self.writer.submit(event)
+
+    def restore(self):
+        """加载共享的最近事件环；旧库升级：共享计数器、analytics_users 启用前的事件只在事件表里，第一次启动时各回填一次"""
+        if not self.writer: return
+        self.writer.load_recent(shared.get(RECENT_KEY)[1])
+        if shared.claim("analytics_backfill"):
+            old = Analytics(persist=False)
+            old._load_from_db()
+            if old.total_events: shared.add("analytics", old.counters())
+            print(f"[Analytics] Backfilled {old.total_events} events into shared counters")
+        if shared.claim("analytics_users_backfill"):
+            t = AnalyticsEvent
+            users = (select(t.user_id, func.min(t.timestamp)).where(t.is_guest.is_(False), t.user_id.isnot(None), t.user_id != 0)
+                     .group_by(t.user_id))
+            with engine.begin() as conn:
+                n = conn.execute(_insert(AnalyticsUser).from_select(["user_id", "first_seen"], users)
+                                 .on_conflict_do_nothing(index_elements=["user_id"])).rowcount
+            if n > 0: shared.add("analytics", {"users": n})
+            print(f"[Analytics] Backfilled {max(n, 0)} users into analytics_users")
+
+    def _load_from_db(self):
+        t = AnalyticsEvent
+        now_hour = int(time.time() // 3600)
+        hour_col = cast(t.timestamp / 3600, Integer)
+        with engine.connect() as conn:
+            for name, n in conn.execute(select(t.name, func.count()).group_by(t.name)):
+                self.user_actions[name] += n
+                self.total_events += n
+            self.guest_actions += conn.execute(select(func.count()).where(t.is_guest.is_(True))).scalar() or 0
+            self.registered_actions += conn.execute(select(func.count()).where(t.is_guest.is_(False), t.user_id.isnot(None), t.user_id != 0)).scalar() or 0
+            for hour, n in conn.execute(select(hour_col, func.count()).where(t.timestamp >= (now_hour - HOURS + 1) * 3600).group_by(hour_col)):
+                hour, slot = int(hour), int(hour) % HOURS
+                if self.hour_ids[slot] == hour: self.hour_counts[slot] += n
+                elif self.hour_ids[slot] < hour: self.hour_ids[slot], self.hour_counts[slot] = hour, n
+
+    def counters(self) -> dict:
+        """展开成可跨 worker 累加的计数；users 是本进程插入 analytics_users 的新用户数，各 worker 相加即独立用户数"""
+        out = {"total": self.total_events, "guest": self.guest_actions, "registered": self.registered_actions}
+        if self.writer: out["users"] = self.writer.new_users
+        out.update({f"action:{k}": v for k, v in list(self.user_actions.items())})
+        out.update({f"page:{k}": v for k, v in list(self.page_views.items())})
+        out.update({f"hour:{h}": n for h, n in zip(list(self.hour_ids), list(self.hour_counts)) if n})
+        return out
+
+    @staticmethod
+    def expired(key: str) -> bool:
+        """滑出窗口的小时桶；旧版本每个用户一个的 user: 键也一并清掉"""
+        return key.startswith("user:") or (key.startswith("hour:") and int(key[5:]) <= time.time() // 3600 - HOURS)
+
+    def _on_recent(self, value):
+        """其他 worker 更新了共享的最近事件环"""
+        if self.writer: self.writer.load_recent(value)
+
+    def _recent(self) -> list[Event]:
+        """本进程的最近事件，合上共享环里所有 worker 已写入的事件（都在内存里，不查库）"""
+        local = list(self.recent)
+        if not self.writer: return local
+        shared_recent = self.writer.recent
+        seen = {(e.name, e.user_id, e.timestamp) for e in shared_recent}
+        events = shared_recent + [e for e in local if (e.name, e.user_id, e.timestamp) not in seen]
+        return sorted(events, key=lambda e: e.timestamp)[-RECENT_EVENTS:]
+
+    def _count(self, e: Event):
+        self.total_events += 1
+        self.user_actions[e.name] += 1
+        if e.is_guest:
+            self.guest_actions += 1
+        elif e.user_id:
+            if not self.writer: self.unique_users.add(e.user_id)
+            self.registered_actions += 1
+        hour = int(e.timestamp // 3600)
+        slot = hour % HOURS
+        if self.hour_ids[slot] != hour:
+            if self.hour_ids[slot] > hour:  # 比槽位里的数据还旧，已滑出窗口
+                return
+            self.hour_ids[slot], self.hour_counts[slot] = hour, 0
+        self.hour_counts[slot] += 1
+
     def track_page_view(self, page: str):
         """记录页面访问"""
         self.page_views[page] += 1
-    
+
     def get_stats(self) -> dict:
-        """获取统计数据"""
-        # 用户统计
-        unique_users = set()
-        guest_count = 0
-        registered_count = 0
-        
-        for e in self.events:
-            if e.is_guest:
-                guest_count += 1
-            elif e.user_id:
-                unique_users.add(e.user_id)
-                registered_count += 1
-        
+        """获取统计数据（所有 worker 的合计）"""
+        c = shared.merged("analytics", self.counters())
+        group = lambda prefix: {k[len(prefix):]: int(v) for k, v in c.items() if k.startswith(prefix)}
         # 时间分布（最近24小时，按小时）
-        now = time.time()
-        hourly = defaultdict(int)
-        for e in self.events:
-            if now - e.timestamp < 86400:  # 24小时
-                hour = int((now - e.timestamp) / 3600)
-                hourly[f"{hour}h前"] += 1
-        
-        # 事件类型统计
-        event_types = defaultdict(int)
-        for e in self.events:
-            event_types[e.name] += 1
-        
+        now_hour = int(time.time() // 3600)
+        hourly = {}
+        for hid, n in sorted(group("hour:").items(), key=lambda x: -int(x[0])):
+            if n and 0 <= now_hour - int(hid) < HOURS:
+                hourly[f"{now_hour - int(hid)}h前"] = n
+        actions = group("action:")
+
         return {
-            "total_events": len(self.events),
-            "unique_users": len(unique_users),
-            "guest_actions": guest_count,
-            "registered_actions": registered_count,
-            "page_views": dict(self.page_views),
-            "user_actions": dict(self.user_actions),
-            "event_types": dict(event_types),
-            "hourly_distribution": dict(hourly),
+            "total_events": int(c.get("total", 0)),
+            "unique_users": int(c.get("users", 0)) if self.writer else len(self.unique_users),
+            "guest_actions": int(c.get("guest", 0)),
+            "registered_actions": int(c.get("registered", 0)),
+            "page_views": group("page:"),
+            "user_actions": actions,
+            "event_types": dict(actions),
+            "hourly_distribution": hourly,
             "recent_events": [
                 {
                     "name": e.name,
@@ -78,9 +258,11 @@ class Analytics:
                     "data": e.data,
                     "time": e.timestamp
                 }
-                for e in self.events[-50:]
+                for e in self._recent()
             ]
         }
 
 # 单例
 analytics = Analytics()
+shared.register("analytics", analytics.counters, expire=Analytics.expired)
+shared.watch(RECENT_KEY, analytics._on_recent)
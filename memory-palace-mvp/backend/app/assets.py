@@ -0,0 +1,203 @@
+"""场景背景图资源 - 一次性导入到本地，预生成多个宽度的变体，按内容哈希命名、长期缓存
+
+SCENES 里每个场景指向 1920px 的 Unsplash 原图，客户端每次看场景都从第三方下载全尺寸图片。
+这里改成：
+- 导入（离线，一次）：python -m app.assets ingest 下载（或从本地目录读取）每个场景的原图，
+  缩放并重新编码成 ASSET_WIDTHS 里的各个宽度，文件名带内容哈希，清单写到 ASSET_DIR/manifest.json；
+- 服务：/static 挂载 ASSET_DIR，文件名变了内容才会变，所以响应头是 immutable、缓存一年；
+- 场景：bgImage 换成本地的默认宽度变体，另带 bgImageSet [{"w", "h", "url"}] 供前端按视口挑选。
+  清单里没有的场景（未导入）保持原来的远程地址，导入前后接口格式不变。
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import sys
+import time
+from urllib.parse import urlsplit
+
+from starlette.staticfiles import StaticFiles
+
+ASSET_DIR = os.getenv("ASSET_DIR", "./assets")
+ASSET_BASE_URL = os.getenv("ASSET_BASE_URL", "/static").rstrip("/")  # 后端的挂载路径（开发时 Vite 同样代理 /static）；用 CDN 时改成 CDN 地址
+ASSET_WIDTHS = sorted(int(w) for w in os.getenv("ASSET_WIDTHS", "640,1024,1440,1920").split(",") if w.strip())
+ASSET_DEFAULT_WIDTH = int(os.getenv("ASSET_DEFAULT_WIDTH", "1440"))  # 不认识 bgImageSet 的旧客户端拿到的宽度
+ASSET_FORMAT = os.getenv("ASSET_FORMAT", "webp")  # webp / jpeg / avif
+ASSET_QUALITY = int(os.getenv("ASSET_QUALITY", "75"))
+MANIFEST = "manifest.json"
+FORMATS = {"webp": ("WEBP", "webp", {"method": 6}), "jpeg": ("JPEG", "jpg", {"optimize": True, "progressive": True}),
+           "avif": ("AVIF", "avif", {})}
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+
+class ImmutableStaticFiles(StaticFiles):
+    """文件名带内容哈希，命中即可永久缓存；404 等不加缓存头"""
+    async def get_response(self, path, scope):
+        response = await super().get_response(path, scope)
+        if response.status_code == 200: response.headers["Cache-Control"] = IMMUTABLE
+        return response
+
+
+class AssetStore:
+    def __init__(self, root=ASSET_DIR, base_url=ASSET_BASE_URL, default_width=ASSET_DEFAULT_WIDTH):
+        self.root, self.base_url, self.default_width = root, base_url, default_width
+        self.path = os.path.join(root, MANIFEST)
+        self.backgrounds = {}   # scene_id -> {"bgImage", "bgImageSet"}，加载清单时一次算好
+        self.mtime = None
+        self.checked = 0.0
+        self.loads = self.rewrites = 0
+
+    # ---------- 读取 ----------
+    def load(self):
+        """清单有变化（重新导入）时重新加载；每个进程最多每 5 秒检查一次"""
+        now = time.monotonic()
+        if now - self.checked < 5 and self.mtime is not None: return
+        self.checked = now
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            mtime = 0
+        if mtime == self.mtime: return
+        self.mtime, self.backgrounds = mtime, {}
+        if not mtime: return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"[Assets] Manifest unreadable: {e}")
+            return
+        for sid, entry in manifest.get("scenes", {}).items():
+            self.backgrounds[int(sid)] = self._background(entry)
+        self.loads += 1
+        print(f"[Assets] Loaded {len(self.backgrounds)} scene images from {self.path}")
+
+    def _background(self, entry):
+        variants = [{"w": w, "h": h, "url": f"{self.base_url}/{name}"} for w, h, name, _ in entry["variants"]]
+        default = [v for v in variants if v["w"] <= self.default_width] or variants[:1]
+        return {"bgImage": default[-1]["url"], "bgImageSet": variants}
+
+    def background(self, scene_id, fallback):
+        """场景背景字段；未导入的场景只有远程地址"""
+        self.load()
+        return self.backgrounds.get(scene_id) or {"bgImage": fallback}
+
+    def apply(self, scenes):
+        """已保存的场景（词表）里可能还是旧的远程地址，读取时按 scene_id 换成本地变体"""
+        self.load()
+        for s in scenes:
+            bg = self.backgrounds.get(s.get("scene_id"))
+            if bg:
+                s.update(bg)
+                self.rewrites += 1
+        return scenes
+
+    def stats(self):
+        self.load()
+        return {"dir": self.root, "scenes": len(self.backgrounds), "loads": self.loads, "rewrites": self.rewrites,
+                "base_url": self.base_url, "default_width": self.default_width}
+
+    # ---------- 导入 ----------
+    def ingest(self, sources, widths=ASSET_WIDTHS, fmt=ASSET_FORMAT, quality=ASSET_QUALITY, source_dir=None, force=False):
+        """sources: {scene_id: 原图地址}；source_dir 下的 <scene_id>.jpg/.png/.webp 优先于下载（离线导入或替换图片）"""
+        try:
+            from PIL import Image  # noqa: F401  只有导入时需要
+        except ImportError:
+            sys.exit("导入场景图需要 Pillow：pip install Pillow")
+        import httpx
+        os.makedirs(os.path.join(self.root, "scenes"), exist_ok=True)
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            manifest = {"scenes": {}}
+        done = manifest.setdefault("scenes", {})
+        report = []
+        with httpx.Client(timeout=60, follow_redirects=True) as client:
+            for sid, url in sources.items():
+                local = _local_source(source_dir, sid)
+                origin = local or url
+                if not force and done.get(str(sid), {}).get("source") == origin:
+                    continue
+                try:
+                    if local:
+                        with open(local, "rb") as f: data = f.read()
+                    else:
+                        r = client.get(_source_url(url, max(widths)))
+                        r.raise_for_status()
+                        data = r.content
+                    entry = self._write_variants(sid, data, widths, fmt, quality)
+                except Exception as e:
+                    print(f"[Assets] Scene {sid} failed: {e}")
+                    continue
+                entry["source"] = origin
+                done[str(sid)] = entry
+                report.append((sid, entry))
+                print(f"[Assets] Scene {sid}: {entry['width']}x{entry['height']} {entry['source_bytes'] // 1024}KB -> "
+                      + ", ".join(f"{w}w {b // 1024}KB" for w, _, _, b in entry["variants"]))
+        manifest.update({"format": fmt, "quality": quality, "widths": widths})
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, self.path)  # 正在服务的进程不会读到写了一半的清单
+        return report
+
+    def _write_variants(self, sid, data, widths, fmt, quality):
+        from PIL import Image, ImageOps
+        pil_format, ext, options = FORMATS[fmt]
+        im = ImageOps.exif_transpose(Image.open(io.BytesIO(data))).convert("RGB")
+        variants = []
+        for w in sorted({min(w, im.width) for w in widths}):  # 不放大：原图不够宽时最大变体就是原图宽度
+            h = round(im.height * w / im.width)
+            v = im if w == im.width else im.resize((w, h), Image.LANCZOS)
+            buf = io.BytesIO()
+            v.save(buf, pil_format, quality=quality, **options)
+            body = buf.getvalue()
+            name = f"scenes/{sid}-{w}.{hashlib.sha256(body).hexdigest()[:12]}.{ext}"
+            path = os.path.join(self.root, name)
+            if not os.path.exists(path):
+                with open(path + ".tmp", "wb") as f: f.write(body)
+                os.replace(path + ".tmp", path)
+            variants.append([w, h, name, len(body)])
+        return {"width": im.width, "height": im.height, "source_bytes": len(data), "variants": variants}
+
+
+def _local_source(source_dir, sid):
+    if not source_dir: return None
+    for ext in ("jpg", "jpeg", "png", "webp"):
+        path = os.path.join(source_dir, f"{sid}.{ext}")
+        if os.path.exists(path): return path
+    return None
+
+
+def _source_url(url, width):
+    """Unsplash 按参数出图：要一张不小于最大变体、质量更高的原图再自己压缩"""
+    if urlsplit(url).hostname != "images.unsplash.com": return url
+    import httpx
+    return str(httpx.URL(url).copy_merge_params({"w": str(width), "q": "90"}))
+
+
+assets = AssetStore()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="场景背景图导入")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    ing = sub.add_parser("ingest", help="下载/读取原图并生成各宽度变体")
+    ing.add_argument("--scenes", help="只导入这些 scene_id，逗号分隔")
+    ing.add_argument("--source-dir", help="本地原图目录，文件名 <scene_id>.jpg/.png/.webp")
+    ing.add_argument("--force", action="store_true", help="原图没变也重新生成")
+    ing.add_argument("--format", default=ASSET_FORMAT, choices=sorted(FORMATS))
+    ing.add_argument("--quality", type=int, default=ASSET_QUALITY)
+    args = ap.parse_args()
+
+    from .ai_service import SCENES
+    only = {int(s) for s in args.scenes.split(",")} if args.scenes else None
+    sources = {sid: info["url"] for sid, info in SCENES.items() if only is None or sid in only}
+    report = assets.ingest(sources, fmt=args.format, quality=args.quality, source_dir=args.source_dir, force=args.force)
+    src = sum(e["source_bytes"] for _, e in report)
+    print(f"[Assets] {len(report)} scenes ingested into {assets.root}" + (f", source {src // 1024}KB" if report else ""))
+
+
+if __name__ == "__main__":
+    main()
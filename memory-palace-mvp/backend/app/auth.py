@@ -1,10 +1,23 @@
-"""简单JWT认证"""
+"""简单JWT认证
+
+bcrypt 放在独立的有界线程池里执行，登录/注册高峰不会占满处理其他请求的线程；
+token -> 用户 的解析结果放在 TTL 缓存里，已认证请求不再每次查库，用户记录变更时按用户失效。
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
 import bcrypt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from pydantic import BaseModel, EmailStr
 
@@ -16,6 +29,11 @@ SECRET_KEY = "your-secret-key-change-in-production"  # 生产环境要改
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 7天
 
+AUTH_HASH_WORKERS = int(os.getenv("AUTH_HASH_WORKERS", "2"))     # bcrypt 线程数
+AUTH_HASH_QUEUE = int(os.getenv("AUTH_HASH_QUEUE", "64"))        # 最多同时排队的 bcrypt 任务，超出返回 503
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "60"))        # token 解析结果缓存秒数（0 关闭）
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
 # Pydantic 模型
@@ -34,6 +52,13 @@ class Token(BaseModel):
     access_token: str
     token_type: str
 
+@dataclass(frozen=True, slots=True)
+class AuthUser:
+    """缓存里的用户快照（与 ORM 会话无关，可跨请求共享）"""
+    id: int
+    email: str
+    created_at: Optional[datetime] = None
+
 # 工具函数
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return bcrypt.checkpw(
@@ -47,30 +72,146 @@ def get_password_hash(password: str) -> str:
         bcrypt.gensalt()
     ).decode('utf-8')
 
+# ---------- bcrypt 线程池 ----------
+class PasswordHasher:
+    """bcrypt 专用的有界线程池：线程数固定，排队数有上限，超出直接拒绝而不是无限堆积"""
+    def __init__(self, workers=AUTH_HASH_WORKERS, max_pending=AUTH_HASH_QUEUE):
+        self.workers, self.max_pending = workers, max_pending
+        self.pool = None
+        self.pending = self.hashed = self.rejected = 0
+        self.busy_seconds = 0.0
+
+    async def _run(self, fn, *args):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise HTTPException(status_code=503, detail="登录请求过多，请稍后再试", headers={"Retry-After": "1"})
+        if self.pool is None: self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        self.pending += 1
+        t = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.pool, fn, *args)
+        finally:
+            self.pending -= 1
+            self.hashed += 1
+            self.busy_seconds += time.perf_counter() - t
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(verify_password, plain_password, hashed_password)
+
+    async def hash(self, password: str) -> str:
+        return await self._run(get_password_hash, password)
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+
+    def stats(self):
+        return {"workers": self.workers, "max_pending": self.max_pending, "pending": self.pending, "hashed": self.hashed,
+                "rejected": self.rejected, "avg_ms": round(self.busy_seconds / self.hashed * 1000, 1) if self.hashed else 0}
+
+
+password_hasher = PasswordHasher()
+
+# ---------- token 缓存 ----------
+class TokenCache:
+    """token -> AuthUser 的 LRU + TTL 缓存；条目不会活过 token 自身的过期时间"""
+    def __init__(self, ttl=AUTH_CACHE_TTL, size=AUTH_CACHE_SIZE):
+        self.ttl, self.size = ttl, size
+        self.entries = OrderedDict()   # token -> (过期时间, AuthUser)
+        self.by_user = {}              # user_id -> {token}
+        self.lock = threading.Lock()
+        self.hits = self.misses = self.invalidations = 0
+
+    def get(self, token):
+        if self.ttl <= 0: return None
+        with self.lock:
+            e = self.entries.get(token)
+            if e is None or e[0] < time.time():
+                if e is not None: self._drop(token)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(token)
+            self.hits += 1
+            return e[1]
+
+    def put(self, token, user, exp=None):
+        if self.ttl <= 0: return
+        expires = time.time() + self.ttl
+        if exp: expires = min(expires, exp)
+        with self.lock:
+            self._drop(token)
+            self.entries[token] = (expires, user)
+            self.by_user.setdefault(user.id, set()).add(token)
+            while len(self.entries) > self.size: self._drop(next(iter(self.entries)))
+
+    def _drop(self, token):
+        e = self.entries.pop(token, None)
+        if e is None: return
+        tokens = self.by_user.get(e[1].id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens: del self.by_user[e[1].id]
+
+    def invalidate_user(self, user_id):
+        with self.lock:
+            for token in list(self.by_user.get(user_id, ())): self._drop(token)
+            self.invalidations += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.by_user.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {"ttl": self.ttl, "size": len(self.entries), "max_size": self.size, "hits": self.hits, "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 3) if total else 0, "invalidations": self.invalidations}
+
+
+token_cache = TokenCache()
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_cached_user(mapper, connection, target):
+    """用户记录被修改或删除时，该用户的全部缓存 token 立即失效"""
+    token_cache.invalidate_user(target.id)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=15))
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
+def resolve_token(token: str, db: Session) -> Optional[AuthUser]:
+    """token -> 用户；命中缓存时不查库，token 无效或用户不存在返回 None"""
+    user = token_cache.get(token)
+    if user is not None:
+        return user
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    email: str = payload.get("sub")
+    if email is None:
+        return None
+    row = db.query(User.id, User.email, User.created_at).filter(User.email == email).first()
+    if row is None:
+        return None
+    user = AuthUser(row.id, row.email, row.created_at)
+    token_cache.put(token, user, payload.get("exp"))
+    return user
+
 def get_current_user(
     token: str = Depends(oauth2_scheme),
     db: Session = Depends(get_db)
-) -> User:
+) -> AuthUser:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="无效的认证凭据",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise credentials_exception
-    except JWTError:
-        raise credentials_exception
-    
-    user = db.query(User).filter(User.email == email).first()
+    user = resolve_token(token, db)
     if user is None:
         raise credentials_exception
     return user
@@ -78,38 +219,46 @@ def get_current_user(
 def get_current_user_optional(
     token: str = Depends(OAuth2PasswordBearer(tokenUrl="auth/login", auto_error=False)),
     db: Session = Depends(get_db)
-) -> Optional[User]:
+) -> Optional[AuthUser]:
     """可选的用户认证，用于支持游客模式"""
     if not token:
         return None
+    return resolve_token(token, db)
+
+# 注册 / 登录：数据库读写放到线程里（SQLite 写锁最多等 30 秒，不能卡住事件循环），只在事件循环里等 bcrypt
+def _email_taken(db: Session, email: str) -> bool:
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            return None
-        user = db.query(User).filter(User.email == email).first()
-        return user
-    except JWTError:
+        return db.query(User.id).filter(User.email == email).first() is not None
+    finally:
+        db.rollback()  # 计算 bcrypt 期间不占用数据库连接
+
+def _insert_user(db: Session, email: str, hashed: str) -> Optional[AuthUser]:
+    db_user = User(email=email, hashed_password=hashed)
+    db.add(db_user)
+    try:
+        db.commit()
+    except IntegrityError:  # 同一邮箱的并发注册
+        db.rollback()
         return None
+    return AuthUser(db_user.id, db_user.email, db_user.created_at)
+
+def _load_credentials(db: Session, email: str):
+    try:
+        return db.query(User.id, User.email, User.created_at, User.hashed_password).filter(User.email == email).first()
+    finally:
+        db.rollback()
 
-# 注册
-def create_user(db: Session, user: UserCreate) -> User:
-    # 检查邮箱是否已存在
-    if db.query(User).filter(User.email == user.email).first():
+async def create_user(db: Session, user: UserCreate) -> AuthUser:
+    if await asyncio.to_thread(_email_taken, db, user.email):
         raise HTTPException(status_code=400, detail="邮箱已被注册")
-    
-    db_user = User(
-        email=user.email,
-        hashed_password=get_password_hash(user.password)
-    )
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
-    return db_user
-
-# 登录
-def authenticate_user(db: Session, email: str, password: str) -> Optional[User]:
-    user = db.query(User).filter(User.email == email).first()
-    if not user or not verify_password(password, user.hashed_password):
+    hashed = await password_hasher.hash(user.password)
+    created = await asyncio.to_thread(_insert_user, db, user.email, hashed)
+    if created is None:
+        raise HTTPException(status_code=400, detail="邮箱已被注册")
+    return created
+
+async def authenticate_user(db: Session, email: str, password: str) -> Optional[AuthUser]:
+    row = await asyncio.to_thread(_load_credentials, db, email)
+    if not row or not await password_hasher.verify(password, row.hashed_password):
         return None
-    return user
+    return AuthUser(row.id, row.email, row.created_at)
@@ -0,0 +1,139 @@
+"""生成结果缓存 - 内存 LRU + SQLite 持久层（复用 WordList/Scene 表）"""
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from .database import SessionLocal
+from .models import WordList, Scene
+
+
+def normalize_words(words):
+    """词表规范化：小写去重、去首尾空白、按单词排序，顺序不同的同一词表命中同一条缓存"""
+    seen = {}
+    for w in words:
+        word = (w.get('word') or '').strip()
+        if word and word.lower() not in seen:
+            seen[word.lower()] = [word.lower(), (w.get('pos') or '').strip(), (w.get('meaning') or '').strip()]
+    return [seen[k] for k in sorted(seen)]
+
+
+class GenerationCache:
+    """key = sha256(规范化词表 + 词性/释义 + 提供商 + prompt 版本)，value = 模型原始输出 {"scenes": [...]}
+
+    存原始输出而不是渲染好的 HTML，命中后重新 _build，渲染逻辑变化不需要清缓存。
+    """
+    def __init__(self, version, max_items=None, ttl=None):
+        self.version = version
+        self.max_items = max_items or int(os.getenv("CACHE_MAX_ITEMS", "256"))
+        self.ttl = ttl or int(os.getenv("CACHE_TTL", str(7 * 86400)))
+        self.mem = OrderedDict()  # key -> (expires_at, raw)
+        self.hits_memory = self.hits_db = self.misses = self.writes = 0
+
+    def key(self, words, provider):
+        payload = json.dumps({"v": self.version, "p": provider, "w": normalize_words(words)}, ensure_ascii=False, separators=(',', ':'))
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    # ---------- 内存层 ----------
+    def _mem_get(self, key):
+        hit = self.mem.get(key)
+        if hit is None: return None
+        if hit[0] < time.time():
+            del self.mem[key]
+            return None
+        self.mem.move_to_end(key)
+        return hit[1]
+
+    def _mem_put(self, key, raw, expires_at=None):
+        self.mem[key] = (expires_at or time.time() + self.ttl, raw)
+        self.mem.move_to_end(key)
+        while len(self.mem) > self.max_items: self.mem.popitem(last=False)
+
+    # ---------- 持久层 ----------
+    def _db_get(self, key):
+        db = SessionLocal()
+        try:
+            wl = db.query(WordList).filter(WordList.cache_key == key, WordList.prompt_version == self.version).first()
+            if wl is None: return None
+            expires_at = wl.created_at + timedelta(seconds=self.ttl)
+            if expires_at < datetime.utcnow():
+                self._db_delete(db, [wl.id]); db.commit()
+                return None
+            scenes = db.query(Scene.scene_data_json).filter(Scene.word_list_id == wl.id).order_by(Scene.scene_order).all()
+            remaining = (expires_at - datetime.utcnow()).total_seconds()
+            return {"scenes": [json.loads(s.scene_data_json) for s in scenes]}, time.time() + remaining
+        finally:
+            db.close()
+
+    def _db_put(self, key, words, raw):
+        db = SessionLocal()
+        try:
+            old = [r.id for r in db.query(WordList.id).filter(WordList.cache_key == key)]
+            if old: self._db_delete(db, old)
+            wl = WordList(user_id=None, name="cache", cache_key=key, prompt_version=self.version,
+                          words_json=json.dumps(normalize_words(words), ensure_ascii=False),
+                          word_count=len(words), scene_count=len(raw.get('scenes', [])))
+            db.add(wl); db.flush()
+            db.add_all([Scene(word_list_id=wl.id, scene_order=i, scene_data_json=json.dumps(s, ensure_ascii=False))
+                        for i, s in enumerate(raw.get('scenes', []))])
+            db.commit()
+        finally:
+            db.close()
+
+    def _db_delete(self, db, ids):
+        db.query(Scene).filter(Scene.word_list_id.in_(ids)).delete(synchronize_session=False)
+        db.query(WordList).filter(WordList.id.in_(ids)).delete(synchronize_session=False)
+
+    # ---------- 对外接口 ----------
+    async def get(self, key):
+        raw = self._mem_get(key)
+        if raw is not None:
+            self.hits_memory += 1
+            return raw
+        try: hit = await asyncio.to_thread(self._db_get, key)
+        except Exception as e:
+            print(f"[Cache] DB read error: {e}")
+            hit = None
+        if hit is None:
+            self.misses += 1
+            return None
+        self.hits_db += 1
+        self._mem_put(key, hit[0], hit[1])
+        return hit[0]
+
+    async def put(self, key, words, raw):
+        if not raw.get('scenes'): return
+        self._mem_put(key, raw)
+        self.writes += 1
+        try: await asyncio.to_thread(self._db_put, key, words, raw)
+        except Exception as e: print(f"[Cache] DB write error: {e}")
+
+    def invalidate(self, all_versions=True):
+        """清空缓存；all_versions=False 时只清理 prompt 版本不是当前版本的持久条目"""
+        if all_versions: self.mem.clear()
+        db = SessionLocal()
+        try:
+            q = db.query(WordList.id).filter(WordList.cache_key.isnot(None))
+            if not all_versions: q = q.filter(WordList.prompt_version != self.version)
+            ids = [r.id for r in q]
+            if ids: self._db_delete(db, ids); db.commit()
+            return len(ids)
+        finally:
+            db.close()
+
+    def purge_stale(self):
+        """启动时调用：PROMPT 变化后旧版本的缓存条目全部作废"""
+        n = self.invalidate(all_versions=False)
+        if n: print(f"[Cache] Purged {n} entries from old prompt versions")
+        return n
+
+    def stats(self):
+        lookups = self.hits_memory + self.hits_db + self.misses
+        return {
+            "prompt_version": self.version, "memory_items": len(self.mem), "max_items": self.max_items, "ttl": self.ttl,
+            "hits_memory": self.hits_memory, "hits_db": self.hits_db, "misses": self.misses, "writes": self.writes,
+            "hit_rate": round((self.hits_memory + self.hits_db) / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,80 @@
+"""生成结果完整性 - 场景结构校验、单词覆盖统计、从损坏输出中抢救场景
+
+PROMPT 要求每个单词都必须用到，这里按输入单词表逐个场景核对：
+结构不合法或不含任何新单词的场景丢弃，words_in_scene 改为故事里真正出现的输入单词，
+没覆盖到的单词交给调用方单独补充生成，而不是整块重来。
+"""
+import os
+
+from .highlight import MARK_RE, get_highlighter
+from .stream_json import SceneStreamParser
+
+FOLLOWUP_ROUNDS = int(os.getenv("AI_FOLLOWUP_ROUNDS", "1"))  # 漏词补充生成的最多轮数（0 关闭）
+
+
+def salvage_scenes(text):
+    """整体解析失败时（输出被截断、个别场景损坏）逐个取出已闭合且合法的场景对象"""
+    return SceneStreamParser().feed(text)
+
+
+class Coverage:
+    """一组输入单词的覆盖情况：逐个接收场景，清理后记录已覆盖的单词"""
+    def __init__(self, words):
+        self.wd = {w['word'].lower(): w for w in words}
+        self.hl = get_highlighter(self.wd)
+        self.covered = set()
+        self.dropped = 0
+
+    def _found(self, paras):
+        out, seen = [], set()
+        if self.hl.regex is None: return out
+        for p in paras:
+            for text in (p['en'], p['zh']):
+                for m in self.hl.regex.finditer(MARK_RE.sub(r'\1', text)):
+                    k = m.group(1).lower()
+                    if k in self.wd and k not in seen:
+                        seen.add(k)
+                        out.append(k)
+        return out
+
+    def add(self, rs):
+        """返回清理后的场景；结构不合法或没有新单词时返回 None"""
+        paras = rs.get('paragraphs') if isinstance(rs, dict) else None
+        paras = [p for p in paras or [] if isinstance(p, dict) and isinstance(p.get('en'), str) and isinstance(p.get('zh'), str)]
+        found = self._found(paras)
+        if not paras or not any(k not in self.covered for k in found):
+            self.dropped += 1
+            return None
+        self.covered.update(found)
+        sid = rs.get('scene_id')
+        return {**rs, "scene_id": sid if isinstance(sid, int) else 0,
+                "words_in_scene": [self.wd[k]['word'] for k in found], "paragraphs": paras}
+
+    def check(self, raw):
+        """清理整份结果，返回 {"scenes": [...]}"""
+        scenes = [self.add(rs) for rs in (raw or {}).get('scenes', [])]
+        return {"scenes": [rs for rs in scenes if rs is not None]}
+
+    def missing(self):
+        return [w for k, w in self.wd.items() if k not in self.covered]
+
+
+class CompletenessStats:
+    def __init__(self):
+        self.chunks = self.complete = self.salvaged = self.followups = 0
+        self.recovered_words = self.missing_words = self.dropped_scenes = 0
+
+    def record(self, cov, initially_missing, salvaged=False):
+        self.chunks += 1
+        self.salvaged += salvaged
+        self.dropped_scenes += cov.dropped
+        still = len(cov.missing())
+        self.recovered_words += initially_missing - still
+        self.missing_words += still
+        if not still: self.complete += 1
+
+    def to_dict(self):
+        return {"followup_rounds": FOLLOWUP_ROUNDS, "chunks": self.chunks, "complete": self.complete,
+                "complete_ratio": round(self.complete / self.chunks, 3) if self.chunks else 0, "salvaged": self.salvaged,
+                "followups": self.followups, "recovered_words": self.recovered_words, "missing_words": self.missing_words,
+                "dropped_scenes": self.dropped_scenes}
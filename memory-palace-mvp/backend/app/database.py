@@ -1,13 +1,27 @@
 """SQLite 数据库配置"""
-from sqlalchemy import create_engine
+import os
+import time
+
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./memory_palace.db"
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./memory_palace.db")
+IS_SQLITE = SQLALCHEMY_DATABASE_URL.startswith("sqlite")
 
 engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False, "timeout": 30} if IS_SQLITE else {}
 )
+
+if IS_SQLITE:
+    @event.listens_for(engine, "connect")
+    def _sqlite_pragmas(conn, _):
+        # 多个 worker 进程共用一个库文件：WAL 下读不阻塞写，写冲突时等锁而不是立刻报 database is locked
+        cur = conn.cursor()
+        cur.execute("PRAGMA journal_mode=WAL")
+        cur.execute("PRAGMA synchronous=NORMAL")
+        cur.close()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
@@ -17,3 +31,30 @@ def get_db():
         yield db
     finally:
         db.close()
+
+def _retry(fn, attempts=10):
+    """多个 worker 同时启动时会同时建表/加列，后到的报 already exists / duplicate column：
+    重新检查后再来（每次都 checkfirst，已完成的部分跳过），每张表冲突一次，所以要重试多次"""
+    for i in range(attempts):
+        try: return fn()
+        except OperationalError:
+            if i == attempts - 1: raise
+            time.sleep(0.05 * (i + 1))
+
+def create_tables(metadata, tables=None):
+    _retry(lambda: metadata.create_all(bind=engine, tables=tables))
+
+def _upgrade(metadata):
+    insp = inspect(engine)
+    with engine.begin() as conn:
+        for table in metadata.sorted_tables:
+            if not insp.has_table(table.name): continue
+            have = {c["name"] for c in insp.get_columns(table.name)}
+            for col in table.columns:
+                if col.name not in have:
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {col.name} {col.type.compile(engine.dialect)}"))
+            for idx in table.indexes: idx.create(conn, checkfirst=True)
+
+def upgrade_schema(metadata):
+    """create_all 不会改动已有的表：给旧库补上新增的列和索引（新增列都可为空）"""
+    _retry(lambda: _upgrade(metadata))
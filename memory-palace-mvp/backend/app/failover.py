@@ -0,0 +1,157 @@
+"""提供商故障转移 - 有序链 + 熔断器 + 有限重试退避 + 对冲请求
+
+与具体 SDK 无关：FailoverChain.call(order, fn) 中 fn(provider) 是任意协程函数，
+本地可直接传入桩函数验证熔断、重试和对冲行为。
+"""
+import asyncio
+import os
+import random
+import sys
+import time
+
+# 传输层错误（超时、连接失败）：SDK 各有自己的异常类型
+SDK_TRANSPORT_ERRORS = (("httpx", "TransportError"), ("openai", "APIConnectionError"), ("anthropic", "APIConnectionError"))
+
+
+def transient(e):
+    """值得重试、计入熔断的错误：超时、连接错误、429、5xx；400/401/403 等重试也不会好，也不说明提供商不可用
+
+    SDK 的异常类只从已导入的模块里取：没导入的 SDK 不可能抛出它的异常，这里也不触发 SDK 加载。
+    """
+    status = getattr(e, "status_code", None)
+    if isinstance(status, int): return status in (408, 429) or status >= 500
+    if isinstance(e, (TimeoutError, ConnectionError)): return True
+    return any(isinstance(e, cls) for mod, name in SDK_TRANSPORT_ERRORS
+               if (cls := getattr(sys.modules.get(mod), name, None)) is not None)
+
+
+class CircuitOpen(Exception):
+    """还没调用就被熔断器拦下（试探名额被并发请求占用）：跳过该提供商，不算失败"""
+
+
+class AllProvidersFailed(Exception):
+    def __init__(self, errors):
+        self.errors = errors  # [(provider, 错误描述)]
+        super().__init__("; ".join(f"{p}: {e}" for p, e in errors) or "no provider available")
+
+
+class CircuitBreaker:
+    """连续失败 failure_threshold 次后熔断 reset_timeout 秒；到期后只放行一个试探请求（半开），成功即恢复"""
+    def __init__(self, failure_threshold=3, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+        self.probing = False  # 半开时已有试探请求在途
+
+    def ready(self):
+        """现在调用会不会被放行；只查看，不改变状态"""
+        if self.state == "closed": return True
+        if self.probing: return False
+        return self.state == "half_open" or time.monotonic() - self.opened_at >= self.reset_timeout
+
+    def allow(self):
+        """放行一次调用；非关闭状态下占用唯一的试探名额，由 success / failure / release 归还"""
+        if not self.ready(): return False
+        if self.state != "closed": self.state, self.probing = "half_open", True
+        return True
+
+    def release(self):
+        """试探请求被取消或以不计入熔断的错误结束：归还试探名额，状态不变"""
+        self.probing = False
+
+    def success(self):
+        self.state, self.failures, self.probing = "closed", 0, False
+
+    def failure(self):
+        self.failures += 1
+        self.probing = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open": self.trips += 1
+            self.state, self.opened_at = "open", time.monotonic()
+
+    def to_dict(self):
+        return {"state": self.state, "failures": self.failures, "trips": self.trips, "probing": self.probing}
+
+
+class FailoverChain:
+    def __init__(self, retries=None, backoff=None, hedge_after=None, failure_threshold=None, reset_timeout=None):
+        self.retries = retries if retries is not None else int(os.getenv("AI_RETRIES", "1"))
+        self.backoff = backoff if backoff is not None else float(os.getenv("AI_BACKOFF", "0.5"))
+        # 对冲：首个请求超过 hedge_after 秒未返回，就把同一请求发给下一个提供商，先返回者胜（0 关闭）
+        self.hedge_after = hedge_after if hedge_after is not None else float(os.getenv("AI_HEDGE_AFTER", "0"))
+        self.failure_threshold = failure_threshold or int(os.getenv("AI_BREAKER_FAILURES", "3"))
+        self.reset_timeout = reset_timeout or float(os.getenv("AI_BREAKER_RESET", "30"))
+        self.breakers = {}
+        self.failovers = self.hedges = self.hedge_wins = 0
+
+    def breaker(self, provider):
+        if provider not in self.breakers:
+            self.breakers[provider] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+        return self.breakers[provider]
+
+    def available(self, order):
+        """熔断器会放行的提供商（不占用试探名额，真正调用前还要 allow）"""
+        return [p for p in order if self.breaker(p).ready()]
+
+    async def _attempt(self, provider, fn):
+        """单个提供商：只对 transient 错误重试，指数退避加抖动；熔断后不再重试"""
+        b, last = self.breaker(provider), None
+        for attempt in range(self.retries + 1):
+            probe = b.state != "closed"
+            if not b.allow():
+                if last is None: raise CircuitOpen(f"{provider} circuit open")
+                raise last  # 退避期间熔断或试探名额被占用：上报上一次的真实错误
+            try:
+                result = await fn(provider)
+                b.success()
+                return result
+            except Exception as e:
+                print(f"[AI] {provider} attempt {attempt+1} failed: {e}")
+                last = e
+                if not transient(e): raise
+                b.failure()
+                if attempt >= self.retries or not b.ready(): raise
+            finally:
+                if probe: b.release()  # 试探请求被取消（对冲输家）或以非 transient 错误结束
+            await asyncio.sleep(self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5))
+
+    async def call(self, order, fn):
+        """按 order 依次尝试，返回 (结果, 提供商)；全部失败抛 AllProvidersFailed"""
+        cands = self.available(order)
+        if not cands: raise AllProvidersFailed([(p, "circuit open") for p in order])
+        running, errors, skipped, idx, hedged = {}, [], [], 0, set()
+
+        def start():
+            nonlocal idx
+            p = cands[idx]; idx += 1
+            running[asyncio.ensure_future(self._attempt(p, fn))] = p
+
+        start()
+        try:
+            while running:
+                hedge = self.hedge_after > 0 and idx < len(cands) and len(running) < 2
+                done, _ = await asyncio.wait(running, timeout=self.hedge_after if hedge else None, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    self.hedges += 1
+                    print(f"[AI] Hedging: {running[next(iter(running))]} slower than {self.hedge_after}s, also trying {cands[idx]}")
+                    hedged.add(cands[idx])
+                    start(); continue
+                for t in done:
+                    p = running.pop(t)
+                    if t.exception() is None:
+                        if p in hedged: self.hedge_wins += 1
+                        if errors: self.failovers += 1
+                        return t.result(), p
+                    if isinstance(t.exception(), CircuitOpen): skipped.append((p, "circuit open"))
+                    else: errors.append((p, str(t.exception())))
+                if not running and idx < len(cands): start()
+        finally:
+            for t in running: t.cancel()
+        raise AllProvidersFailed(errors + skipped)
+
+    def stats(self):
+        return {"breakers": {p: b.to_dict() for p, b in self.breakers.items()}, "failovers": self.failovers,
+                "hedges": self.hedges, "hedge_wins": self.hedge_wins, "retries": self.retries, "hedge_after": self.hedge_after}
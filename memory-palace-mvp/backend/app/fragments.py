@@ -0,0 +1,143 @@
+"""单词级故事片段库 - 重叠词表只为新单词付费
+
+每个校验通过的段落连同它覆盖的词义（单词 + 词性 + 释义）一起入库；新请求先用库里的段落拼出场景，
+只把没被覆盖的单词发给 LLM。库按 FRAGMENT_TTL_DAYS / FRAGMENT_MAX_ROWS 淘汰最旧的段落。
+"""
+import asyncio
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from sqlalchemy import or_
+
+from .cache import normalize_words
+from .database import SessionLocal
+from .highlight import MARK_RE
+from .models import StoryFragment, FragmentWord
+
+FRAGMENT_TTL_DAYS = int(os.getenv("FRAGMENT_TTL_DAYS", "30"))
+FRAGMENT_MAX_ROWS = int(os.getenv("FRAGMENT_MAX_ROWS", "20000"))
+
+
+def senses(words):
+    """小写单词 -> 词义键；规范化与生成缓存的 key 相同，释义不同的同形词不会复用同一段落"""
+    return {w: hashlib.sha256(json.dumps([w, pos, meaning], ensure_ascii=False).encode('utf-8')).hexdigest()
+            for w, pos, meaning in normalize_words(words)}
+
+
+def paragraph_words(p, wordset):
+    """段落覆盖的单词：en 中 [[...]] 标记的词；任何标记不在词表里、或中英文缺失的段落都不合格"""
+    if not (p.get('zh') and p.get('en') and p.get('zh_pure')): return None
+    marked = {m.strip().lower() for m in MARK_RE.findall(p['en'])}
+    if not marked or not marked <= wordset: return None
+    return sorted(marked)
+
+
+class FragmentStore:
+    def __init__(self, version, enabled=None, ttl_days=FRAGMENT_TTL_DAYS, max_rows=FRAGMENT_MAX_ROWS):
+        self.version = version
+        self.enabled = enabled if enabled is not None else os.getenv("FRAGMENT_REUSE", "1") == "1"
+        self.ttl_days, self.max_rows = ttl_days, max_rows
+        self.words_requested = self.words_reused = self.requests = self.fragments_saved = self.fragments_pruned = 0
+
+    # ---------- 组装 ----------
+    def _assemble(self, words):
+        keys = set(senses(words).values())
+        db = SessionLocal()
+        try:
+            ids = {r.fragment_id for r in db.query(FragmentWord.fragment_id).join(StoryFragment)
+                   .filter(FragmentWord.sense.in_(keys), StoryFragment.prompt_version == self.version)}
+            owned = {}
+            if ids:
+                for r in db.query(FragmentWord.fragment_id, FragmentWord.sense).filter(FragmentWord.fragment_id.in_(ids)):
+                    owned.setdefault(r.fragment_id, set()).add(r.sense)
+            frags = db.query(StoryFragment).filter(StoryFragment.id.in_(ids)).all() if ids else []
+            cands = [(f.scene_id, json.loads(f.paragraph_json), set(json.loads(f.words_json)), owned.get(f.id, {None}))
+                     for f in frags]
+        finally:
+            db.close()
+        # 只用词义完全落在本次词表内的段落；贪心优先覆盖单词多的，段落间不重复覆盖
+        cands = [c[:3] for c in cands if c[2] and c[3] <= keys]
+        cands.sort(key=lambda c: (-len(c[2]), c[0]))
+        covered, scenes = set(), OrderedDict()
+        for sid, para, ws in cands:
+            if ws & covered: continue
+            covered |= ws
+            s = scenes.setdefault(sid, {"scene_id": sid, "words_in_scene": [], "paragraphs": []})
+            s["words_in_scene"] += sorted(ws)
+            s["paragraphs"].append(para)
+        return {"scenes": list(scenes.values())}, covered
+
+    async def assemble(self, words):
+        """返回 (由库中段落拼成的原始场景, 已覆盖单词集合)"""
+        if not self.enabled or not words: return {"scenes": []}, set()
+        try: return await asyncio.to_thread(self._assemble, words)
+        except Exception as e:
+            print(f"[Fragments] Assemble error: {e}")
+            return {"scenes": []}, set()
+
+    # ---------- 入库 ----------
+    def _save(self, raw, words):
+        sense = senses(words)
+        wordset = set(sense)
+        rows = []
+        for rs in raw.get('scenes', []):
+            for p in rs.get('paragraphs', []):
+                ws = paragraph_words(p, wordset)
+                if not ws: continue
+                para = {"zh": p['zh'], "en": p['en'], "zh_pure": p['zh_pure']}
+                key = hashlib.sha256(json.dumps([self.version, para], ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+                rows.append((key, rs.get('scene_id', 1), para, ws))
+        if not rows: return 0
+        db = SessionLocal()
+        try:
+            existing = {r.content_key for r in db.query(StoryFragment.content_key).filter(StoryFragment.content_key.in_([r[0] for r in rows]))}
+            n = 0
+            for key, sid, para, ws in rows:
+                if key in existing: continue
+                existing.add(key)
+                f = StoryFragment(scene_id=sid, prompt_version=self.version, content_key=key,
+                                  paragraph_json=json.dumps(para, ensure_ascii=False), words_json=json.dumps(ws))
+                f.words = [FragmentWord(word=w, sense=sense[w]) for w in ws]
+                db.add(f); n += 1
+            db.commit()
+            self.fragments_pruned += self._prune(db)
+            return n
+        finally:
+            db.close()
+
+    def _prune(self, db):
+        """删掉过期的段落，再把总数压到 max_rows 以内（先删最旧的）"""
+        expired = StoryFragment.created_at < datetime.utcnow() - timedelta(days=self.ttl_days)
+        # 第 max_rows 新的 id；比它旧的都超出上限
+        floor = db.query(StoryFragment.id).order_by(StoryFragment.id.desc()).offset(self.max_rows).limit(1).scalar()
+        cond = or_(expired, StoryFragment.id <= floor) if floor is not None else expired
+        old = db.query(StoryFragment.id).filter(cond)
+        db.query(FragmentWord).filter(FragmentWord.fragment_id.in_(old.scalar_subquery())).delete(synchronize_session=False)
+        n = db.query(StoryFragment).filter(cond).delete(synchronize_session=False)
+        db.commit()
+        return n
+
+    async def save(self, raw, words):
+        """把 LLM 新生成的段落按覆盖单词入库"""
+        if not self.enabled: return
+        try: self.fragments_saved += await asyncio.to_thread(self._save, raw, words)
+        except Exception as e: print(f"[Fragments] Save error: {e}")
+
+    # ---------- 统计 ----------
+    def report(self, total, reused):
+        """记录并返回单次请求的复用情况"""
+        self.requests += 1
+        self.words_requested += total
+        self.words_reused += reused
+        return {"words": total, "from_store": reused, "from_llm": total - reused, "ratio": round(reused / total, 4) if total else 0.0}
+
+    def stats(self):
+        return {
+            "enabled": self.enabled, "requests": self.requests, "fragments_saved": self.fragments_saved,
+            "fragments_pruned": self.fragments_pruned, "ttl_days": self.ttl_days, "max_rows": self.max_rows,
+            "words_requested": self.words_requested, "words_reused": self.words_reused,
+            "reuse_ratio": round(self.words_reused / self.words_requested, 4) if self.words_requested else 0.0,
+        }
@@ -0,0 +1,60 @@
+"""单词高亮引擎 - 每个词表只编译一次，单次扫描完成全部高亮"""
+import re
+from collections import OrderedDict
+
+MARK_RE = re.compile(r'\[\[([^\]]+)\]\]')
+CACHE_SIZE = 128
+
+
+def _tip(info):
+    return f"{info['word']}: {info.get('pos','')} {info.get('meaning','')}".strip().replace('<','&lt;').replace('>','&gt;')
+
+
+def _trie_pattern(words):
+    """把词表编译成前缀树形式的正则，匹配每个位置的代价只与单词长度有关，与词表大小无关"""
+    trie = {}
+    for w in words:
+        node = trie
+        for ch in w: node = node.setdefault(ch, {})
+        node[''] = True
+
+    def build(node):
+        end = '' in node
+        alts = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not alts: return ''
+        body = alts[0] if len(alts) == 1 else '(?:' + '|'.join(alts) + ')'
+        # 贪婪可选：优先匹配更长的单词（well-being 优先于 well），失败再回退
+        return f"(?:{body})?" if end else body
+    return build(trie)
+
+
+class Highlighter:
+    """词表 -> 一个编译好的匹配器，一次 re.sub 扫描完成全部单词的高亮"""
+    def __init__(self, word_dict):
+        self.tips = {wl.lower(): _tip(info) for wl, info in word_dict.items() if info.get('word')}
+        words = [w for w in self.tips if w]
+        self.regex = re.compile(r'\b(' + _trie_pattern(words) + r')\b', re.IGNORECASE) if words else None
+
+    def _repl(self, m):
+        tip = self.tips.get(m.group(1).lower())
+        if tip is None: return m.group(0)
+        return f"<span class='word-highlight'>{m.group(1)}<span class='tooltip'>{tip}</span></span>"
+
+    def mark(self, text):
+        if not text: return ''
+        result = MARK_RE.sub(r'\1', text)
+        return self.regex.sub(self._repl, result) if self.regex else result
+
+
+_cache = OrderedDict()
+
+def get_highlighter(word_dict):
+    """按词表（含词性、释义）缓存已编译的高亮器，LRU 淘汰"""
+    key = frozenset((wl, _tip(info)) for wl, info in word_dict.items())
+    h = _cache.get(key)
+    if h is not None:
+        _cache.move_to_end(key)
+        return h
+    h = _cache[key] = Highlighter(word_dict)
+    if len(_cache) > CACHE_SIZE: _cache.popitem(last=False)
+    return h
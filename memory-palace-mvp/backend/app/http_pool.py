@@ -0,0 +1,131 @@
+"""LLM 提供商的 HTTP 连接池 - 每个提供商一个长期存在的 httpx.AsyncClient
+
+SDK 客户端（AsyncOpenAI / AsyncAnthropic）只是包在连接池外面的一层：换 API Key 时重建 SDK 客户端，
+连接池不动，已建立的 TLS 连接继续复用。可选在启动时和空闲期间定时预热，避免空闲后第一个请求付出 TLS 握手开销。
+连接是否复用通过 httpcore 的 trace 事件统计：请求期间发生了 TCP 建连就是新连接，否则是复用。
+"""
+import asyncio
+import os
+import time
+
+import httpx
+
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))      # 每个提供商的最大连接数
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "10"))          # 每个提供商保持的空闲连接数
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "90"))  # 空闲连接保留秒数
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "10"))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "300"))                   # 读写超时（长输出生成需要较长）
+HTTP_WARM_ON_START = os.getenv("HTTP_WARM_ON_START", "0") == "1"
+HTTP_WARM_INTERVAL = float(os.getenv("HTTP_WARM_INTERVAL", "0"))         # 定时预热间隔秒数（0 关闭），应小于 keepalive 保留时间
+
+
+class PoolStats:
+    __slots__ = ("requests", "new_connections", "tls_handshakes", "connect_seconds", "errors", "warmups", "warmup_errors", "last_used")
+
+    def __init__(self):
+        self.requests = self.new_connections = self.tls_handshakes = self.errors = self.warmups = self.warmup_errors = 0
+        self.connect_seconds = 0.0
+        self.last_used = 0.0
+
+    def to_dict(self):
+        reused = self.requests - self.new_connections
+        return {"requests": self.requests, "new_connections": self.new_connections, "reused": reused,
+                "reuse_ratio": round(reused / self.requests, 3) if self.requests else 0, "tls_handshakes": self.tls_handshakes,
+                "avg_connect_ms": round(self.connect_seconds / self.new_connections * 1000, 1) if self.new_connections else 0,
+                "errors": self.errors, "warmups": self.warmups, "warmup_errors": self.warmup_errors}
+
+
+class _TracedTransport(httpx.AsyncHTTPTransport):
+    """给每个请求挂上 httpcore trace 回调，记录是否新建了连接、建连与 TLS 握手耗时"""
+    def __init__(self, stats, **kwargs):
+        super().__init__(**kwargs)
+        self.stats = stats
+
+    async def handle_async_request(self, request):
+        s, started = self.stats, {}
+
+        async def trace(name, info):
+            if name == "connection.connect_tcp.started":
+                started["t"] = time.perf_counter()
+                s.new_connections += 1
+            elif name == "connection.start_tls.complete":
+                s.tls_handshakes += 1
+                if "t" in started: s.connect_seconds += time.perf_counter() - started.pop("t")
+            elif name == "connection.connect_tcp.complete" and request.url.scheme == "http":
+                if "t" in started: s.connect_seconds += time.perf_counter() - started.pop("t")
+
+        request.extensions = {**request.extensions, "trace": trace}
+        s.requests += 1
+        s.last_used = time.monotonic()
+        try:
+            return await super().handle_async_request(request)
+        except Exception:
+            s.errors += 1
+            raise
+
+
+class ConnectionPools:
+    """provider -> (base_url, AsyncClient)；同一提供商在进程内只有一个连接池"""
+    def __init__(self):
+        self.limits = httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+                                   keepalive_expiry=HTTP_KEEPALIVE_EXPIRY)
+        self.timeout = httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT)
+        self.pools, self.stats_by = {}, {}
+        self._warmer = None
+
+    def client(self, provider, base_url):
+        """取提供商的共享连接池；base_url 变化时才重建（旧池关闭，其他提供商不受影响）"""
+        cur = self.pools.get(provider)
+        if cur and cur[0] == base_url: return cur[1]
+        stats = self.stats_by.setdefault(provider, PoolStats())
+        client = httpx.AsyncClient(transport=_TracedTransport(stats, limits=self.limits), timeout=self.timeout)
+        self.pools[provider] = (base_url, client)
+        if cur: self._close_later(cur[1])
+        return client
+
+    def drop(self, provider):
+        """提供商停用（删除 API Key）时关闭它的连接池"""
+        cur = self.pools.pop(provider, None)
+        if cur: self._close_later(cur[1])
+
+    def _close_later(self, client):
+        try: asyncio.get_running_loop().create_task(client.aclose())
+        except RuntimeError: pass  # 没有运行中的事件循环，交给 GC
+
+    # ---------- 预热 ----------
+    async def warm(self, providers=None, idle_only=False):
+        """对每个连接池发一个 HEAD 请求建立（或保持）连接；状态码无所谓，能连上即可"""
+        async def one(p, base_url, client):
+            s = self.stats_by[p]
+            if idle_only and time.monotonic() - s.last_used < HTTP_WARM_INTERVAL: return
+            try:
+                await client.head(base_url, timeout=HTTP_CONNECT_TIMEOUT)
+                s.warmups += 1
+            except Exception as e:
+                s.warmup_errors += 1
+                print(f"[HTTP] Warm-up {p} failed: {e}")
+        items = [(p, u, c) for p, (u, c) in self.pools.items() if providers is None or p in providers]
+        await asyncio.gather(*(one(*it) for it in items))
+
+    async def _warm_loop(self):
+        while True:
+            await asyncio.sleep(HTTP_WARM_INTERVAL)
+            await self.warm(idle_only=True)
+
+    async def start(self, providers=None):
+        if HTTP_WARM_ON_START: await self.warm(providers)
+        if HTTP_WARM_INTERVAL > 0 and self._warmer is None:
+            self._warmer = asyncio.create_task(self._warm_loop())
+
+    async def close(self):
+        if self._warmer is not None:
+            self._warmer.cancel()
+            self._warmer = None
+        for _, client in self.pools.values(): await client.aclose()
+        self.pools.clear()
+
+    def stats(self):
+        return {"limits": {"max_connections": HTTP_MAX_CONNECTIONS, "max_keepalive": HTTP_MAX_KEEPALIVE,
+                           "keepalive_expiry": HTTP_KEEPALIVE_EXPIRY},
+                "warm_on_start": HTTP_WARM_ON_START, "warm_interval": HTTP_WARM_INTERVAL,
+                "providers": {p: s.to_dict() for p, s in self.stats_by.items()}}
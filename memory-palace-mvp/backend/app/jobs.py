@@ -0,0 +1,369 @@
+"""后台生成任务队列 - 有界 worker 池 + 数据库持久化 + 相同请求合并（跨 worker）
+
+生成与 HTTP 请求解耦：客户端或代理超时不影响任务继续执行，结果随时可查。
+uvicorn --workers N / 多节点时所有 worker 共用任务表，行本身就是锁：
+- active_key：进行中的任务等于 dedup_key，结束后清空；唯一约束保证相同请求不论落到哪个 worker 都只有一个进行中的任务；
+- 租约：worker 按 owner + lease_until 原子地领取排队中或租约已过期的任务，执行期间定期续租；
+  其他 worker 还在执行的任务不会被重复执行，进程崩溃后租约过期才由别的 worker 接手；
+- /generate、/generate/stream 也登记为任务：相同请求正在生成时等它的结果，不再重复调用提供商
+  （同一进程内的流式请求实时跟随已生成的场景）；
+- 结束超过 JOB_TTL_HOURS 的任务定期清理。
+"""
+import asyncio
+import json
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, func, or_
+from sqlalchemy.exc import IntegrityError
+
+from .ai_service import ai_service, ai_config
+from .database import SessionLocal
+from .models import GenerationJob
+
+TERMINAL = ("done", "failed")
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))  # 租约时长，执行期间每 1/3 续一次
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "1"))     # 空闲 worker 查看其他进程提交/遗留任务的间隔
+JOB_TTL_HOURS = float(os.getenv("JOB_TTL_HOURS", "24"))          # 结束的任务保留多久
+CLEANUP_SECONDS = 600
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+def payload_of(result, word_count):
+    """generate_scene 的结果 -> 任务结果 / /generate 响应"""
+    payload = {"message": f"成功生成 {len(result['scenes'])} 个记忆场景", "scenes": result["scenes"], "words": result["words"], "word_count": word_count}
+    if result.get("reuse"): payload["reuse"] = result["reuse"]
+    if result.get("missing"): payload["missing"] = result["missing"]
+    return payload
+
+
+class LiveStream:
+    """本进程正在执行的流式生成：已产出的条目 + 新条目通知，同进程的相同请求从头回放并实时跟随"""
+    def __init__(self):
+        self.items, self.closed = [], False
+        self.cond = asyncio.Condition()
+
+    async def put(self, item):
+        async with self.cond:
+            self.items.append(item)
+            self.cond.notify_all()
+
+    async def close(self):
+        async with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+    async def follow(self):
+        i = 0
+        while True:
+            async with self.cond:
+                await self.cond.wait_for(lambda: len(self.items) > i or self.closed)
+                batch, closed = self.items[i:], self.closed
+            for item in batch: yield item
+            i += len(batch)
+            if closed and i >= len(self.items): return
+
+
+class JobQueue:
+    def __init__(self, workers=None, max_queued=None, lease=JOB_LEASE_SECONDS, poll=JOB_POLL_SECONDS, ttl_hours=JOB_TTL_HOURS):
+        self.workers = workers or int(os.getenv("JOB_WORKERS", "4"))
+        self.max_queued = max_queued or int(os.getenv("JOB_QUEUE_SIZE", "100"))
+        self.lease, self.poll, self.ttl = lease, poll, timedelta(hours=ttl_hours)
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.wakeup = asyncio.Event()  # 本进程提交了任务，空闲 worker 立即领取
+        self.owned = set()   # 本进程持有租约的任务
+        self.events = {}     # job_id -> asyncio.Event，本进程执行的任务结束时触发
+        self.live = {}       # job_id -> LiveStream
+        self.tasks = []
+        self.submitted = self.deduplicated = self.joined = self.completed = self.failed = self.recovered = self.cleaned = 0
+        self.queued = 0  # 所有 worker 排队中的任务数；提交和维护循环里在线程中刷新，stats 只读缓存
+
+    # ---------- 持久化 ----------
+    def _db(self, fn):
+        db = SessionLocal()
+        try: return fn(db)
+        finally: db.close()
+
+    def _insert(self, job_id, key, name, words, running):
+        """插入进行中的任务，返回 job_id；已有相同的进行中任务时返回它的 id"""
+        def run(db):
+            now = time.time()
+            db.add(GenerationJob(id=job_id, dedup_key=key, active_key=key, name=name,
+                                 request_json=json.dumps({"words": words}, ensure_ascii=False),
+                                 status="running" if running else "queued", owner=self.worker_id if running else None,
+                                 lease_until=now + self.lease if running else None))
+            try:
+                db.commit()
+                return job_id
+            except IntegrityError:
+                db.rollback()
+                row = db.query(GenerationJob.id).filter(GenerationJob.active_key == key).first()
+                return row.id if row else None  # 冲突的任务刚好结束，重新插入
+        for _ in range(5):
+            got = self._db(run)
+            if got: return got
+        raise RuntimeError(f"job {key} insert conflict")
+
+    def _queued(self):
+        return self._db(lambda db: db.query(func.count(GenerationJob.id)).filter(GenerationJob.status == "queued").scalar())
+
+    def _update(self, job_id, **fields):
+        def run(db):
+            n = db.query(GenerationJob).filter(GenerationJob.id == job_id).update(fields, synchronize_session=False)
+            db.commit()
+            return n
+        return self._db(run)
+
+    def _load(self, job_id):
+        return self._db(lambda db: db.query(GenerationJob).filter(GenerationJob.id == job_id).first())
+
+    def _claim(self):
+        """原子地领取一个排队中或租约已过期的任务，返回 (job_id, 是否接手的遗留任务)"""
+        def run(db):
+            now = time.time()
+            expired = and_(GenerationJob.status == "running",
+                           or_(GenerationJob.lease_until.is_(None), GenerationJob.lease_until < now))
+            claimable = or_(GenerationJob.status == "queued", expired)
+            for job_id, status in (db.query(GenerationJob.id, GenerationJob.status).filter(claimable)
+                                   .order_by(GenerationJob.created_at).limit(5).all()):
+                n = db.query(GenerationJob).filter(GenerationJob.id == job_id, claimable).update(
+                    {"status": "running", "owner": self.worker_id, "lease_until": now + self.lease}, synchronize_session=False)
+                db.commit()
+                if n == 1: return job_id, status == "running"
+            return None, False
+        return self._db(run)
+
+    def _renew(self, ids):
+        def run(db):
+            db.query(GenerationJob).filter(GenerationJob.id.in_(ids), GenerationJob.owner == self.worker_id).update(
+                {"lease_until": time.time() + self.lease}, synchronize_session=False)
+            db.commit()
+        self._db(run)
+
+    def _release_owned(self):
+        """退出时把本进程还在执行的任务交回队列，由其他 worker 立即接手"""
+        def run(db):
+            n = db.query(GenerationJob).filter(GenerationJob.owner == self.worker_id, GenerationJob.status == "running").update(
+                {"status": "queued", "owner": None, "lease_until": None}, synchronize_session=False)
+            db.commit()
+            return n
+        return self._db(run)
+
+    def _cleanup(self):
+        def run(db):
+            n = db.query(GenerationJob).filter(GenerationJob.status.in_(TERMINAL),
+                                               GenerationJob.updated_at < datetime.utcnow() - self.ttl).delete(synchronize_session=False)
+            db.commit()
+            return n
+        return self._db(run)
+
+    # ---------- 生命周期 ----------
+    async def start(self):
+        """启动 worker 和维护任务；遗留任务不在这里重新入队，租约过期后由 worker 正常领取"""
+        self.tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        self.tasks.append(asyncio.create_task(self._maintain()))
+
+    async def stop(self):
+        for t in self.tasks: t.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        try:
+            n = await asyncio.to_thread(self._release_owned)
+            if n: print(f"[Jobs] Released {n} running jobs to other workers")
+        except Exception as e:
+            print(f"[Jobs] Release failed: {e}")
+        self.owned.clear()
+
+    async def _maintain(self):
+        """续租本进程执行中的任务，定期清理过期结果"""
+        last_cleanup = 0.0
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            try:
+                self.queued = await asyncio.to_thread(self._queued)
+                if self.owned: await asyncio.to_thread(self._renew, list(self.owned))
+                if time.monotonic() - last_cleanup > CLEANUP_SECONDS:
+                    last_cleanup = time.monotonic()
+                    n = await asyncio.to_thread(self._cleanup)
+                    if n:
+                        self.cleaned += n
+                        print(f"[Jobs] Cleaned {n} finished jobs")
+            except Exception as e:
+                print(f"[Jobs] Maintenance error: {e}")
+
+    # ---------- 提交与执行 ----------
+    async def submit(self, name, words):
+        """返回 (job_id, 是否与进行中的相同请求合并)"""
+        key = ai_service.cache.key(words, ai_config.preferred_provider)
+        self.queued = await asyncio.to_thread(self._queued)
+        if self.queued >= self.max_queued: raise JobQueueFull()
+        job_id = uuid.uuid4().hex
+        got = await asyncio.to_thread(self._insert, job_id, key, name, words, False)
+        if got != job_id:
+            self.deduplicated += 1
+            return got, True
+        self.submitted += 1
+        self.wakeup.set()
+        return job_id, False
+
+    async def join_or_start(self, name, words):
+        """同步接口（/generate、/generate/stream）用：相同请求正在生成时返回 (job_id, False)，
+        否则登记为本进程执行的任务返回 (job_id, True)，调用方生成完后调用 finish"""
+        key = ai_service.cache.key(words, ai_config.preferred_provider)
+        job_id = uuid.uuid4().hex
+        got = await asyncio.to_thread(self._insert, job_id, key, name, words, True)
+        if got != job_id:
+            self.joined += 1
+            return got, False
+        self._own(job_id)
+        return job_id, True
+
+    def _own(self, job_id):
+        self.owned.add(job_id)
+        self.events[job_id] = asyncio.Event()
+
+    async def finish(self, job_id, payload=None, error=None):
+        """本进程执行的任务结束：写入结果、释放 active_key、唤醒本进程的等待者"""
+        try:
+            if error is None:
+                await asyncio.to_thread(self._update, job_id, status="done", result_json=json.dumps(payload, ensure_ascii=False),
+                                        active_key=None, lease_until=None)
+                self.completed += 1
+            else:
+                await asyncio.to_thread(self._update, job_id, status="failed", error=error, active_key=None, lease_until=None)
+                self.failed += 1
+        finally:
+            self.owned.discard(job_id)
+            ev = self.events.pop(job_id, None)
+            if ev: ev.set()
+
+    async def _worker(self, n):
+        while True:
+            self.wakeup.clear()
+            try:
+                job_id, recovered = await asyncio.to_thread(self._claim)
+            except Exception as e:
+                print(f"[Jobs] Worker {n} claim error: {e}")
+                job_id = None
+            if job_id is None:
+                try: await asyncio.wait_for(self.wakeup.wait(), self.poll)
+                except asyncio.TimeoutError: pass
+                continue
+            if recovered:
+                self.recovered += 1
+                print(f"[Jobs] Recovered {job_id} after its lease expired")
+            try: await self._run(job_id)
+            except Exception as e: print(f"[Jobs] Worker {n} error on {job_id}: {e}")
+
+    async def _run(self, job_id):
+        self._own(job_id)
+        job = await asyncio.to_thread(self._load, job_id)
+        if job is None:
+            self.owned.discard(job_id); self.events.pop(job_id, None)
+            return
+        words = json.loads(job.request_json)["words"]
+        print(f"[Jobs] Running {job_id}: {len(words)} words")
+        try:
+            result = await ai_service.generate_scene(words, provider=ai_config.preferred_provider)
+        except Exception as e:
+            print(f"[Jobs] {job_id} failed: {e}")
+            await self.finish(job_id, error=str(e))
+            return
+        await self.finish(job_id, payload_of(result, len(words)))
+
+    # ---------- 流式生成 ----------
+    async def stream(self, job_id, owned, items):
+        """流式生成的合并：自己执行时边转发 items 边记录结果；同进程的相同请求实时跟随；
+        其他 worker 在执行时等它结束，再按流式格式回放结果。产出的条目与 generate_scene_stream 相同"""
+        if owned:
+            async for item in self._stream_owned(job_id, items): yield item
+            return
+        live = self.live.get(job_id)
+        if live is not None:
+            done = False
+            async for item in live.follow():
+                done = done or item["type"] == "done"
+                yield item
+            if not done: yield {"type": "error", "message": "相同请求的生成被中断，请重试"}
+            return
+        job = await self.wait(job_id)
+        if job is None or job.status != "done":
+            yield {"type": "error", "message": f"生成失败: {job.error if job else '任务不存在'}"}
+            return
+        result = json.loads(job.result_json)
+        yield {"type": "meta", "word_count": result["word_count"], "words": result["words"], "chunks": 0, "cached": False,
+               "reuse": result.get("reuse"), "joined": True}
+        for scene in result["scenes"]: yield {"type": "scene", "scene": scene}
+        done = {"type": "done", "scenes": len(result["scenes"]), "word_count": result["word_count"], "reuse": result.get("reuse")}
+        if result.get("missing"): done["missing"] = result["missing"]
+        yield done
+
+    async def _stream_owned(self, job_id, items):
+        live = self.live[job_id] = LiveStream()
+        table, scenes, errors, done = [], [], [], None
+        try:
+            async for item in items:
+                await live.put(item)
+                if item["type"] == "meta": table = item["words"]
+                elif item["type"] == "scene": scenes.append(item["scene"])
+                elif item["type"] == "error": errors.append(item["message"])
+                elif item["type"] == "done": done = item
+                yield item
+        except Exception as e:
+            errors.append(str(e))
+            raise
+        finally:
+            await live.close()
+            self.live.pop(job_id, None)
+            if done is None:
+                # 客户端断开或生成出错：任务作废（不替已离开的客户端继续付费生成）
+                await self.finish(job_id, error="; ".join(errors) or "已取消")
+            elif not scenes and errors:
+                await self.finish(job_id, error="; ".join(errors))
+            else:
+                payload = payload_of({"scenes": scenes, "words": table, "reuse": done.get("reuse"), "missing": done.get("missing")},
+                                     done["word_count"])
+                await self.finish(job_id, payload)
+
+    # ---------- 查询 ----------
+    async def wait(self, job_id, timeout=None):
+        """等任务结束或超时，返回任务行；本进程执行的任务等事件，其他 worker 执行的按 poll 间隔查库"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            job = await asyncio.to_thread(self._load, job_id)
+            if job is None or job.status in TERMINAL: return job
+            left = self.poll if deadline is None else min(self.poll, deadline - time.monotonic())
+            if left <= 0: return job
+            ev = self.events.get(job_id)
+            try:
+                if ev is not None: await asyncio.wait_for(ev.wait(), left)
+                else: await asyncio.sleep(left)
+            except asyncio.TimeoutError:
+                pass
+
+    async def get(self, job_id, wait=0):
+        """查询任务；wait > 0 时长轮询，最多等待 wait 秒直到任务结束"""
+        job = await self.wait(job_id, wait) if wait > 0 else await asyncio.to_thread(self._load, job_id)
+        if job is None: return None
+        d = {"job_id": job.id, "name": job.name, "status": job.status,
+             "created_at": job.created_at.isoformat() if job.created_at else None,
+             "updated_at": job.updated_at.isoformat() if job.updated_at else None}
+        if job.status == "done": d["result"] = json.loads(job.result_json)
+        if job.status == "failed": d["error"] = job.error
+        return d
+
+    def stats(self):
+        return {"workers": self.workers, "worker_id": self.worker_id, "queued": self.queued, "max_queued": self.max_queued,
+                "running_here": len(self.owned), "live_streams": len(self.live),
+                "submitted": self.submitted, "deduplicated": self.deduplicated, "joined": self.joined, "completed": self.completed,
+                "failed": self.failed, "recovered": self.recovered, "cleaned": self.cleaned,
+                "lease_seconds": self.lease, "ttl_hours": self.ttl.total_seconds() / 3600}
+
+
+job_queue = JobQueue()
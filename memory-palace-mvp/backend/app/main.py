@@ -1,15 +1,93 @@
 """FastAPI 主入口 - 记了么"""
 import json
 import os
-from typing import Optional
-from fastapi import FastAPI, HTTPException, UploadFile, File
+import time
+from datetime import timedelta
+from typing import Literal, Optional
+from fastapi import Depends, FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.security import OAuth2PasswordRequestForm
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
+from sqlalchemy.orm import Session
 
 from .ai_service import ai_service, ai_config
 from .analytics import analytics
+from .jobs import job_queue, JobQueueFull, TERMINAL, payload_of
+from .parsing import document_parser, ParseError
+from .wordparse import stream_words
+from .scene_format import scenes_to_html, to_html
+from .admission import admission, AdmissionRejected, client_ip
+from .shared_state import shared
+from .assets import assets, ASSET_DIR, ImmutableStaticFiles
+from .responses import CompressionMiddleware, FastJSONResponse, compression_stats, etag_response
+from .database import Base, create_tables, get_db, upgrade_schema
+from .auth import (AuthUser, UserCreate, UserResponse, Token, ACCESS_TOKEN_EXPIRE_MINUTES, create_user, authenticate_user,
+                   create_access_token, get_current_user, get_current_user_optional, password_hasher, token_cache)
+from . import wordlists
+from . import models  # noqa: F401  注册数据表
 
-app = FastAPI(title="记了么 API")
+create_tables(Base.metadata)
+upgrade_schema(Base.metadata)
+
+# 默认用 orjson 编码；大响应的路由直接返回 FastJSONResponse / etag_response，跳过 jsonable_encoder
+app = FastAPI(title="记了么 API", default_response_class=FastJSONResponse)
+
+@app.on_event("startup")
+def purge_stale_cache():
+    """PROMPT 变化后旧版本的生成缓存全部作废"""
+    ai_service.cache.purge_stale()
+
+@app.on_event("startup")
+async def start_http_pools():
+    """可选：启动时预热各提供商连接，并在空闲期间定时保活"""
+    await ai_service.start_http()
+
+@app.on_event("shutdown")
+async def close_http_pools():
+    await ai_service.close_http()
+
+@app.on_event("startup")
+async def start_job_queue():
+    await job_queue.start()
+
+@app.on_event("shutdown")
+async def stop_job_queue():
+    await job_queue.stop()
+
+@app.on_event("shutdown")
+def stop_password_hasher():
+    password_hasher.shutdown()
+
+@app.on_event("shutdown")
+def stop_document_parser():
+    document_parser.shutdown()
+
+@app.on_event("startup")
+def start_analytics_writer():
+    """从库中恢复埋点统计，并启动后台批量写线程"""
+    analytics.restore()
+    if analytics.writer: analytics.writer.start()
+
+@app.on_event("shutdown")
+def stop_analytics_writer():
+    if analytics.writer: analytics.writer.stop()
+
+@app.on_event("startup")
+async def start_shared_state():
+    """多 worker：定期上报用量/埋点增量，并发现其他 worker 改过的配置"""
+    await shared.start()
+
+@app.on_event("shutdown")
+async def stop_shared_state():
+    await shared.stop()
+
+# 超过阈值的一次性响应按 Accept-Encoding 压缩（br / gzip），流式响应不压缩
+app.add_middleware(CompressionMiddleware)
+
+# 本地场景图变体（python -m app.assets ingest 生成），文件名带内容哈希，长期缓存
+app.mount("/static", ImmutableStaticFiles(directory=ASSET_DIR, check_dir=False), name="static")
 
 # CORS 配置
 app.add_middleware(
@@ -22,6 +100,7 @@ app.add_middleware(
 
 # ========== 配置 ==========
 ADMIN_KEY = os.getenv("ADMIN_KEY", "admin123")  # 开发者仪表盘密钥
+METRICS_KEY = os.getenv("METRICS_KEY", "")  # 设置后 /metrics 需带 ?key=，留空则内网直接抓取
 
 # ========== Pydantic 模型 ==========
 
@@ -34,106 +113,343 @@ class GenerateRequest(BaseModel):
     name: str
     words: list[WordItem]
 
+# 场景格式：compact 为纯文本 + 单词标注（单词表每个响应一份），html 为旧版预渲染格式（兼容）
+SceneFormat = Literal["compact", "html"]
+
+def _with_format(payload, fmt):
+    """含 scenes + words 的结果按需转换为旧版 HTML 格式"""
+    if fmt != "html" or "words" not in payload: return {**payload, "format": "compact"} if "words" in payload else payload
+    out = {k: v for k, v in payload.items() if k != "words"}
+    out["scenes"] = scenes_to_html(payload["scenes"], payload["words"])
+    return out
+
+class WordListCreate(BaseModel):
+    name: str
+    words: list[WordItem]
+    scenes: list[dict] = []
+
 class TrackEvent(BaseModel):
     event: str
     data: Optional[dict] = None
+    ts: Optional[float] = None  # 客户端事件时间（秒），批量上报时使用
+
+class TrackBatch(BaseModel):
+    events: list[TrackEvent]
+
+MAX_TRACK_BATCH = 500
+
+# ========== 认证路由 ==========
+
+@app.post("/auth/register", response_model=UserResponse)
+async def register(user: UserCreate, db: Session = Depends(get_db)):
+    """bcrypt 在专用线程池里计算，不占用事件循环和处理其他请求的线程"""
+    db_user = await create_user(db, user)
+    analytics.track("register", user_id=db_user.id)
+    return db_user
+
+@app.post("/auth/login", response_model=Token)
+async def login(form: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+    user = await authenticate_user(db, form.username, form.password)
+    if not user:
+        raise HTTPException(status_code=401, detail="邮箱或密码错误", headers={"WWW-Authenticate": "Bearer"})
+    analytics.track("login", user_id=user.id)
+    token = create_access_token({"sub": user.email}, timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+    return {"access_token": token, "token_type": "bearer"}
+
+@app.get("/auth/me", response_model=UserResponse)
+def get_me(user: AuthUser = Depends(get_current_user)):
+    return user
+
+# ========== 词表路由 ==========
+
+@app.post("/wordlists")
+def create_word_list(req: WordListCreate, user: Optional[AuthUser] = Depends(get_current_user_optional), db: Session = Depends(get_db)):
+    """保存词表及生成的场景；游客词表返回 access_key，之后凭它读取"""
+    words = [w.model_dump() for w in req.words]
+    result = wordlists.create_word_list(db, user.id if user else None, req.name, words, req.scenes)
+    analytics.track("wordlist_create", user_id=user.id if user else None, is_guest=user is None,
+                    data={"word_count": len(words), "scene_count": len(req.scenes)})
+    return result
+
+@app.get("/wordlists")
+def list_word_lists(cursor: Optional[str] = None, limit: int = 20, user: AuthUser = Depends(get_current_user), db: Session = Depends(get_db)):
+    """当前用户的词表（只含元数据），按创建时间倒序，用 next_cursor 翻页"""
+    try:
+        return wordlists.list_word_lists(db, user.id, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _word_list_or_404(db, list_id, user, key, with_words=False):
+    wl = wordlists.get_word_list(db, list_id, user.id if user else None, key, with_words)
+    if wl is None:
+        raise HTTPException(status_code=404, detail="词表不存在")
+    return wl
+
+@app.get("/wordlists/{list_id}")
+def get_word_list(list_id: int, request: Request, key: Optional[str] = None, user: Optional[AuthUser] = Depends(get_current_user_optional), db: Session = Depends(get_db)):
+    """词表元数据和单词；场景通过 /wordlists/{id}/scenes 分段加载；支持 If-None-Match"""
+    wl = _word_list_or_404(db, list_id, user, key, with_words=True)
+    return etag_response(request, {**wordlists.summary(wl), "words": json.loads(wl.words_json or "[]")})
+
+@app.get("/wordlists/{list_id}/scenes")
+def get_word_list_scenes(list_id: int, request: Request, start: int = 0, limit: int = 50, key: Optional[str] = None, format: SceneFormat = "compact",
+                         user: Optional[AuthUser] = Depends(get_current_user_optional), db: Session = Depends(get_db)):
+    """按顺序分段读取场景，next 为下一段的 start，为空表示已读完；紧凑场景的单词表见 /wordlists/{id}；支持 If-None-Match"""
+    wl = _word_list_or_404(db, list_id, user, key, with_words=format == "html")
+    page = wordlists.get_scenes(db, list_id, start, limit)
+    assets.apply(page["scenes"])
+    if format == "html": page["scenes"] = scenes_to_html(page["scenes"], json.loads(wl.words_json or "[]"))
+    return etag_response(request, page)
+
+@app.delete("/wordlists/{list_id}")
+def delete_word_list(list_id: int, key: Optional[str] = None, user: Optional[AuthUser] = Depends(get_current_user_optional), db: Session = Depends(get_db)):
+    wordlists.delete_word_list(db, _word_list_or_404(db, list_id, user, key))
+    return {"message": "已删除"}
 
 # ========== 文件解析路由 ==========
 
-@app.post("/parse-file")
-async def parse_file(file: UploadFile = File(...)):
-    """解析上传的文件"""
-    analytics.track("file_upload", is_guest=True, data={"filename": file.filename})
-    
-    filename = file.filename.lower()
-    content = await file.read()
-    
+# 请求体直接流式写入临时文件，不用 File(...)；这里补上文档里的表单字段
+UPLOAD_DOC = {"requestBody": {"required": True, "content": {"multipart/form-data": {"schema": {
+    "type": "object", "required": ["file"], "properties": {"file": {"type": "string", "format": "binary"}}}}}}}
+
+async def _receive_upload(request: Request, **data):
     try:
-        if filename.endswith('.txt'):
-            text = content.decode('utf-8', errors='ignore')
-        elif filename.endswith('.pdf'):
-            try:
-                import pypdf
-                from io import BytesIO
-                reader = pypdf.PdfReader(BytesIO(content))
-                text = "\n".join(page.extract_text() or "" for page in reader.pages)
-            except ImportError:
-                raise HTTPException(status_code=500, detail="服务器未安装 pypdf")
-        elif filename.endswith(('.doc', '.docx')):
-            try:
-                from docx import Document
-                from io import BytesIO
-                doc = Document(BytesIO(content))
-                text = "\n".join(p.text for p in doc.paragraphs)
-            except ImportError:
-                raise HTTPException(status_code=500, detail="服务器未安装 python-docx")
-        else:
-            raise HTTPException(status_code=400, detail="不支持的文件格式")
-        
-        return {"text": text, "filename": file.filename}
-    except HTTPException:
-        raise
+        path, ext, filename = await document_parser.receive(request)
+    except ParseError as e:
+        raise HTTPException(status_code=e.status, detail=e.detail)
+    analytics.track("file_upload", is_guest=True, data={"filename": filename, **data})
+    return path, ext, filename
+
+@app.post("/parse-file", openapi_extra=UPLOAD_DOC)
+async def parse_file(request: Request):
+    """解析上传的文件（落盘暂存，在进程池中提取，不阻塞事件循环）"""
+    path, ext, filename = await _receive_upload(request)
+    try:
+        text, info = await document_parser.parse(path, ext)
+        return {"text": text, "filename": filename, **info}
+    except ParseError as e:
+        raise HTTPException(status_code=e.status, detail=e.detail)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"文件解析失败: {str(e)}")
+    finally:
+        document_parser.remove(path)
+
+def _ndjson_words(pieces, background=None):
+    async def ndjson():
+        try:
+            async for item in stream_words(pieces):
+                yield json.dumps(item, ensure_ascii=False) + "\n"
+        except ParseError as e:
+            yield json.dumps({"type": "error", "message": e.detail}, ensure_ascii=False) + "\n"
+        except Exception as e:
+            print(f"Parse words error: {e}")
+            yield json.dumps({"type": "error", "message": f"文件解析失败: {str(e)}"}, ensure_ascii=False) + "\n"
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+                             background=background)
+
+@app.post("/parse-file/words", openapi_extra=UPLOAD_DOC)
+async def parse_file_words(request: Request):
+    """解析上传的文件并提取单词（NDJSON）：PDF 每解析完一段页就推送其中的单词"""
+    path, ext, _ = await _receive_upload(request, words=True)
+    # 客户端提前断开时生成器可能一次都没运行，临时文件由响应结束后的后台任务删除
+    return _ndjson_words(document_parser.iter_text(path, ext), background=BackgroundTask(document_parser.remove, path))
+
+@app.post("/parse-words")
+async def parse_words(request: Request):
+    """粘贴文本提取单词（NDJSON）：请求体为纯文本，解析结果分批推送"""
+    # 响应开始后 StreamingResponse 会占用 receive 监听断开，请求体需在此之前读完
+    length = request.headers.get("content-length")
+    if length and length.isdigit() and int(length) > document_parser.max_bytes:
+        raise HTTPException(status_code=413, detail="文本过大")
+    chunks, size = [], 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > document_parser.max_bytes:
+            raise HTTPException(status_code=413, detail="文本过大")
+        chunks.append(chunk)
+    text = b"".join(chunks).decode("utf-8", errors="ignore")
+
+    async def pieces():
+        yield text, {}
+
+    return _ndjson_words(pieces())
 
 # ========== AI 生成路由 ==========
 
+def _too_many(e: AdmissionRejected):
+    return HTTPException(status_code=429, detail=e.detail, headers={"Retry-After": str(e.retry_after)})
+
+def _check_rate(request: Request, user: Optional[AuthUser], words: list):
+    """按客户端（注册用户按用户，游客按 IP）扣减单词令牌"""
+    try:
+        admission.check_rate(user.id if user else None, client_ip(request), len(words))
+    except AdmissionRejected as e:
+        raise _too_many(e)
+
+def _refund_rate(request: Request, user: Optional[AuthUser], words: list):
+    admission.refund_rate(user.id if user else None, client_ip(request), len(words))
+
+async def _admit(request: Request, user: Optional[AuthUser], words: list):
+    """限流 + 取得生成名额；返回值交给 admission.release。没取得名额时退回令牌"""
+    _check_rate(request, user, words)
+    try:
+        return await admission.acquire()
+    except AdmissionRejected as e:
+        _refund_rate(request, user, words)
+        raise _too_many(e)
+
 @app.post("/generate")
-def generate_scenes(req: GenerateRequest):
-    """AI 生成记忆宫殿场景（无需登录）"""
+async def generate_scenes(req: GenerateRequest, request: Request, format: SceneFormat = "compact",
+                          user: Optional[AuthUser] = Depends(get_current_user_optional)):
+    """AI 生成记忆宫殿场景（无需登录）；format=html 返回旧版预渲染 HTML"""
     words = [w.model_dump() for w in req.words]
     
     # 日志：前端传入的单词数
     print(f"[Generate] 前端传入单词数: {len(words)}")
     print(f"[Generate] 前10个单词: {[w['word'] for w in words[:10]]}")
     
-    # 限制最多 200 词
-    MAX_WORDS = 200
-    remaining_words = []
-    if len(words) > MAX_WORDS:
-        remaining_words = words[MAX_WORDS:]
-        words = words[:MAX_WORDS]
-        print(f"[Generate] 超过200词，截取前200，剩余: {len(remaining_words)}")
-    
-    print(f"[Generate] 发送给AI的单词数: {len(words)}")
-    
+    started = await _admit(request, user, words)
     analytics.track("generate_scene", is_guest=True, data={"word_count": len(words)})
     
     try:
-        # AI 自动决定场景数量和内容
-        result = ai_service.generate_scene(words, provider=ai_config.preferred_provider)
-        
-        # 处理返回格式，支持单场景和多场景
-        if "scenes" in result:
-            scenes = result["scenes"]
-        else:
-            result["id"] = 1
-            scenes = [result]
+        # 相同请求正在生成（任何 worker 上）时直接等它的结果，不重复调用提供商
+        job_id, owned = await job_queue.join_or_start(req.name, words)
+        if not owned:
+            admission.release(None)  # 等待期间不占生成名额
+            started = None
+            print(f"[Generate] 合并到进行中的相同请求 {job_id}")
+            job = await job_queue.wait(job_id)
+            if job is None or job.status != "done": raise RuntimeError(job.error if job else "任务不存在")
+            return FastJSONResponse(_with_format(json.loads(job.result_json), format))
+
+        try:
+            # AI 自动决定场景数量和内容（大词表在服务端分块并发生成）
+            result = await ai_service.generate_scene(words, provider=ai_config.preferred_provider)
+        except BaseException as e:
+            await job_queue.finish(job_id, error=str(e) or "已取消")
+            raise
+        scenes = result["scenes"]
         
         # 日志：统计AI返回的场景信息
         print(f"[Generate] AI返回场景数: {len(scenes)}")
         for i, s in enumerate(scenes):
-            zh_content = s.get('zh', {}).get('content', '')
-            word_count_in_scene = zh_content.count('word-highlight')
+            word_count_in_scene = sum(len(p['marks'].get('en', [])) for p in s.get('paragraphs', []))
             print(f"[Generate] 场景{i+1} 标题: {s.get('zh', {}).get('title', '?')}, 包含单词数: {word_count_in_scene}")
+        if result.get("reuse"):
+            print(f"[Generate] 片段库复用: {result['reuse']['from_store']}/{result['reuse']['words']} 词")
+        if result.get("missing"):
+            print(f"[Generate] ⚠️ 未覆盖单词: {len(result['missing'])}")
         
-        response = {
-            "message": f"成功生成 {len(scenes)} 个记忆场景",
-            "scenes": scenes,
-            "word_count": len(words)
-        }
-        
-        # 如果有剩余单词，返回给前端缓存
-        if remaining_words:
-            response["remaining_words"] = remaining_words
-            response["message"] += f"（剩余 {len(remaining_words)} 词待生成）"
-        
-        return response
+        response = payload_of(result, len(words))
+        await job_queue.finish(job_id, response)
+        return FastJSONResponse(_with_format(response, format))
     except Exception as e:
         import traceback
         print(f"Generate error: {e}")
         print(traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"生成失败: {str(e)}")
+    finally:
+        if started is not None: admission.release(started)
+
+@app.post("/generate/stream")
+async def generate_scenes_stream(req: GenerateRequest, request: Request, format: SceneFormat = "compact",
+                                 user: Optional[AuthUser] = Depends(get_current_user_optional)):
+    """流式生成（NDJSON）：每个场景对象一生成完就推送，无需等待完整 JSON；单词表在 meta 中
+
+    名额在返回响应之前取得（排满时直接 429），流结束或客户端断开时释放；
+    相同请求正在生成时跟随它的结果（同一 worker 实时推送，其他 worker 结束后一次推送），不占名额
+    """
+    words = [w.model_dump() for w in req.words]
+    print(f"[Generate] 流式生成，前端传入单词数: {len(words)}")
+    started, released = await _admit(request, user, words), False
+    analytics.track("generate_scene_stream", is_guest=True, data={"word_count": len(words)})
+
+    def release():
+        # 生成器的 finally 和响应结束后的后台任务都会调用（客户端在流开始前断开时生成器不会运行），只释放一次
+        nonlocal released
+        if not released:
+            released = True
+            admission.release(started)
+
+    try:
+        job_id, owned = await job_queue.join_or_start(req.name, words)
+    except Exception:
+        release()
+        raise
+    if not owned:
+        released = True
+        admission.release(None)
+        print(f"[Generate] 流式请求合并到进行中的相同请求 {job_id}")
+    items = ai_service.generate_scene_stream(words, provider=ai_config.preferred_provider) if owned else None
+    streaming = False
+
+    async def cleanup():
+        release()
+        # 客户端在流开始前断开：生成器没有运行，登记的任务在这里作废
+        if owned and not streaming: await job_queue.finish(job_id, error="已取消")
+
+    async def ndjson():
+        nonlocal streaming
+        streaming = True
+        try:
+            table = []
+            async for item in job_queue.stream(job_id, owned, items):
+                if item["type"] == "meta":
+                    table = item["words"]
+                    item = {**item, "format": format}  # 条目与跟随的相同请求共享，不能原地修改
+                    if format == "html": item = {k: v for k, v in item.items() if k != "words"}
+                elif item["type"] == "scene" and format == "html":
+                    item = {**item, "scene": to_html(item["scene"], table)}
+                yield json.dumps(item, ensure_ascii=False) + "\n"
+        except Exception as e:
+            print(f"Generate stream error: {e}")
+            yield json.dumps({"type": "error", "message": f"生成失败: {str(e)}"}, ensure_ascii=False) + "\n"
+        finally:
+            release()
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+                             background=BackgroundTask(cleanup))
+
+# ========== 后台生成任务 ==========
+
+@app.post("/jobs")
+async def submit_generate_job(req: GenerateRequest, request: Request, user: Optional[AuthUser] = Depends(get_current_user_optional)):
+    """提交后台生成任务，立即返回 job_id；相同的进行中请求合并为同一个任务（并发由任务 worker 数限制，这里只限流）"""
+    words = [w.model_dump() for w in req.words]
+    _check_rate(request, user, words)
+    try:
+        job_id, deduplicated = await job_queue.submit(req.name, words)
+    except JobQueueFull:
+        _refund_rate(request, user, words)
+        raise HTTPException(status_code=503, detail="任务队列已满，请稍后再试")
+    analytics.track("generate_job_submit", is_guest=True, data={"word_count": len(words), "deduplicated": deduplicated})
+    return {"job_id": job_id, "status": "queued", "deduplicated": deduplicated}
+
+@app.get("/jobs/{job_id}")
+async def get_generate_job(job_id: str, request: Request, wait: float = 0, format: SceneFormat = "compact"):
+    """查询任务状态和结果；wait>0 时长轮询（最多 60 秒）直到任务结束；结束后的结果支持 If-None-Match"""
+    job = await job_queue.get(job_id, wait=min(max(wait, 0), 60))
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    if "result" in job: job["result"] = _with_format(job["result"], format)
+    return etag_response(request, job) if job["status"] in TERMINAL else FastJSONResponse(job)
+
+@app.get("/jobs/{job_id}/events")
+async def subscribe_generate_job(job_id: str, format: SceneFormat = "compact"):
+    """订阅任务（NDJSON）：先推送当前状态，任务结束时推送最终结果"""
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+
+    async def ndjson():
+        current = job
+        while True:
+            if "result" in current: current["result"] = _with_format(current["result"], format)
+            yield json.dumps(current, ensure_ascii=False) + "\n"
+            if current["status"] in TERMINAL: break
+            current = await job_queue.get(job_id, wait=15)
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 # ========== 埋点路由 ==========
 
@@ -147,6 +463,18 @@ def track_event(event: TrackEvent):
     )
     return {"status": "ok"}
 
+@app.post("/track/batch")
+def track_events_batch(batch: TrackBatch):
+    """批量埋点：前端缓冲一段时间的事件后一次上报"""
+    if len(batch.events) > MAX_TRACK_BATCH:
+        raise HTTPException(status_code=413, detail=f"单批最多 {MAX_TRACK_BATCH} 个事件")
+    now = time.time()
+    for e in batch.events:
+        # 只接受最近一天内、不晚于服务器时间的客户端时间戳
+        ts = e.ts if e.ts and now - 86400 < e.ts <= now + 60 else now
+        analytics.track(e.event, is_guest=True, data=e.data or {}, timestamp=min(ts, now))
+    return {"status": "ok", "accepted": len(batch.events)}
+
 # ========== 开发者仪表盘路由 ==========
 
 @app.get("/admin/stats")
@@ -158,6 +486,20 @@ def get_admin_stats(key: str):
     return {
         "analytics": analytics.get_stats(),
         "ai_usage": ai_service.get_usage_stats(),
+        "cache": ai_service.cache.stats(),
+        "fragments": ai_service.fragments.stats(),
+        "failover": ai_service.chain.stats(),
+        "completeness": ai_service.completeness.to_dict(),
+        "admission": admission.stats(),
+        "http": ai_service.pools.stats(),
+        "sdk": ai_service.sdk_stats(),
+        "compression": compression_stats.to_dict(),
+        "assets": assets.stats(),
+        "jobs": job_queue.stats(),
+        "parsing": document_parser.stats(),
+        "auth": {"hasher": password_hasher.stats(), "token_cache": token_cache.stats()},
+        "analytics_writer": analytics.writer.stats() if analytics.writer else None,
+        "shared": shared.stats(),
         "available_providers": ai_service.get_available_providers(),
         "ai_config": ai_config.to_dict()
     }
@@ -165,6 +507,9 @@ def get_admin_stats(key: str):
 class AIConfigUpdate(BaseModel):
     preferred_provider: Optional[str] = None
     temperature: Optional[float] = None
+    chunk_size: Optional[int] = None
+    max_parallel: Optional[int] = None
+    spread_providers: Optional[bool] = None
 
 class APIKeyUpdate(BaseModel):
     provider: str
@@ -225,6 +570,43 @@ def delete_api_key(key: str, provider: str):
         "available_providers": ai_service.get_available_providers()
     }
 
+@app.delete("/admin/cache")
+def clear_generation_cache(key: str):
+    """清空生成结果缓存（需要管理员密钥）"""
+    if key != ADMIN_KEY:
+        raise HTTPException(status_code=403, detail="无权访问")
+    
+    removed = ai_service.cache.invalidate()
+    shared.update("cache", {"cleared_at": time.time()})  # 其他 worker 清掉各自的内存层
+    analytics.track("admin_cache_clear", data={"removed": removed})
+    
+    return {"message": f"已清空 {removed} 条缓存", "cache": ai_service.cache.stats()}
+
+# ========== 监控指标 ==========
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics(key: str = ""):
+    """Prometheus 文本格式：LLM 调用次数、错误、token、费用和延迟直方图，以及缓存与任务队列计数"""
+    if METRICS_KEY and key != METRICS_KEY:
+        raise HTTPException(status_code=403, detail="无权访问")
+    c, j = ai_service.cache.stats(), job_queue.stats()
+    lines = ["# TYPE memory_palace_http_requests_total counter"]
+    for p, h in ai_service.pools.stats()["providers"].items():
+        lines.append(f'memory_palace_http_requests_total{{provider="{p}",connection="reused"}} {h["reused"]}')
+        lines.append(f'memory_palace_http_requests_total{{provider="{p}",connection="new"}} {h["new_connections"]}')
+    lines += [
+        "# TYPE memory_palace_cache_lookups_total counter",
+        f'memory_palace_cache_lookups_total{{result="hit_memory"}} {c["hits_memory"]}',
+        f'memory_palace_cache_lookups_total{{result="hit_db"}} {c["hits_db"]}',
+        f'memory_palace_cache_lookups_total{{result="miss"}} {c["misses"]}',
+        "# TYPE memory_palace_jobs_queued gauge",
+        f"memory_palace_jobs_queued {j['queued']}",
+        "# TYPE memory_palace_jobs_total counter",
+        f'memory_palace_jobs_total{{status="completed"}} {j["completed"]}',
+        f'memory_palace_jobs_total{{status="failed"}} {j["failed"]}',
+    ]
+    return ai_service.usage_metrics().prometheus() + admission.prometheus() + "\n".join(lines) + "\n"
+
 # ========== 健康检查 ==========
 
 @app.get("/health")
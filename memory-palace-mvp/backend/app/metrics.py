@@ -0,0 +1,151 @@
+"""LLM 调用指标 - 按 提供商/模型 聚合的固定内存计数器与延迟直方图"""
+import math
+from collections import defaultdict, deque
+
+# 延迟分桶上界（秒），最后一个桶兜底
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120, math.inf)
+RECENT_CALLS = 20  # 仪表盘“最近调用”保留条数
+
+
+class Histogram:
+    """固定分桶直方图：observe O(桶数)，分位数在桶内线性插值估算"""
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, v):
+        self.sum += v
+        self.count += 1
+        for i, b in enumerate(self.buckets):
+            if v <= b:
+                self.counts[i] += 1
+                return
+
+    def merge(self, other):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.sum += other.sum
+        self.count += other.count
+
+    def quantile(self, q):
+        if not self.count: return 0.0
+        rank, seen = q * self.count, 0
+        for i, n in enumerate(self.counts):
+            if seen + n >= rank and n:
+                lo = self.buckets[i-1] if i else 0.0
+                hi = self.buckets[i] if not math.isinf(self.buckets[i]) else lo * 2 or 1.0
+                return round(lo + (hi - lo) * (rank - seen) / n, 3)
+            seen += n
+        return self.buckets[-2]
+
+    def to_dict(self):
+        return {"count": self.count, "avg": round(self.sum / self.count, 3) if self.count else 0.0,
+                "p50": self.quantile(0.5), "p95": self.quantile(0.95), "p99": self.quantile(0.99)}
+
+
+class CallStats:
+    __slots__ = ("calls", "errors", "input_tokens", "cached_input_tokens", "output_tokens", "cost", "latency")
+
+    def __init__(self):
+        self.calls = self.errors = 0
+        self.input_tokens = self.cached_input_tokens = self.output_tokens = 0
+        self.cost = 0.0
+        self.latency = Histogram()
+
+
+COUNTER_FIELDS = ("calls", "errors", "input_tokens", "cached_input_tokens", "output_tokens", "cost")
+
+
+class ProviderMetrics:
+    def __init__(self):
+        self.by_model = defaultdict(CallStats)  # (provider, model) -> CallStats
+        self.recent = deque(maxlen=RECENT_CALLS)
+
+    def counters(self):
+        """展开成 {"provider|model|字段": 值}，用于跨 worker 累加（直方图按桶展开）"""
+        out = {}
+        for (p, m), s in list(self.by_model.items()):
+            for f in COUNTER_FIELDS: out[f"{p}|{m}|{f}"] = getattr(s, f)
+            for i, n in enumerate(s.latency.counts): out[f"{p}|{m}|lat{i}"] = n
+            out[f"{p}|{m}|lat_sum"] = s.latency.sum
+        return out
+
+    @classmethod
+    def from_counters(cls, counters, recent=()):
+        pm = cls()
+        for k, v in counters.items():
+            p, m, f = k.rsplit("|", 2)
+            s = pm.by_model[(p, m)]
+            if f == "lat_sum": s.latency.sum = v
+            elif f.startswith("lat"):
+                s.latency.counts[int(f[3:])] = int(v)
+                s.latency.count += int(v)
+            else: setattr(s, f, v if f == "cost" else int(v))
+        pm.recent.extend(recent)
+        return pm
+
+    def add_usage(self, u):
+        """记录一次成功调用的 token 与费用（TokenUsage）"""
+        s = self.by_model[(u.provider, u.model)]
+        s.input_tokens += u.input_tokens
+        s.cached_input_tokens += u.cached_input_tokens
+        s.output_tokens += u.output_tokens
+        s.cost += u.cost
+        self.recent.append({"provider": u.provider, "model": u.model, "input": u.input_tokens + u.cached_input_tokens,
+                            "output": u.output_tokens, "cost": u.cost, "time": u.timestamp})
+
+    def observe(self, provider, model, latency, error=False):
+        """记录一次调用的结果与耗时（成功或失败都记）"""
+        s = self.by_model[(provider, model)]
+        s.latency.observe(latency)
+        if error: s.errors += 1
+        else: s.calls += 1
+
+    def stats(self):
+        rows, tot, by_provider = [], defaultdict(float), {}
+        for (p, m), s in sorted(self.by_model.items()):
+            attempts = s.calls + s.errors
+            bp = by_provider.setdefault(p, {"calls": 0, "errors": 0, "cost": 0.0, "latency": Histogram()})
+            bp["calls"] += s.calls; bp["errors"] += s.errors; bp["cost"] += s.cost
+            bp["latency"].merge(s.latency)
+            rows.append({"provider": p, "model": m, "calls": s.calls, "errors": s.errors,
+                         "error_rate": round(s.errors / attempts, 4) if attempts else 0.0,
+                         "uncached_input_tokens": s.input_tokens, "cached_input_tokens": s.cached_input_tokens,
+                         "output_tokens": s.output_tokens, "cost": round(s.cost, 6), "latency": s.latency.to_dict()})
+            for k in ("calls", "errors", "input_tokens", "cached_input_tokens", "output_tokens", "cost"): tot[k] += getattr(s, k)
+        for bp in by_provider.values(): bp["latency"] = bp["latency"].to_dict()
+        i, c, o = int(tot["input_tokens"]), int(tot["cached_input_tokens"]), int(tot["output_tokens"])
+        # 每个量只有一个键；total_input_tokens = uncached_input_tokens + cached_input_tokens
+        return {"total_calls": int(tot["calls"]), "total_errors": int(tot["errors"]), "total_cost_usd": round(tot["cost"], 6),
+                "total_input_tokens": i + c, "uncached_input_tokens": i, "cached_input_tokens": c, "total_output_tokens": o,
+                "cache_hit_ratio": round(c / (i + c), 4) if i + c else 0.0,
+                "by_provider": by_provider, "by_model": rows, "recent": list(self.recent)}
+
+    def prometheus(self, prefix="memory_palace_llm"):
+        """Prometheus 文本格式"""
+        out = []
+        def family(name, kind, help_):
+            out.append(f"# HELP {prefix}_{name} {help_}")
+            out.append(f"# TYPE {prefix}_{name} {kind}")
+        items = sorted(self.by_model.items())
+        family("calls_total", "counter", "Successful LLM calls")
+        for (p, m), s in items: out.append(f'{prefix}_calls_total{{provider="{p}",model="{m}"}} {s.calls}')
+        family("errors_total", "counter", "Failed LLM calls")
+        for (p, m), s in items: out.append(f'{prefix}_errors_total{{provider="{p}",model="{m}"}} {s.errors}')
+        family("tokens_total", "counter", "LLM tokens by type")
+        for (p, m), s in items:
+            for kind, v in (("input", s.input_tokens), ("cached_input", s.cached_input_tokens), ("output", s.output_tokens)):
+                out.append(f'{prefix}_tokens_total{{provider="{p}",model="{m}",type="{kind}"}} {v}')
+        family("cost_total", "counter", "Estimated LLM cost")
+        for (p, m), s in items: out.append(f'{prefix}_cost_total{{provider="{p}",model="{m}"}} {s.cost:.6f}')
+        family("latency_seconds", "histogram", "LLM call latency in seconds")
+        for (p, m), s in items:
+            acc = 0
+            for b, n in zip(s.latency.buckets, s.latency.counts):
+                acc += n
+                le = "+Inf" if math.isinf(b) else f"{b:g}"
+                out.append(f'{prefix}_latency_seconds_bucket{{provider="{p}",model="{m}",le="{le}"}} {acc}')
+            out.append(f'{prefix}_latency_seconds_sum{{provider="{p}",model="{m}"}} {s.latency.sum:.3f}')
+            out.append(f'{prefix}_latency_seconds_count{{provider="{p}",model="{m}"}} {s.latency.count}')
+        return "\n".join(out) + "\n"
@@ -1,6 +1,6 @@
 """数据模型"""
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Boolean, Float, Index
+from sqlalchemy.orm import relationship, deferred
 from datetime import datetime
 from .database import Base
 
@@ -19,12 +19,18 @@ class User(Base):
 class WordList(Base):
     """单词列表"""
     __tablename__ = "word_lists"
+    __table_args__ = (Index("ix_word_lists_user_created", "user_id", "created_at"),)  # 用户词表按时间分页
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     name = Column(String(255))
-    words_json = Column(Text)  # JSON格式存储单词
+    words_json = deferred(Column(Text))  # JSON格式存储单词（延迟加载，列表页不读取）
+    word_count = Column(Integer, default=0)
+    scene_count = Column(Integer, default=0)
+    access_key = Column(String(32), nullable=True)  # 游客词表的访问密钥（无 user_id 时凭它读取）
     created_at = Column(DateTime, default=datetime.utcnow)
+    cache_key = Column(String(64), index=True, nullable=True)  # 生成缓存条目（user_id 为空）
+    prompt_version = Column(String(16), nullable=True)
     
     owner = relationship("User", back_populates="word_lists")
     scenes = relationship("Scene", back_populates="word_list")
@@ -32,11 +38,88 @@ class WordList(Base):
 class Scene(Base):
     """AI生成的场景"""
     __tablename__ = "scenes"
+    __table_args__ = (Index("ix_scenes_list_order", "word_list_id", "scene_order"),)
     
     id = Column(Integer, primary_key=True, index=True)
     word_list_id = Column(Integer, ForeignKey("word_lists.id"))
     scene_order = Column(Integer)  # 场景顺序
-    scene_data_json = Column(Text)  # 完整场景数据JSON
+    scene_data_json = deferred(Column(Text))  # 完整场景数据JSON（延迟加载）
     created_at = Column(DateTime, default=datetime.utcnow)
     
     word_list = relationship("WordList", back_populates="scenes")
+
+class StoryFragment(Base):
+    """已生成并校验过的故事段落，按单词复用"""
+    __tablename__ = "story_fragments"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    scene_id = Column(Integer)  # 所属预设场景 1-50
+    prompt_version = Column(String(16), index=True)
+    content_key = Column(String(64), unique=True)  # 段落内容哈希，避免重复存储
+    paragraph_json = Column(Text)  # {"zh", "en", "zh_pure"}
+    words_json = Column(Text)  # 段落覆盖的单词（小写）
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    words = relationship("FragmentWord", back_populates="fragment")
+
+class FragmentWord(Base):
+    """词义 -> 段落 倒排索引；同一个词不同词性/释义（bank 河岸 / 银行）是不同的 sense"""
+    __tablename__ = "fragment_words"
+    
+    word = Column(String(100), primary_key=True)
+    sense = Column(String(64), index=True)  # sense_key(word, pos, meaning)；旧库的行为空，不再命中，按 FRAGMENT_TTL_DAYS 淘汰
+    fragment_id = Column(Integer, ForeignKey("story_fragments.id"), primary_key=True)
+    
+    fragment = relationship("StoryFragment", back_populates="words")
+
+class GenerationJob(Base):
+    """后台生成任务；/generate、/generate/stream 也登记在这里，用于跨 worker 合并相同请求"""
+    __tablename__ = "generation_jobs"
+    
+    id = Column(String(32), primary_key=True)
+    dedup_key = Column(String(64), index=True)  # 与生成缓存同一个 key，相同请求共享一次调用
+    active_key = Column(String(64), unique=True, index=True, nullable=True)  # 进行中 = dedup_key，结束后清空；唯一约束跨 worker 合并
+    status = Column(String(16), index=True, default="queued")  # queued / running / done / failed
+    owner = Column(String(100), nullable=True)  # 持有租约的 worker（主机名:pid）
+    lease_until = Column(Float, nullable=True)  # 租约到期时间，过期后其他 worker 可接手
+    name = Column(String(255))
+    request_json = Column(Text)
+    result_json = Column(Text, nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class AnalyticsEvent(Base):
+    """埋点事件，由后台写线程批量追加"""
+    __tablename__ = "analytics_events"
+    
+    id = Column(Integer, primary_key=True)
+    name = Column(String(100), index=True)
+    user_id = Column(Integer, nullable=True)
+    is_guest = Column(Boolean, default=False)
+    data_json = Column(Text)
+    timestamp = Column(Float, index=True)
+
+class SharedValue(Base):
+    """多个 worker / 节点共享的配置项，version 每次写入加一，各 worker 轮询它发现变更"""
+    __tablename__ = "shared_values"
+    
+    key = Column(String(100), primary_key=True)
+    value_json = Column(Text)
+    version = Column(Integer, default=1)
+    updated_at = Column(Float)
+
+class AnalyticsUser(Base):
+    """出现过埋点事件的注册用户，写线程随事件一起插入；新插入的行数累加成独立用户数"""
+    __tablename__ = "analytics_users"
+    
+    user_id = Column(Integer, primary_key=True, autoincrement=False)
+    first_seen = Column(Float)
+
+class SharedCounter(Base):
+    """跨 worker 累加的计数器：各 worker 定期把本地增量加上去"""
+    __tablename__ = "shared_counters"
+    
+    ns = Column(String(32), primary_key=True)
+    key = Column(String(200), primary_key=True)
+    value = Column(Float, default=0)
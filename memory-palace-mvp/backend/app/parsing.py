@@ -0,0 +1,212 @@
+"""上传文档解析 - 落盘暂存 + 进程池提取，事件循环不做任何解析工作
+
+multipart 请求体边收边解析，文件部分直接写入临时文件（只落盘一次，Content-Length 或实际字节超过上限立即 413），
+PDF 按页段拆成多个任务并行提取，docx 在单个任务里提取；总耗时和页数都有上限，超时的页段在页与页之间自行停止，
+单页卡住超过兜底超时则杀掉它所在进程池的子进程；同一进程池里其他上传的任务因此失败时，在新进程池上重试一次。
+"""
+import asyncio
+import importlib.util
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+try:
+    import python_multipart as multipart
+    from python_multipart.exceptions import FormParserError
+    from python_multipart.multipart import parse_options_header
+except ModuleNotFoundError:  # python-multipart < 0.0.13
+    import multipart
+    from multipart.exceptions import FormParserError
+    from multipart.multipart import parse_options_header
+
+MULTIPART_OVERHEAD = 64 * 1024  # 边界和各部分头部，Content-Length 比文件本身略大
+
+
+class ParseError(Exception):
+    def __init__(self, status, detail):
+        self.status, self.detail = status, detail
+        super().__init__(detail)
+
+
+# ---------- 子进程中执行（顶层函数，可 pickle） ----------
+def _pdf_page_count(path):
+    import pypdf
+    return len(pypdf.PdfReader(path).pages)
+
+
+def _pdf_pages(path, start, stop, deadline):
+    """提取 [start, stop) 页；超过 deadline 后不再处理剩余页"""
+    import pypdf
+    reader, out = pypdf.PdfReader(path), []
+    for i in range(start, stop):
+        if time.time() > deadline: break
+        out.append(reader.pages[i].extract_text() or "")
+    return out
+
+
+def _docx_text(path):
+    from docx import Document
+    return "\n".join(p.text for p in Document(path).paragraphs)
+
+
+def _txt_text(path):
+    with open(path, "rb") as f:
+        return f.read().decode("utf-8", errors="ignore")
+
+
+class DocumentParser:
+    def __init__(self, workers=None, max_bytes=None, max_pages=None, timeout=None, pages_per_task=None):
+        self.workers = workers or int(os.getenv("PARSE_WORKERS", str(min(4, os.cpu_count() or 1))))
+        self.max_bytes = max_bytes or int(os.getenv("PARSE_MAX_BYTES", str(20 * 1024 * 1024)))
+        self.max_pages = max_pages or int(os.getenv("PARSE_MAX_PAGES", "500"))
+        self.timeout = timeout or float(os.getenv("PARSE_TIMEOUT", "60"))
+        self.pages_per_task = pages_per_task or int(os.getenv("PARSE_PAGES_PER_TASK", "20"))
+        self.pool = None
+        self.files = self.pages = self.rejected = self.timeouts = self.retried = 0
+
+    def _executor(self):
+        if self.pool is None: self.pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self.pool
+
+    def shutdown(self, kill=False):
+        if self.pool is not None:
+            pool, self.pool = self.pool, None
+            if kill:  # 子进程里的任务无法取消，只能杀掉；之后的请求使用新的进程池
+                for p in list((getattr(pool, "_processes", None) or {}).values()): p.kill()
+            # 杀掉时不取消排队的任务：它们以 BrokenProcessPool 结束，由 _run 在新进程池上重试（取消则会变成 CancelledError）
+            pool.shutdown(wait=False, cancel_futures=not kill)
+
+    async def _run(self, fn, *args, deadline):
+        """在进程池中执行 fn。外层兜底超时比 deadline 多留 5 秒：到这里说明任务卡在单页/单个文件里，杀掉它所在的进程池；
+        进程池被回收（其他上传的任务卡住）或子进程意外退出时，还没到 deadline 的任务在新进程池上重试一次"""
+        loop = asyncio.get_running_loop()
+        for retry in (True, False):
+            pool = self._executor()
+            try: return await asyncio.wait_for(loop.run_in_executor(pool, fn, *args), timeout=max(0.1, deadline + 5 - time.time()))
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                if self.pool is pool:  # 已经被回收的话，卡住的子进程已随之被杀
+                    self.shutdown(kill=True)
+                    print("[Parse] Task stuck past deadline, process pool recycled")
+                raise ParseError(504, "文件解析超时")
+            except BrokenProcessPool:
+                if self.pool is pool: self.shutdown()  # 不是主动回收的：子进程意外退出，池已不可用
+                if time.time() > deadline: raise ParseError(504, "文件解析超时")
+                if not retry: raise
+                self.retried += 1
+                print(f"[Parse] Process pool broken, retrying {fn.__name__} on a new pool")
+
+    # ---------- 接收 ----------
+    def _too_large(self):
+        self.rejected += 1
+        return ParseError(413, f"文件超过 {self.max_bytes // (1024 * 1024)}MB 上限")
+
+    async def receive(self, request, field="file"):
+        """从 multipart 请求体中把 field 文件直接写入临时文件，返回 (路径, 扩展名, 文件名)；之后交给 iter_text，
+        由调用方 remove。不经过 Starlette 的表单解析（它会先把整个请求体另存一份），超过 max_bytes 立即中止"""
+        length = request.headers.get("content-length")
+        if length and length.isdigit() and int(length) > self.max_bytes + MULTIPART_OVERHEAD: raise self._too_large()
+        ctype, params = parse_options_header(request.headers.get("content-type", ""))
+        if ctype != b"multipart/form-data" or b"boundary" not in params: raise ParseError(400, "请以 multipart/form-data 上传文件")
+        part = {"header": b"", "value": b"", "disposition": b"", "target": False}
+        upload = {"path": None, "ext": None, "name": None, "size": 0, "pending": []}
+
+        def on_header_end():
+            if part["header"].lower() == b"content-disposition": part["disposition"] = part["value"]
+            part["header"] = part["value"] = b""
+
+        def on_headers_finished():
+            _, opts = parse_options_header(part["disposition"])
+            part["target"] = opts.get(b"name") == field.encode() and b"filename" in opts and upload["path"] is None
+            if not part["target"]: return
+            name = opts[b"filename"].decode("utf-8", errors="replace")
+            ext = os.path.splitext(name.lower())[1]
+            if ext not in (".txt", ".pdf", ".doc", ".docx"): raise ParseError(400, "不支持的文件格式")
+            fd, upload["path"] = tempfile.mkstemp(prefix="upload-", suffix=ext)
+            os.close(fd)
+            upload["ext"], upload["name"] = ext, name
+
+        def on_part_data(data, start, end):
+            if not part["target"]: return
+            upload["size"] += end - start
+            if upload["size"] > self.max_bytes: raise self._too_large()
+            upload["pending"].append(data[start:end])
+
+        def on_part_begin():
+            part.update(disposition=b"", target=False)
+
+        callbacks = {"on_part_begin": on_part_begin, "on_part_data": on_part_data,
+                     "on_header_field": lambda d, s, e: part.update(header=part["header"] + d[s:e]),
+                     "on_header_value": lambda d, s, e: part.update(value=part["value"] + d[s:e]),
+                     "on_header_end": on_header_end, "on_headers_finished": on_headers_finished}
+        parser, f = multipart.MultipartParser(params[b"boundary"], callbacks), None
+        try:
+            async for chunk in request.stream():
+                parser.write(chunk)
+                if upload["pending"]:
+                    if f is None: f = open(upload["path"], "wb")
+                    await asyncio.to_thread(f.writelines, upload["pending"])
+                    upload["pending"].clear()
+            parser.finalize()
+            if upload["path"] is None: raise ParseError(400, "缺少上传文件")
+        except BaseException as e:
+            if f is not None: f.close()
+            self.remove(upload["path"])
+            if isinstance(e, FormParserError): raise ParseError(400, "上传格式错误") from e
+            raise
+        if f is not None: f.close()
+        return upload["path"], upload["ext"], upload["name"]
+
+    @staticmethod
+    def remove(path):
+        if path:
+            try: os.unlink(path)
+            except FileNotFoundError: pass
+
+    # ---------- 提取 ----------
+    async def _pdf(self, path, deadline):
+        if importlib.util.find_spec("pypdf") is None: raise ParseError(500, "服务器未安装 pypdf")
+        total = await self._run(_pdf_page_count, path, deadline=deadline)
+        n, step = min(total, self.max_pages), self.pages_per_task
+        # 所有页段同时提交给进程池，按页序逐段产出
+        tasks = [asyncio.ensure_future(self._run(_pdf_pages, path, s, min(s + step, n), deadline, deadline=deadline)) for s in range(0, n, step)]
+        parsed = 0
+        try:
+            for t in tasks:
+                pages = await t
+                parsed += len(pages)
+                self.pages += len(pages)
+                yield "\n".join(pages), {"pages": total, "pages_parsed": parsed, "truncated": parsed < total}
+        finally:
+            for t in tasks: t.cancel()
+        if parsed < n: self.timeouts += 1  # 到达 deadline，部分页未解析
+        if not tasks: yield "", {"pages": total, "pages_parsed": 0, "truncated": total > 0}
+
+    async def _single(self, path, ext, deadline):
+        if ext == ".txt": return await asyncio.to_thread(_txt_text, path)
+        if importlib.util.find_spec("docx") is None: raise ParseError(500, "服务器未安装 python-docx")
+        return await self._run(_docx_text, path, deadline=deadline)
+
+    async def iter_text(self, path, ext):
+        """逐段产出 (文本, 进度)：PDF 每个页段一段，其余格式整体一段；PDF 进度含总页数、已解析页数、是否截断"""
+        deadline = time.time() + self.timeout
+        if ext == ".pdf":
+            async for item in self._pdf(path, deadline): yield item
+        else:
+            yield await self._single(path, ext, deadline), {}
+        self.files += 1
+
+    async def parse(self, path, ext):
+        """返回 (全文, 附加信息)"""
+        texts, info = [], {}
+        async for text, info in self.iter_text(path, ext): texts.append(text)
+        return "\n".join(texts), info
+
+    def stats(self):
+        return {"workers": self.workers, "max_bytes": self.max_bytes, "max_pages": self.max_pages, "timeout": self.timeout,
+                "files": self.files, "pages": self.pages, "rejected": self.rejected, "timeouts": self.timeouts, "retried": self.retried}
+
+
+document_parser = DocumentParser()
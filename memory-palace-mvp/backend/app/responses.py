@@ -0,0 +1,131 @@
+"""响应序列化与压缩 - orjson 编码、gzip/brotli 协商压缩、ETag 条件请求
+
+- FastJSONResponse：用 orjson 编码（比标准库 json 快数倍）；
+  大响应的路由直接返回它，跳过 FastAPI 的 jsonable_encoder 逐个遍历；
+- CompressionMiddleware：按 Accept-Encoding 选 br 或 gzip，只压缩超过阈值的一次性响应，
+  NDJSON 等流式响应原样透传（压缩器会攒数据，破坏逐条推送）；
+- etag_response：按响应内容算 ETag，If-None-Match 命中时返回 304，不重发场景。
+orjson、brotli 都在 requirements.txt 里；环境里缺了也能跑：退回 json.dumps，只协商 gzip。
+"""
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import JSONResponse, Response
+
+try:
+    import orjson
+except ImportError:  # 兜底：退回标准库 json
+    orjson = None
+try:
+    import brotli
+except ImportError:  # 兜底：只提供 gzip
+    brotli = None
+
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))  # 小于该字节数的响应不压缩
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "5"))            # 0-11，在线压缩 4-6 性价比最高
+COMPRESS_IN_THREAD = 256 * 1024  # 更大的响应放到线程里压缩，不占事件循环
+COMPRESSIBLE = ("application/json", "text/", "application/javascript", "image/svg+xml")
+
+
+def dumps(content):
+    if orjson is not None: return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content):
+        return dumps(content)
+
+
+def etag_response(request, content, status_code=200):
+    """带 ETag 的 JSON 响应；客户端缓存的版本没变时返回 304（弱 ETag，与压缩编码无关）"""
+    body = dumps(content)
+    etag = f'W/"{hashlib.blake2b(body, digest_size=12).hexdigest()}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}  # 每次都要验证，但命中时不重发内容
+    inm = request.headers.get("if-none-match")
+    if inm and (inm.strip() == "*" or etag in [t.strip() for t in inm.split(",")]):
+        return Response(status_code=304, headers=headers)
+    return Response(body, status_code=status_code, media_type="application/json", headers=headers)
+
+
+def negotiate(accept_encoding):
+    """返回 "br" / "gzip" / None；q=0 表示明确拒绝"""
+    accepted = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try: q = float(params.strip()[2:])
+            except ValueError: q = 0.0
+        if name: accepted[name] = q
+    for enc in (("br", "gzip") if brotli is not None else ("gzip",)):
+        if accepted.get(enc, accepted.get("*", 0)) > 0: return enc
+    return None
+
+
+def compress(body, encoding):
+    if encoding == "br": return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+class CompressionStats:
+    __slots__ = ("compressed", "passthrough", "bytes_in", "bytes_out")
+
+    def __init__(self):
+        self.compressed = self.passthrough = self.bytes_in = self.bytes_out = 0
+
+    def to_dict(self):
+        return {"compressed": self.compressed, "passthrough": self.passthrough, "bytes_in": self.bytes_in, "bytes_out": self.bytes_out,
+                "ratio": round(self.bytes_out / self.bytes_in, 3) if self.bytes_in else 0, "min_size": COMPRESS_MIN_SIZE,
+                "encodings": ["br", "gzip"] if brotli is not None else ["gzip"], "orjson": orjson is not None}
+
+
+compression_stats = CompressionStats()
+
+
+class CompressionMiddleware:
+    """纯 ASGI 中间件：第一条 body 消息就是完整响应时才压缩"""
+    def __init__(self, app, minimum_size=COMPRESS_MIN_SIZE, stats=compression_stats):
+        self.app, self.minimum_size, self.stats = app, minimum_size, stats
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            return await self.app(scope, receive, send)
+        start = None
+
+        async def wrapped(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                start = message  # 等看到 body 再决定是否压缩
+                return
+            if start is None:
+                return await send(message)
+            first, start_msg, start = message, start, None
+            headers = MutableHeaders(raw=list(start_msg["headers"]))
+            body = first.get("body", b"")
+            ctype = headers.get("content-type", "")
+            if (first.get("more_body") or len(body) < self.minimum_size or "content-encoding" in headers
+                    or not ctype.startswith(COMPRESSIBLE)):
+                self.stats.passthrough += 1
+                await send(start_msg)
+                return await send(first)
+            out = await asyncio.to_thread(compress, body, encoding) if len(body) > COMPRESS_IN_THREAD else compress(body, encoding)
+            s = self.stats
+            s.compressed += 1
+            s.bytes_in += len(body)
+            s.bytes_out += len(out)
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(out))
+            headers.add_vary_header("Accept-Encoding")
+            await send({**start_msg, "headers": headers.raw})
+            await send({**first, "body": out})
+
+        await self.app(scope, receive, wrapped)
@@ -0,0 +1,73 @@
+"""场景紧凑格式 - 纯文本段落 + 单词标注，单词信息每个响应只出现一次
+
+紧凑场景：
+    {"id", "scene_id", "icon", "bgImage", "words_used",
+     "zh": {"title", "anchors"}, "en": {"title", "anchors"},
+     "paragraphs": [{"zh", "en", "tr", "marks": {"zh": [[offset, length, word_index], ...], "en": [...], "tr": [...]}}]}
+offset/length 以 Unicode 码点计；word_index 指向同一响应里的 words 表；没有标注的字段不出现在 marks 中。
+场景图已导入本地时（见 assets.py）还有 bgImageSet: [{"w", "h", "url"}, ...]，按宽度升序。
+旧的 HTML 格式（每个单词展开成带 tooltip 的 span）由 to_html 按需还原，与原输出逐字节一致。
+"""
+from .highlight import MARK_RE, _tip
+
+FIELDS = (("zh", "zh"), ("en", "en"), ("tr", "zh_pure"))  # 紧凑字段 <- LLM 段落字段
+
+
+def word_table(wd):
+    """共享单词表，顺序即 word_index"""
+    return [{"word": w['word'], "pos": w.get('pos') or '', "meaning": w.get('meaning') or ''} for w in wd.values()]
+
+
+def annotate(hl, text, index):
+    """去掉 [[ ]] 标记，返回 (纯文本, 标注)；标注位置与 Highlighter.mark 高亮的位置完全相同"""
+    if not text: return '', []
+    plain = MARK_RE.sub(r'\1', text)
+    if hl.regex is None: return plain, []
+    marks = []
+    for m in hl.regex.finditer(plain):
+        i = index.get(m.group(1).lower())
+        if i is not None: marks.append([m.start(1), len(m.group(1)), i])
+    return plain, marks
+
+
+def compact_paragraph(hl, p, index):
+    para, marks = {}, {}
+    for key, src in FIELDS:
+        para[key], m = annotate(hl, p.get(src, ''), index)
+        if m: marks[key] = m
+    para["marks"] = marks
+    return para
+
+
+# ---------- 兼容：还原为 HTML ----------
+def _render(text, marks, tips):
+    out, pos = [], 0
+    for o, n, i in marks:
+        out.append(text[pos:o])
+        out.append(f"<span class='word-highlight'>{text[o:o+n]}<span class='tooltip'>{tips[i]}</span></span>")
+        pos = o + n
+    out.append(text[pos:])
+    return "".join(out)
+
+
+def to_html(scene, words):
+    """紧凑场景 -> 旧版 HTML 场景（zh/en.content、translationParagraphs）"""
+    if "paragraphs" not in scene: return scene  # 已是 HTML 格式
+    tips = [_tip(w) for w in words]
+    zh, en, tr = [], [], []
+    for p in scene["paragraphs"]:
+        m = p["marks"]
+        zh.append(f"<p class='mb-3'>{_render(p['zh'], m.get('zh', ()), tips)}</p>")
+        en.append(f"<p class='mb-3'>{_render(p['en'], m.get('en', ()), tips)}</p>")
+        tr.append(_render(p['tr'], m.get('tr', ()), tips))
+    out = {
+        "id": scene["id"], "scene_id": scene["scene_id"], "icon": scene["icon"], "bgImage": scene["bgImage"], "words_used": scene["words_used"],
+        "zh": {**scene["zh"], "content": "".join(zh), "translationParagraphs": tr},
+        "en": {**scene["en"], "content": "".join(en)}
+    }
+    if "bgImageSet" in scene: out["bgImageSet"] = scene["bgImageSet"]
+    return out
+
+
+def scenes_to_html(scenes, words):
+    return [to_html(s, words) for s in scenes]
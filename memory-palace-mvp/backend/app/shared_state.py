@@ -0,0 +1,249 @@
+"""跨 worker / 节点的共享状态 - 配置项与累加计数器，存放在应用数据库里
+
+uvicorn --workers N 时每个进程各有一份单例：配置只改到响应请求的那个 worker，用量和埋点各记各的。
+这里把两类状态放到所有 worker 都连着的数据库：
+- 配置项：带版本号的 JSON，乐观并发写入（读 → 合并 → 按旧版本号更新，冲突重试），
+  各 worker 定期轮询版本号，发现变化后重新加载并通知订阅者（例如重建提供商客户端）；
+- 计数器：各 worker 在内存里照常累加，后台每隔几秒把增量加到共享表，
+  读取时 = 共享表合计 + 本地尚未上报的增量，仪表盘看到的是所有 worker 的总和。
+默认 SQLite（同一台机器上的多个 worker）；DATABASE_URL 指向服务端数据库即可跨节点共享。
+"""
+import asyncio
+import json
+import os
+import socket
+import threading
+import time
+from collections import defaultdict
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.exc import IntegrityError
+
+from .database import Base, create_tables, engine
+from .models import SharedCounter, SharedValue
+
+SHARED_SYNC_SECONDS = float(os.getenv("SHARED_SYNC_SECONDS", "2"))  # 上报增量、轮询配置版本的间隔
+WORKER_PREFIX = "worker:"
+
+
+def _insert(table):
+    if engine.dialect.name == "postgresql": from sqlalchemy.dialects.postgresql import insert
+    else: from sqlalchemy.dialects.sqlite import insert
+    return insert(table)
+
+
+def merge(old, patch):
+    """浅合并，值为 dict 的字段再合并一层（例如 api_keys 只改其中一个提供商）"""
+    out = dict(old or {})
+    for k, v in patch.items():
+        out[k] = {**out[k], **v} if isinstance(v, dict) and isinstance(out.get(k), dict) else v
+    return out
+
+
+class SharedState:
+    def __init__(self, interval=SHARED_SYNC_SECONDS):
+        self.interval = interval
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.lock = threading.Lock()
+        self.versions = {}                   # key -> 本 worker 已应用的版本号
+        self.watchers = defaultdict(list)    # key -> [callback(value)]
+        self.sources = {}                    # ns -> 返回本地累计计数 {key: value} 的函数
+        self.expire = {}                     # ns -> key 可删除时返回 True 的函数
+        self.flushed = defaultdict(dict)     # ns -> 上次成功上报时的本地累计
+        self.totals = defaultdict(dict)      # ns -> 共享表合计（最近一次读取 + 之后本地上报的增量）
+        self.task = None
+        self.ready = False
+        self.syncs = self.reloads = self.errors = 0
+        self.last_sync_ms = 0.0
+        self.workers = []
+        self._tables = False
+
+    def _ensure_tables(self):
+        # 单例在 main 里 create_all 之前就会被用到（AIConfig 加载配置）
+        if not self._tables:
+            create_tables(Base.metadata, [SharedValue.__table__, SharedCounter.__table__])
+            self._tables = True
+
+    # ---------- 配置项 ----------
+    def get(self, key):
+        """读取并记下版本号（之后只有版本变化才通知），返回 (version, value)，不存在时 (0, None)"""
+        self._ensure_tables()
+        with engine.connect() as conn:
+            row = conn.execute(select(SharedValue.version, SharedValue.value_json).where(SharedValue.key == key)).first()
+        self.versions[key] = row.version if row else 0
+        return (row.version, json.loads(row.value_json)) if row else (0, None)
+
+    def update(self, key, patch, retries=20):
+        """原子地把 patch 合并进 key，返回 (version, 合并后的值)；并发写入时按版本号冲突重试
+        patch 也可以是函数：patch(旧值或 None) -> 新值，用于追加等不能用浅合并表达的修改"""
+        self._ensure_tables()
+        t = SharedValue
+        for _ in range(retries):
+            with engine.begin() as conn:
+                row = conn.execute(select(t.version, t.value_json).where(t.key == key)).first()
+                old = json.loads(row.value_json) if row else None
+                value = patch(old) if callable(patch) else merge(old or {}, patch)
+                data, now = json.dumps(value, ensure_ascii=False), time.time()
+                if row is None:
+                    try:
+                        with conn.begin_nested():
+                            conn.execute(t.__table__.insert().values(key=key, value_json=data, version=1, updated_at=now))
+                        version = 1
+                    except IntegrityError:
+                        continue  # 另一个 worker 刚插入，重读后再合并
+                else:
+                    res = conn.execute(update(t).where(t.key == key, t.version == row.version)
+                                       .values(value_json=data, version=row.version + 1, updated_at=now))
+                    if res.rowcount != 1: continue
+                    version = row.version + 1
+            self.versions[key] = version
+            return version, value
+        raise RuntimeError(f"shared value {key} update conflict")
+
+    def claim(self, key):
+        """只有第一个调用者返回 True（一次性的初始化，例如从旧数据回填计数器）"""
+        self._ensure_tables()
+        try:
+            with engine.begin() as conn:
+                conn.execute(SharedValue.__table__.insert().values(key=key, value_json="{}", version=1, updated_at=time.time()))
+            return True
+        except IntegrityError:
+            return False
+
+    def watch(self, key, callback):
+        """key 被其他 worker 修改后在事件循环里调用 callback(value)"""
+        self.watchers[key].append(callback)
+
+    # ---------- 计数器 ----------
+    def register(self, ns, source, expire=None):
+        """source() 返回本进程启动以来的累计计数 {key: value}；expire(key) 为 True 的键在共享表里清理掉"""
+        self.sources[ns] = source
+        if expire: self.expire[ns] = expire
+
+    def add(self, ns, counts):
+        """直接把 counts 加到共享表（回填历史数据用）"""
+        self._ensure_tables()
+        self._write({ns: counts})
+
+    def merged(self, ns, local):
+        """所有 worker 的合计 = 共享表合计 + 本地尚未上报的增量；未启动同步时就是本地计数"""
+        with self.lock:
+            if not self.ready: return dict(local)
+            out, flushed = dict(self.totals[ns]), self.flushed[ns]
+        for k, v in local.items():
+            d = v - flushed.get(k, 0)
+            if d: out[k] = out.get(k, 0) + d
+        return out
+
+    def _write(self, deltas):
+        rows = [{"ns": ns, "key": k, "value": v} for ns, d in deltas.items() for k, v in d.items()]
+        if not rows: return
+        ins = _insert(SharedCounter)
+        stmt = ins.on_conflict_do_update(index_elements=["ns", "key"], set_={"value": SharedCounter.value + ins.excluded.value})
+        with engine.begin() as conn:
+            conn.execute(stmt, rows)
+
+    def _flush(self):
+        snaps = {ns: dict(fn()) for ns, fn in self.sources.items()}
+        deltas = {}
+        for ns, snap in snaps.items():
+            flushed = self.flushed[ns]
+            d = {k: v - flushed.get(k, 0) for k, v in snap.items() if v != flushed.get(k, 0)}
+            if d: deltas[ns] = d
+        self._write(deltas)
+        with self.lock:
+            for ns, snap in snaps.items():
+                self.flushed[ns] = snap
+                tot = self.totals[ns]
+                for k, v in deltas.get(ns, {}).items(): tot[k] = tot.get(k, 0) + v
+
+    def _read_totals(self):
+        out = defaultdict(dict)
+        with engine.connect() as conn:
+            for ns, k, v in conn.execute(select(SharedCounter.ns, SharedCounter.key, SharedCounter.value).where(SharedCounter.ns.in_(list(self.sources)))):
+                out[ns][k] = v
+        stale = {ns: [k for k in out[ns] if fn(k)] for ns, fn in self.expire.items()}
+        if any(stale.values()):
+            with engine.begin() as conn:
+                for ns, keys in stale.items():
+                    if keys: conn.execute(delete(SharedCounter).where(SharedCounter.ns == ns, SharedCounter.key.in_(keys)))
+            for ns, keys in stale.items():
+                for k in keys: out[ns].pop(k, None)
+        with self.lock:
+            for ns in self.sources: self.totals[ns] = out[ns]
+
+    # ---------- 后台同步 ----------
+    def _sync(self):
+        """上报计数增量、刷新合计、心跳、检查配置版本；返回有变化的 {key: value}"""
+        self._flush()
+        self._read_totals()
+        now = time.time()
+        t = SharedValue
+        with engine.begin() as conn:
+            ins = _insert(t)
+            conn.execute(ins.on_conflict_do_update(index_elements=["key"], set_={"updated_at": now}),
+                         {"key": WORKER_PREFIX + self.worker_id, "value_json": json.dumps({"pid": os.getpid()}), "version": 1, "updated_at": now})
+            conn.execute(delete(t).where(t.key.like(WORKER_PREFIX + "%"), t.updated_at < now - self.interval * 10))
+            rows = conn.execute(select(t.key, t.version, t.updated_at).where(t.key.in_(list(self.watchers)) | t.key.like(WORKER_PREFIX + "%"))).all()
+            self.workers = sorted(r.key[len(WORKER_PREFIX):] for r in rows if r.key.startswith(WORKER_PREFIX) and r.updated_at >= now - self.interval * 3)
+            changed = [r.key for r in rows if r.key in self.watchers and r.version != self.versions.get(r.key)]
+            values = {}
+            for r in conn.execute(select(t.key, t.version, t.value_json).where(t.key.in_(changed))) if changed else ():
+                self.versions[r.key] = r.version
+                values[r.key] = json.loads(r.value_json)
+        return values
+
+    async def sync_once(self):
+        t = time.perf_counter()
+        try:
+            values = await asyncio.to_thread(self._sync)
+        except Exception as e:
+            self.errors += 1
+            print(f"[Shared] Sync error: {e}")
+            return
+        self.ready = True
+        self.syncs += 1
+        self.last_sync_ms = round((time.perf_counter() - t) * 1000, 2)
+        for key, value in values.items():
+            self.reloads += 1
+            print(f"[Shared] {key} changed by another worker, reloading")
+            for cb in self.watchers[key]:
+                try: cb(value)
+                except Exception as e: print(f"[Shared] Reload {key} failed: {e}")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.sync_once()
+
+    async def start(self):
+        if self.task is None:
+            self._ensure_tables()
+            for key in self.watchers:
+                if key not in self.versions: await asyncio.to_thread(self.get, key)
+            await self.sync_once()
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """退出前把最后一批增量写进去，并注销本 worker"""
+        if self.task is None: return
+        self.task.cancel()
+        try: await self.task
+        except asyncio.CancelledError: pass
+        self.task = None
+        try:
+            await asyncio.to_thread(self._flush)
+            def leave():
+                with engine.begin() as conn:
+                    conn.execute(delete(SharedValue).where(SharedValue.key == WORKER_PREFIX + self.worker_id))
+            await asyncio.to_thread(leave)
+        except Exception as e:
+            print(f"[Shared] Final flush failed: {e}")
+
+    def stats(self):
+        return {"backend": engine.dialect.name, "worker_id": self.worker_id, "workers": self.workers, "interval": self.interval,
+                "syncs": self.syncs, "reloads": self.reloads, "errors": self.errors, "last_sync_ms": self.last_sync_ms,
+                "versions": dict(self.versions)}
+
+
+shared = SharedState()
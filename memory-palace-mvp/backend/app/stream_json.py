@@ -0,0 +1,66 @@
+"""增量 JSON 解析 - 从流式输出的 {"scenes": [...]} 中逐个取出已闭合的场景对象"""
+import json
+import re
+
+SCENES_KEY_RE = re.compile(r'"scenes"\s*:\s*\[')
+
+
+def loads_lenient(s):
+    """与 AIService._json 相同的容错：先严格解析，失败再把转义引号换成单引号"""
+    try: return json.loads(s)
+    except ValueError: return json.loads(s.replace('\\"', "'"))
+
+
+class SceneStreamParser:
+    """逐块喂入模型输出，每当 scenes 数组中的一个对象闭合就返回它
+
+    只跟踪字符串/转义状态和花括号深度，不回溯已处理的文本，总代价与输出长度成线性。
+    """
+    def __init__(self):
+        self.head = ''          # 进入 scenes 数组之前的文本
+        self.in_array = False
+        self.done = False
+        self.depth = 0          # 相对 scenes 数组的对象嵌套深度
+        self.in_str = self.esc = False
+        self.obj = []           # 当前场景对象的字符
+        self.count = 0
+
+    def feed(self, chunk):
+        out = []
+        if self.done or not chunk: return out
+        if not self.in_array:
+            self.head += chunk
+            m = SCENES_KEY_RE.search(self.head)
+            if not m: return out
+            self.in_array = True
+            chunk, self.head = self.head[m.end():], ''
+        for ch in chunk:
+            if self.depth:
+                self.obj.append(ch)
+                if self.in_str:
+                    if self.esc: self.esc = False
+                    elif ch == '\\': self.esc = True
+                    elif ch == '"': self.in_str = False
+                elif ch == '"': self.in_str = True
+                elif ch == '{': self.depth += 1
+                elif ch == '}':
+                    self.depth -= 1
+                    if not self.depth:
+                        scene = self._close()
+                        if scene is not None: out.append(scene)
+            elif ch == '{':
+                self.depth, self.obj = 1, ['{']
+            elif ch == ']':
+                self.done = True
+                break
+        return out
+
+    def _close(self):
+        text, self.obj = ''.join(self.obj), []
+        try: scene = loads_lenient(text)
+        except ValueError:
+            print(f"[AI] Stream: skip malformed scene ({len(text)} chars)")
+            return None
+        if not isinstance(scene, dict): return None
+        self.count += 1
+        return scene
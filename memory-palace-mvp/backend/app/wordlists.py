@@ -0,0 +1,91 @@
+"""词表与场景持久化 - 键集分页 + 延迟加载大字段 + 场景批量写入
+
+列表页只读元数据（words_json / scene_data_json 是 deferred 列），
+分页用 (created_at, id) 作为游标，走 (user_id, created_at) 复合索引，翻到多深都不需要 OFFSET 扫描。
+"""
+import base64
+import hmac
+import json
+import secrets
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import and_, insert, or_
+from sqlalchemy.orm import Session, undefer
+
+from .models import WordList, Scene
+
+MAX_PAGE = 100
+
+
+def _encode_cursor(wl):
+    return base64.urlsafe_b64encode(f"{wl.created_at.isoformat()}|{wl.id}".encode()).decode()
+
+
+def _decode_cursor(cursor):
+    try:
+        ts, id_ = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(ts), int(id_)
+    except Exception:
+        raise ValueError("无效的分页游标")
+
+
+def summary(wl):
+    return {"id": wl.id, "name": wl.name, "word_count": wl.word_count or 0, "scene_count": wl.scene_count or 0,
+            "created_at": wl.created_at.isoformat() if wl.created_at else None}
+
+
+def create_word_list(db: Session, user_id: Optional[int], name: str, words: list, scenes: list) -> dict:
+    """词表和全部场景在一个事务里写入；游客词表生成访问密钥"""
+    key = None if user_id else secrets.token_urlsafe(16)
+    wl = WordList(user_id=user_id, name=name, words_json=json.dumps(words, ensure_ascii=False),
+                  word_count=len(words), scene_count=len(scenes), access_key=key)
+    db.add(wl)
+    db.flush()
+    if scenes:
+        db.execute(insert(Scene), [{"word_list_id": wl.id, "scene_order": i, "scene_data_json": json.dumps(s, ensure_ascii=False)}
+                                   for i, s in enumerate(scenes)])
+    d = summary(wl)
+    db.commit()
+    if key: d["access_key"] = key
+    return d
+
+
+def list_word_lists(db: Session, user_id: int, cursor: Optional[str] = None, limit: int = 20) -> dict:
+    """按创建时间倒序的一页词表元数据；next_cursor 为空表示没有更多"""
+    limit = max(1, min(limit, MAX_PAGE))
+    q = db.query(WordList).filter(WordList.user_id == user_id, WordList.cache_key.is_(None))
+    if cursor:
+        ts, id_ = _decode_cursor(cursor)
+        q = q.filter(or_(WordList.created_at < ts, and_(WordList.created_at == ts, WordList.id < id_)))
+    rows = q.order_by(WordList.created_at.desc(), WordList.id.desc()).limit(limit + 1).all()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    return {"items": [summary(wl) for wl in rows], "next_cursor": _encode_cursor(rows[-1]) if more else None}
+
+
+def get_word_list(db: Session, list_id: int, user_id: Optional[int], key: Optional[str], with_words=False):
+    """有权访问时返回词表，否则 None：注册用户的词表只有本人可读，游客词表凭访问密钥读取"""
+    q = db.query(WordList).filter(WordList.id == list_id, WordList.cache_key.is_(None))
+    if with_words: q = q.options(undefer(WordList.words_json))
+    wl = q.first()
+    if wl is None: return None
+    if wl.user_id is not None: return wl if wl.user_id == user_id else None
+    return wl if key and wl.access_key and hmac.compare_digest(key, wl.access_key) else None
+
+
+def get_scenes(db: Session, list_id: int, start: int = 0, limit: int = 50) -> dict:
+    """按 scene_order 分段读取场景，走 (word_list_id, scene_order) 复合索引"""
+    limit = max(1, min(limit, MAX_PAGE))
+    rows = (db.query(Scene.scene_order, Scene.scene_data_json)
+            .filter(Scene.word_list_id == list_id, Scene.scene_order >= start)
+            .order_by(Scene.scene_order).limit(limit + 1).all())
+    more = len(rows) > limit
+    rows = rows[:limit]
+    return {"scenes": [json.loads(r.scene_data_json) for r in rows], "next": rows[-1].scene_order + 1 if more else None}
+
+
+def delete_word_list(db: Session, wl):
+    db.query(Scene).filter(Scene.word_list_id == wl.id).delete(synchronize_session=False)
+    db.delete(wl)
+    db.commit()
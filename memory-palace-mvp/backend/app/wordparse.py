@@ -0,0 +1,97 @@
+"""单词列表提取 - 前端 parseWords 的服务端流式版本
+
+按行单遍扫描：feed() 接收任意切分的文本块，只处理已完整的行，
+跨块的半行留到下一块；返回本块新识别且未重复的单词。
+"""
+import asyncio
+import re
+
+SKIP_RE = re.compile(r"^(Word|Meaning|共|扫描|全部|复习)")
+PAGE_RE = re.compile(r"^\d+/\d+")
+# 格式1: "1 ubiquitous 无处不在的" 或 "1. ubiquitous"
+NUMBERED_RE = re.compile(r"^\d+[.\s]+([a-zA-Z\-']+)(?:\s+(.*))?$")
+# 格式2: "ubiquitous (adj.) 无处不在的" 或 "ubiquitous: adj. 无处不在的"
+POS_RE = re.compile(r"^([a-zA-Z\-']+)\s*(?:\(([a-z]+\.?)\)|[:：]\s*([a-z]+\.?))?\s*(.*)$", re.I)
+# 格式3: 逗号/分号分隔的单词列表
+SPLIT_RE = re.compile(r"[,;，；\t]+")
+PART_RE = re.compile(r"^([a-zA-Z\-']+)(?:\s*\(([^)]+)\))?(?:\s+(.*))?$")
+LINE_RE = re.compile(r"[\n\r]+")
+
+WORD_BATCH = 500        # NDJSON 每行最多单词数
+FEED_SLICE = 256 * 1024  # 每次交给线程解析的字符数
+
+
+def parse_line(line):
+    """单行 → [{word, pos, meaning}]，规则与前端 parseWords 一致"""
+    if SKIP_RE.match(line) or PAGE_RE.match(line): return []
+    m = NUMBERED_RE.match(line)
+    if m: return [{"word": m.group(1).strip(), "pos": "", "meaning": (m.group(2) or "").strip()}]
+    m = POS_RE.match(line)
+    if m and len(m.group(1)) > 1:
+        return [{"word": m.group(1).strip(), "pos": (m.group(2) or m.group(3) or "").strip(), "meaning": (m.group(4) or "").strip()}]
+    out = []
+    for part in SPLIT_RE.split(line):
+        part = part.strip()
+        m = PART_RE.match(part) if part else None
+        if m and len(m.group(1)) > 1:
+            out.append({"word": m.group(1), "pos": (m.group(2) or "").strip(), "meaning": (m.group(3) or "").strip()})
+    return out
+
+
+class WordExtractor:
+    def __init__(self):
+        self.seen = set()
+        self.tail = ""
+        self.lines = 0
+
+    def _lines(self, lines):
+        out = []
+        for line in lines:
+            line = line.strip()
+            if not line: continue
+            self.lines += 1
+            for w in parse_line(line):
+                key = w["word"].lower()
+                if key in self.seen: continue
+                self.seen.add(key)
+                out.append(w)
+        return out
+
+    def feed(self, text):
+        """喂入一段文本，返回其中完整行里新识别的单词"""
+        lines = LINE_RE.split(self.tail + text)
+        self.tail = lines.pop()
+        return self._lines(lines)
+
+    def close(self):
+        """处理最后一个没有换行结尾的行"""
+        tail, self.tail = self.tail, ""
+        return self._lines([tail])
+
+    @property
+    def count(self):
+        return len(self.seen)
+
+
+def extract_words(text):
+    """一次性提取（非流式调用方使用）"""
+    ex = WordExtractor()
+    return ex.feed(text) + ex.close()
+
+
+async def stream_words(pieces):
+    """(文本段, 进度) 异步流 → words / progress / done 消息
+
+    解析按块放到线程里做，超大输入也不会长时间占住事件循环；段与段之间按换行衔接。
+    """
+    ex, info, first = WordExtractor(), {}, True
+    async for text, info in pieces:
+        if not first: text = "\n" + text
+        first = False
+        for i in range(0, len(text), FEED_SLICE):
+            words = await asyncio.to_thread(ex.feed, text[i:i + FEED_SLICE])
+            for j in range(0, len(words), WORD_BATCH): yield {"type": "words", "words": words[j:j + WORD_BATCH]}
+        if info: yield {"type": "progress", **info}
+    words = ex.close()
+    if words: yield {"type": "words", "words": words}
+    yield {"type": "done", "count": ex.count, "lines": ex.lines, **info}
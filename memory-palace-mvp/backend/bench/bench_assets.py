@@ -0,0 +1,60 @@
+"""场景背景图基准：按典型视口比较远程原图和本地变体的下载字节数、估算传输时间，并检查静态文件缓存头
+
+读取 python -m app.assets ingest 生成的清单，按前端 backgroundUrl 的规则为每个视口挑变体。
+"远程原图"是导入时下载的那张（Unsplash 的 1920px 图），即导入前每个客户端每次都要下载的图片。
+用法（在 backend 目录下）:
+    python -m app.assets ingest            # 先导入（需要 Pillow 和网络，或 --source-dir 指向本地原图）
+    python bench/bench_assets.py [--mbps 10]
+"""
+import argparse, os, statistics, sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ.setdefault("ANALYTICS_PERSIST", "0")
+
+# (名称, CSS 宽, CSS 高)
+VIEWPORTS = [("phone 390x844", 390, 844), ("phone landscape 844x390", 844, 390), ("tablet 1180x820", 1180, 820),
+             ("laptop 1366x768", 1366, 768), ("laptop 1440x900", 1440, 900), ("desktop 1920x1080", 1920, 1080)]
+
+
+def pick(variants, vw, vh):
+    """与前端 backgroundUrl 相同：能铺满视口（bg-cover）的最小变体，按 CSS 像素算"""
+    for w, h, name, size in variants:
+        if w >= max(vw, vh * w / h): return w, size
+    return variants[-1][0], variants[-1][3]
+
+
+def main():
+    ap = argparse.ArgumentParser(description="场景背景图基准")
+    ap.add_argument("--mbps", type=float, default=10, help="估算传输时间用的带宽（Mbit/s）")
+    args = ap.parse_args()
+    from app.assets import IMMUTABLE, assets
+    assets.load()
+    if not assets.backgrounds: sys.exit(f"{assets.path} 不存在或为空，先运行 python -m app.assets ingest")
+    import json
+    with open(assets.path, encoding="utf-8") as f:
+        scenes = json.load(f)["scenes"]
+    source = statistics.mean(e["source_bytes"] for e in scenes.values())
+    ms = lambda b: b * 8 / (args.mbps * 1e6) * 1000
+    print(f"{len(scenes)} 个场景，带宽 {args.mbps:g} Mbit/s；远程原图平均 {source / 1024:.0f} KB，{ms(source):.0f} ms\n")
+    print(f"{'viewport':<22} {'width':>6} {'KB':>8} {'vs remote':>10} {'ms':>7}")
+    for name, vw, vh in VIEWPORTS:
+        picked = [pick(e["variants"], vw, vh) for e in scenes.values()]
+        size = statistics.mean(s for _, s in picked)
+        width = statistics.median(w for w, _ in picked)
+        print(f"{name:<22} {width:>6.0f} {size / 1024:>8.0f} {size / source:>9.0%} {ms(size):>7.0f}")
+
+    from fastapi.testclient import TestClient
+    from app.main import app
+    url = next(iter(assets.backgrounds.values()))["bgImage"]
+    path = url[url.index("/static/"):]
+    with TestClient(app) as c:
+        r = c.get(path)
+        again = c.get(path, headers={"If-None-Match": r.headers.get("etag", "")})
+    ok = r.status_code == 200 and r.headers.get("cache-control") == IMMUTABLE
+    print(f"\n{path}: {r.status_code} {r.headers.get('content-type')} Cache-Control: {r.headers.get('cache-control')}"
+          f"{'' if ok else '  <- 缓存头不对'}")
+    print(f"再次访问：浏览器缓存直接命中（immutable，不发请求）；强制验证时 {again.status_code}，{len(again.content)} 字节")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""认证热路径负载测试：登录高峰期间其他接口的延迟
+
+对比旧实现（同步路由里直接跑 bcrypt，每个请求都查库解析 token）与当前实现
+（bcrypt 在专用有界线程池，token 解析走 TTL 缓存）。请求在进程内经 ASGI 直接发给应用，
+只测服务端本身，不含网络开销。
+用法（在 backend 目录下）: python bench/bench_auth.py [登录并发数]
+"""
+import asyncio, os, statistics, sys, tempfile, time
+
+os.chdir(tempfile.mkdtemp())  # 使用临时数据库
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import httpx
+from fastapi import Depends, HTTPException
+from fastapi.security import OAuth2PasswordRequestForm
+from jose import jwt
+from app.main import app
+from app.auth import ALGORITHM, SECRET_KEY, UserResponse, oauth2_scheme, token_cache, verify_password
+from app.database import get_db
+from app.models import User
+
+EMAIL, PASSWORD = "bench@example.com", "bench-password"
+
+
+# ---------- 旧实现，仅用于对比 ----------
+def legacy_current_user(token: str = Depends(oauth2_scheme), db=Depends(get_db)):
+    email = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]).get("sub")
+    user = db.query(User).filter(User.email == email).first()
+    if user is None: raise HTTPException(status_code=401)
+    return user
+
+@app.post("/bench/legacy/login")
+def legacy_login(form: OAuth2PasswordRequestForm = Depends(), db=Depends(get_db)):
+    user = db.query(User).filter(User.email == form.username).first()
+    if not user or not verify_password(form.password, user.hashed_password): raise HTTPException(status_code=401)
+    return {"ok": True}
+
+@app.get("/bench/legacy/me", response_model=UserResponse)
+def legacy_me(user=Depends(legacy_current_user)):
+    return user
+
+
+async def probe(client, url, headers, stop, out):
+    """持续请求一个轻量接口，记录每次延迟"""
+    while not stop.is_set():
+        t = time.perf_counter()
+        r = await client.get(url, headers=headers)
+        assert r.status_code == 200, r.text
+        out.append((time.perf_counter() - t) * 1000)
+
+
+async def run(client, login_url, me_url, headers, burst):
+    lat, stop = [], asyncio.Event()
+    tasks = [asyncio.create_task(probe(client, me_url, headers, stop, lat)) for _ in range(8)]
+    await asyncio.sleep(0.5)
+    idle = lat[:]
+    lat.clear()
+    t = time.perf_counter()
+    logins = [client.post(login_url, data={"username": EMAIL, "password": PASSWORD}) for _ in range(burst)]
+    codes = [r.status_code for r in await asyncio.gather(*logins)]
+    login_s = time.perf_counter() - t
+    stop.set()
+    await asyncio.gather(*tasks)
+    return idle, lat, login_s, codes
+
+
+def pct(xs, q):
+    return statistics.quantiles(xs, n=100, method="inclusive")[q - 1] if len(xs) > 1 else (xs[0] if xs else 0)
+
+
+async def main():
+    burst = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        await client.post("/auth/register", json={"email": EMAIL, "password": PASSWORD})
+        token = (await client.post("/auth/login", data={"username": EMAIL, "password": PASSWORD})).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        print(f"登录并发 {burst}，8 个并发探测请求持续访问 /auth/me")
+        print(f"{'':>8} {'idle p50':>9} {'idle p95':>9} {'burst p50':>10} {'burst p95':>10} {'burst max':>10} {'/me 次数':>9} {'登录耗时':>9}")
+        for name, login_url, me_url in (("legacy", "/bench/legacy/login", "/bench/legacy/me"), ("current", "/auth/login", "/auth/me")):
+            idle, lat, login_s, codes = await run(client, login_url, me_url, headers, burst)
+            print(f"{name:>8} {pct(idle, 50):>8.1f}ms {pct(idle, 95):>8.1f}ms {pct(lat, 50):>9.1f}ms {pct(lat, 95):>9.1f}ms "
+                  f"{max(lat or [0]):>9.1f}ms {len(lat):>9} {login_s:>8.2f}s  {dict((c, codes.count(c)) for c in set(codes))}")
+        print("token 缓存:", token_cache.stats())
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
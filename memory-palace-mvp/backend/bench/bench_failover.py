@@ -0,0 +1,103 @@
+"""故障转移链检查：用本地桩提供商验证转移顺序、重试范围、半开只放行一个试探、对冲
+
+FailoverChain 与 SDK 无关，这里的提供商就是协程函数，按脚本设定的延迟/错误返回，不需要网络和 API Key。
+任何一项不符合预期时退出码非 0，可放进 CI。
+用法（在 backend 目录下）: python bench/bench_failover.py
+"""
+import asyncio, contextlib, io, os, sys, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from app.failover import AllProvidersFailed, FailoverChain
+
+
+class StatusError(Exception):
+    """模拟 SDK 的 HTTP 状态错误（带 status_code）"""
+    def __init__(self, status_code):
+        self.status_code = status_code
+        super().__init__(f"HTTP {status_code}")
+
+
+class Stub:
+    """按提供商设定的桩：behavior[p] = ("ok", 延迟) / ("error", 状态码或异常)；记录每次调用"""
+    def __init__(self, **behavior):
+        self.behavior, self.calls, self.cancelled = behavior, [], []
+
+    async def __call__(self, p):
+        self.calls.append(p)
+        kind, arg = self.behavior[p]
+        if kind == "error": raise StatusError(arg) if isinstance(arg, int) else arg
+        try: await asyncio.sleep(arg)
+        except asyncio.CancelledError:
+            self.cancelled.append(p)
+            raise
+        return f"{p}-result"
+
+
+def chain(**kw):
+    return FailoverChain(**{"retries": 1, "backoff": 0.001, "hedge_after": 0, "failure_threshold": 2, "reset_timeout": 0.2, **kw})
+
+
+async def failover_order(check):
+    ch, stub = chain(), Stub(a=("error", 503), b=("error", 500), c=("ok", 0))
+    result, p = await ch.call(["a", "b", "c"], stub)
+    check("按顺序转移到第一个可用的提供商", p == "c" and stub.calls == ["a", "a", "b", "b", "c"], stub.calls)
+    check("5xx 计入熔断，转移计数一次", ch.breaker("a").state == "open" and ch.failovers == 1, ch.stats())
+    result, p = await ch.call(["a", "b", "c"], stub)
+    check("熔断的提供商直接跳过", p == "c" and stub.calls[5:] == ["c"], stub.calls)
+
+
+async def non_transient(check):
+    ch, stub = chain(), Stub(a=("error", 401), b=("ok", 0))
+    for _ in range(3): await ch.call(["a", "b"], stub)
+    check("401 不重试、不熔断，直接转移", stub.calls == ["a", "b"] * 3 and ch.breaker("a").state == "closed", stub.calls)
+    with contextlib.suppress(AllProvidersFailed):
+        await chain().call(["a"], Stub(a=("error", 400)))
+        check("全部失败时抛 AllProvidersFailed", False)
+
+
+async def single_probe(check):
+    ch = chain()
+    await ch.call(["a", "b"], Stub(a=("error", 503), b=("ok", 0)))
+    check("连续失败后熔断", ch.breaker("a").state == "open", ch.breaker("a").to_dict())
+    await asyncio.sleep(0.25)
+    check("available 只查看，不改变熔断状态", ch.available(["a", "b"]) == ["a", "b"] and ch.breaker("a").state == "open",
+          ch.breaker("a").to_dict())
+    ch.failovers, stub = 0, Stub(a=("ok", 0.05), b=("ok", 0.05))
+    res = await asyncio.gather(*(ch.call(["a", "b"], stub) for _ in range(10)))
+    check("半开时只有一个请求试探", stub.calls.count("a") == 1 and [p for _, p in res].count("b") == 9, stub.calls)
+    check("被拦下的请求不算转移", ch.failovers == 0, ch.stats())
+    check("试探成功后恢复", ch.breaker("a").to_dict() == {"state": "closed", "failures": 0, "trips": 1, "probing": False},
+          ch.breaker("a").to_dict())
+
+
+async def hedging(check):
+    ch, stub = chain(hedge_after=0.05), Stub(a=("ok", 1.0), b=("ok", 0.01))
+    t = time.perf_counter()
+    result, p = await ch.call(["a", "b"], stub)
+    await asyncio.sleep(0)
+    elapsed = time.perf_counter() - t
+    check("慢的提供商超过阈值后对冲，先返回者胜", p == "b" and elapsed < 0.5, f"{p} {elapsed:.3f}s")
+    check("对冲输家被取消，不计入熔断", stub.cancelled == ["a"] and ch.breaker("a").failures == 0, stub.cancelled)
+    check("对冲计数", ch.hedges == 1 and ch.hedge_wins == 1 and ch.failovers == 0, ch.stats())
+    ch, stub = chain(hedge_after=0.05), Stub(a=("ok", 0.01), b=("ok", 0.01))
+    await ch.call(["a", "b"], stub)
+    check("首个提供商够快时不对冲", stub.calls == ["a"] and ch.hedges == 0, stub.calls)
+
+
+async def main():
+    failed = []
+
+    def check(name, ok, detail=""):
+        print(f"{'ok  ' if ok else 'FAIL'} {name}" + ("" if ok else f"  <- {detail}"), file=sys.__stdout__)
+        if not ok: failed.append(name)
+
+    for case in (failover_order, non_transient, single_probe, hedging):
+        print(f"\n# {case.__name__}")
+        with contextlib.redirect_stdout(io.StringIO()):  # 链内部的 [AI] 日志不输出
+            await case(check)
+    return failed
+
+
+if __name__ == "__main__":
+    failed = asyncio.run(main())
+    if failed: sys.exit("失败: " + "；".join(failed))
@@ -0,0 +1,67 @@
+"""_mark 高亮微基准：旧版逐词 re.sub 循环 vs 单次扫描高亮器
+
+用法（在 backend 目录下）: python bench/bench_mark.py
+"""
+import os, random, re, string, sys, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from app.highlight import Highlighter, get_highlighter
+
+
+def legacy_mark(text, word_dict):
+    """旧实现：每个单词一次正则编译 + 全文重写"""
+    if not text: return ''
+    result = re.sub(r'\[\[([^\]]+)\]\]', r'\1', text)
+    for wl, info in word_dict.items():
+        w = info['word']
+        tip = f"{w}: {info.get('pos','')} {info.get('meaning','')}".strip().replace('<','&lt;').replace('>','&gt;')
+        repl = f"<span class='word-highlight'>\\1<span class='tooltip'>{tip}</span></span>"
+        result = re.sub(r'\b(' + re.escape(w) + r')\b', repl, result, flags=re.IGNORECASE)
+    return result
+
+
+def make_words(n, rnd):
+    words = set()
+    while len(words) < n:
+        words.add(''.join(rnd.choice(string.ascii_lowercase) for _ in range(rnd.randint(4, 12))))
+    return {w: {"word": w, "pos": "n.", "meaning": "释义"} for w in words}
+
+
+def make_text(n_tokens, vocab, rnd):
+    filler = ["the", "a", "story", "light", "morning", "他", "走进", "图书馆", "and", "quietly"]
+    return " ".join(f"[[{rnd.choice(vocab)}]]" if rnd.random() < 0.1 else rnd.choice(filler) for _ in range(n_tokens))
+
+
+def timeit(fn, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        t = time.perf_counter(); fn(); best = min(best, time.perf_counter() - t)
+    return best * 1000
+
+
+def main():
+    rnd = random.Random(42)
+    print("== 固定 200 词，文本长度递增（5 场景 × 4 段 × zh/en/zh_pure = 60 段）==")
+    print(f"{'tokens/段':>10} {'legacy ms':>10} {'new ms':>10} {'speedup':>8}")
+    wd = make_words(200, rnd)
+    vocab = [v['word'] for v in wd.values()]
+    for n in (50, 100, 200, 400, 800):
+        paras = [make_text(n, vocab, rnd) for _ in range(60)]
+        lt = timeit(lambda: [legacy_mark(p, wd) for p in paras], repeat=2)
+        nt = timeit(lambda: [get_highlighter(wd).mark(p) for p in paras])
+        print(f"{n:>10} {lt:>10.1f} {nt:>10.2f} {lt/nt:>7.0f}x")
+
+    print("\n== 固定文本（60 段 × 200 tokens），词表大小递增 ==")
+    print(f"{'words':>10} {'legacy ms':>10} {'new ms':>10} {'build ms':>10}")
+    for n in (50, 200, 800, 2000):
+        wd = make_words(n, rnd)
+        vocab = [v['word'] for v in wd.values()]
+        paras = [make_text(200, vocab, rnd) for _ in range(60)]
+        lt = timeit(lambda: [legacy_mark(p, wd) for p in paras], repeat=1)
+        bt = timeit(lambda: Highlighter(wd), repeat=1)
+        nt = timeit(lambda: [get_highlighter(wd).mark(p) for p in paras])
+        print(f"{n:>10} {lt:>10.1f} {nt:>10.2f} {bt:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""热点函数微基准：_mark、_build、_json、Analytics.get_stats
+
+Analytics.get_stats 分别测内存聚合和开启持久化（写库线程、共享计数器、analytics_users）两种情况，
+两者在 1k 和 100k 事件下的耗时都应基本持平。
+用法（在 backend 目录下）: python bench/bench_micro.py [--quick]
+"""
+import asyncio, contextlib, io, json, os, random, string, sys, tempfile, time
+
+os.environ.setdefault("ANALYTICS_PERSIST", "0")  # 模块级单例不启动写库线程，持久化的实例在下面单独创建
+os.chdir(tempfile.mkdtemp())  # 临时数据库
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from app import models  # 注册表定义，create_tables 才会建表
+from app.ai_service import AIService
+from app.analytics import Analytics
+from app.database import Base, create_tables
+from app.shared_state import shared
+
+QUICK = "--quick" in sys.argv
+
+
+def bench(fn, min_time=0.2 if QUICK else 1.0):
+    """重复调用直到累计 min_time 秒，返回每次调用的微秒数"""
+    fn()
+    n, total = 0, 0.0
+    while total < min_time:
+        batch = max(1, n or 1)
+        t = time.perf_counter()
+        for _ in range(batch): fn()
+        total += time.perf_counter() - t
+        n += batch
+    return total / n * 1e6
+
+
+def make_words(n, rnd):
+    words = set()
+    while len(words) < n:
+        words.add(''.join(rnd.choice(string.ascii_lowercase) for _ in range(rnd.randint(5, 12))))
+    return {w: {"word": w, "pos": "adj.", "meaning": "无处不在的"} for w in sorted(words)}
+
+
+def make_raw(wd):
+    words, scenes = list(wd), []
+    for s in range(0, len(words), 20):
+        group = words[s:s + 20]
+        paras = [{"zh": "，".join(f"一位[[{w}]]的学者" for w in group[p:p + 4]),
+                  "en": ", ".join(f"a [[{w}]] scholar turns the page" for w in group[p:p + 4]),
+                  "zh_pure": "，".join("一位学者" for _ in group[p:p + 4])} for p in range(0, len(group), 4)]
+        scenes.append({"scene_id": len(scenes) % 50 + 1, "words_in_scene": group, "paragraphs": paras})
+    return {"scenes": scenes}
+
+
+def row(name, size, us):
+    print(f"{name:<22} {size:>10} {us:>12.1f} {1e6 / us:>12.0f}")
+
+
+def main():
+    rnd = random.Random(7)
+    svc = AIService.__new__(AIService)  # 只用到纯计算方法，不初始化客户端
+    print(f"{'benchmark':<22} {'size':>10} {'us/op':>12} {'ops/s':>12}")
+    for n in (60, 600):
+        wd = make_words(n, rnd)
+        raw = make_raw(wd)
+        text = " ".join(p["en"] for s in raw["scenes"] for p in s["paragraphs"])
+        row("_mark", f"{n} words", bench(lambda: svc._mark(text, wd)))
+        with contextlib.redirect_stdout(io.StringIO()):  # _build 每个场景打印一行日志
+            us = bench(lambda: svc._build(raw, wd))
+        row("_build", f"{n} words", us)
+        body = json.dumps(raw, ensure_ascii=False)
+        wrapped = "好的，以下是生成的场景：\n```json\n" + body + "\n```"
+        row("_json", f"{len(body) // 1024} KB", bench(lambda: svc._json(wrapped)))
+
+    for events in (1_000, 100_000):
+        a = Analytics()
+        track(a, events, rnd)
+        row("Analytics.get_stats", f"{events} ev", bench(a.get_stats))
+
+    create_tables(Base.metadata)
+    a = Analytics(persist=True)
+    shared.register("analytics", a.counters, expire=Analytics.expired)  # 代替模块级单例上报
+    with contextlib.redirect_stdout(io.StringIO()):
+        a.restore()
+    a.writer.start()
+    tracked = 0
+    for events in (1_000, 100_000):
+        track(a, events - tracked, rnd)
+        tracked = events
+        a.writer.stop()  # 全部落库后再测，和长时间运行的进程一致
+        a.writer.start()
+        asyncio.run(shared.sync_once())
+        row("get_stats (persist)", f"{events} ev", bench(a.get_stats))
+    a.writer.stop()
+
+
+def track(a, events, rnd):
+    now = time.time()
+    for i in range(events):
+        a.track(rnd.choice(["page_view", "generate_scene", "login", "file_upload"]), user_id=i % 500 or None,
+                is_guest=i % 3 == 0, data={"i": i}, timestamp=now - rnd.random() * 86400)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""场景格式体积对比：旧版预渲染 HTML vs 紧凑格式（纯文本 + 单词标注 + 共享单词表）
+
+同时校验 to_html 还原结果与旧版 HTML 逐字节一致。
+用法（在 backend 目录下）: python bench/bench_scene_format.py
+"""
+import contextlib, gzip, io, json, os, random, string, sys, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from app.ai_service import AIService, SCENES
+from app.highlight import get_highlighter
+from app.scene_format import word_table, scenes_to_html
+
+MEANINGS = ["无处不在的，普遍存在的", "宽宏大量的；慷慨的", "短暂的，转瞬即逝的", "勤勉的，孜孜不倦的", "模棱两可的"]
+
+
+def legacy_build(raw, wd):
+    """旧实现：每段 zh/en/zh_pure 各自渲染成带 tooltip 的 HTML"""
+    result, hl = [], get_highlighter(wd)
+    for i, rs in enumerate(raw.get('scenes', [])):
+        sid = rs.get('scene_id', 1)
+        info = SCENES.get(sid, SCENES[1])
+        zh, en, tr = [], [], []
+        for p in rs.get('paragraphs', []):
+            zh.append(f"<p class='mb-3'>{hl.mark(p.get('zh',''))}</p>")
+            en.append(f"<p class='mb-3'>{hl.mark(p.get('en',''))}</p>")
+            tr.append(hl.mark(p.get('zh_pure','')))
+        result.append({
+            "id": i+1, "scene_id": sid, "icon": "fa-book", "bgImage": info["url"], "words_used": rs.get('words_in_scene', []),
+            "zh": {"title": info["title_zh"], "anchors": "入口中央角落", "content": "".join(zh), "translationParagraphs": tr},
+            "en": {"title": info["title_en"], "anchors": "EntranceCentralCorner", "content": "".join(en)}
+        })
+    return result
+
+
+def make_raw(n_words, rnd, spaced):
+    """模拟 LLM 输出：每个单词在中英文段落里各出现一次，每段 4 个单词，每场景 5 段
+
+    中文里单词紧贴汉字时 \b 不成立、不会高亮（spaced=False，与线上多数输出一致）；
+    spaced=True 时单词两侧有空格，中文段落也会高亮。
+    """
+    sp = " " if spaced else ""
+    words = set()
+    while len(words) < n_words:
+        words.add(''.join(rnd.choice(string.ascii_lowercase) for _ in range(rnd.randint(5, 12))))
+    words = sorted(words)
+    wd = {w: {"word": w, "pos": rnd.choice(["adj.", "n.", "v."]), "meaning": rnd.choice(MEANINGS)} for w in words}
+    scenes, per_para, per_scene = [], 4, 20
+    for s in range(0, n_words, per_scene):
+        group = words[s:s+per_scene]
+        paras = []
+        for p in range(0, len(group), per_para):
+            ws = group[p:p+per_para]
+            paras.append({
+                "zh": "清晨的阳光洒进图书馆，" + "，".join(f"一位{sp}[[{w}]]{sp}的学者翻开书页" for w in ws) + "。",
+                "en": "Morning light fills the library, " + ", ".join(f"a [[{w}]] scholar turns the page" for w in ws) + ".",
+                "zh_pure": "清晨的阳光洒进图书馆，" + "，".join("一位学者翻开书页" for _ in ws) + "。",
+            })
+        scenes.append({"scene_id": len(scenes) % 50 + 1, "words_in_scene": group, "paragraphs": paras})
+    return {"scenes": scenes}, wd
+
+
+def size(obj):
+    b = json.dumps(obj, ensure_ascii=False).encode('utf-8')
+    return len(b), len(gzip.compress(b, 6))
+
+
+def main():
+    rnd = random.Random(42)
+    for spaced in (False, True):
+        print(f"\n== 单词高亮位置：{'中文 + 英文段落' if spaced else '仅英文段落'} ==")
+        run(rnd, spaced)
+    print("\nto_html 还原结果与旧版 HTML 一致")
+
+
+def run(rnd, spaced):
+    print(f"{'words':>6} {'html KB':>9} {'compact KB':>11} {'ratio':>6} {'html gz':>8} {'compact gz':>11} {'to_html ms':>11}")
+    for n in (20, 50, 200, 600):
+        raw, wd = make_raw(n, rnd, spaced)
+        with contextlib.redirect_stdout(io.StringIO()):
+            compact = AIService._build(None, raw, wd)
+        table = word_table(wd)
+        legacy = legacy_build(raw, wd)
+        t = time.perf_counter()
+        rendered = scenes_to_html(compact, table)
+        ms = (time.perf_counter() - t) * 1000
+        assert rendered == legacy, "to_html 输出与旧版 HTML 不一致"
+        (hb, hg), (cb, cg) = size({"scenes": legacy}), size({"scenes": compact, "words": table})
+        print(f"{n:>6} {hb/1024:>9.1f} {cb/1024:>11.1f} {hb/cb:>5.1f}x {hg/1024:>7.1f}K {cg/1024:>10.1f}K {ms:>11.2f}")
+
+
+if __name__ == '__main__':
+    main()
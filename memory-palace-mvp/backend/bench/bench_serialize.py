@@ -0,0 +1,92 @@
+"""响应序列化与压缩基准：200 词生成结果的编码耗时和传输字节数
+
+对比旧路径（HTML 格式 + FastAPI 默认的 jsonable_encoder + json.dumps，不压缩）
+和现在的路径（紧凑格式 + orjson + gzip/brotli），以及 ETag 命中时的 304。
+用法（在 backend 目录下）: python bench/bench_serialize.py [--words 200]
+"""
+import argparse, contextlib, gzip, io, os, random, string, sys, tempfile, time
+
+os.environ.setdefault("ANALYTICS_PERSIST", "0")
+os.chdir(tempfile.mkdtemp())
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from fastapi.encoders import jsonable_encoder
+from starlette.responses import JSONResponse
+
+from app.ai_service import AIService
+from app.responses import BROTLI_QUALITY, GZIP_LEVEL, brotli, dumps, orjson
+from app.scene_format import scenes_to_html, word_table
+
+ZH = "的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可主发年动同工也能下过子说产种面而方后多定行学法所民得经十三之进着等部度家电力里如水化高自二理起小物现实加量都两体制机当使点从业本去把性好应开它合还因由其些然前外天政四日那社义事平形相全表间样与关各重新线内数正心反你明看原又么利比或但质气第向道命此变条只没结解问意建月公无系军很情者最立代想已通并提直题党程展五果料象员革位入常文总次品式活设及管特件长求老头基资边流路级少图山统接知较将组见计别她手角期根论运农指几九区强放决西被干做必战先回则任取据处队南给色光门即保治北造百规热领七海口东导器压志世金增争济阶油思术极交受联什认六共权收证改清己美再采转更单风切打白教速花带安场身车例真务具万每目至达走积示议声报斗完类八离华名确才科张信马节话米整空元况今集温传土许步群广石记需段研界拉林律叫且究观越织装影算低持音众书布复容儿须际商非验连断深难近矿千周委素技备半办青省列习响约支般史感劳便团往酸历市克何除消构府称太准精值号率族维划选标写存候毛亲快效斯院查江型眼王按格养易置派层片始却专状育厂京识适属圆包火住调满县局照参红细引听该铁价严"
+EN = ["the", "morning", "light", "drifts", "across", "quiet", "halls", "where", "students", "gather", "to", "whisper", "about",
+      "distant", "cities", "and", "old", "stories", "while", "a", "clock", "ticks", "slowly", "above", "wooden", "shelves", "full",
+      "of", "forgotten", "maps", "someone", "laughs", "near", "window", "as", "rain", "begins", "fall", "on", "narrow", "streets"]
+
+
+def bench(fn, min_time=0.5):
+    fn()
+    n, total = 0, 0.0
+    while total < min_time:
+        batch = max(1, n or 1)
+        t = time.perf_counter()
+        for _ in range(batch): fn()
+        total += time.perf_counter() - t
+        n += batch
+    return total / n * 1e6
+
+
+def make_words(n, rnd):
+    words = set()
+    while len(words) < n:
+        words.add(''.join(rnd.choice(string.ascii_lowercase) for _ in range(rnd.randint(5, 12))))
+    return {w: {"word": w, "pos": rnd.choice(["n.", "v.", "adj."]), "meaning": ''.join(rnd.choice(ZH) for _ in range(rnd.randint(2, 6)))}
+            for w in sorted(words)}
+
+
+def make_raw(wd, rnd):
+    """与真实输出同样规模的场景：每场景 20 词、每段 4 词，句子由随机词拼成（压缩率不会被重复文本虚高）"""
+    zh = lambda n: ''.join(rnd.choice(ZH) for _ in range(n))
+    en = lambda n: ' '.join(rnd.choice(EN) for _ in range(n))
+    words, scenes = list(wd), []
+    for s in range(0, len(words), 20):
+        group = words[s:s + 20]
+        paras = [{"zh": "，".join(f"{zh(12)}[[{w}]]{zh(8)}" for w in group[p:p + 4]) + "。",
+                  "en": ", ".join(f"{en(8)} [[{w}]] {en(6)}" for w in group[p:p + 4]) + ".",
+                  "zh_pure": "，".join(zh(20) for _ in group[p:p + 4]) + "。"} for p in range(0, len(group), 4)]
+        scenes.append({"scene_id": len(scenes) % 50 + 1, "words_in_scene": group, "paragraphs": paras})
+    return {"scenes": scenes}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="响应序列化与压缩基准")
+    ap.add_argument("--words", type=int, default=200)
+    args = ap.parse_args()
+    rnd = random.Random(7)
+    wd = make_words(args.words, rnd)
+    svc = AIService.__new__(AIService)
+    with contextlib.redirect_stdout(io.StringIO()):
+        scenes = svc._build(make_raw(wd, rnd), wd)
+    words = word_table(wd)
+    compact = {"message": "ok", "scenes": scenes, "words": words, "word_count": len(words), "format": "compact"}
+    html = {"message": "ok", "scenes": scenes_to_html(scenes, words), "word_count": len(words)}
+
+    default = lambda payload: JSONResponse(jsonable_encoder(payload)).body  # FastAPI 默认路径
+    rows = [("html (old)", "jsonable_encoder+json", html, default),
+            ("html", "orjson" if orjson else "json", html, dumps),
+            ("compact", "jsonable_encoder+json", compact, default),
+            ("compact (new)", "orjson" if orjson else "json", compact, dumps)]
+    print(f"{args.words} 词，{len(scenes)} 个场景；brotli {'可用' if brotli else '未安装（pip install brotli）'}\n")
+    print(f"{'payload':<14} {'encoder':<22} {'encode us':>10} {'identity':>10} {'gzip':>9} {'gzip us':>9}" + (f" {'br':>9} {'br us':>9}" if brotli else ""))
+    for name, enc, payload, fn in rows:
+        body = fn(payload)
+        line = f"{name:<14} {enc:<22} {bench(lambda: fn(payload)):>10.0f} {len(body):>10} "
+        gz = gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+        line += f"{len(gz):>9} {bench(lambda: gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)):>9.0f}"
+        if brotli:
+            br = brotli.compress(body, quality=BROTLI_QUALITY)
+            line += f" {len(br):>9} {bench(lambda: brotli.compress(body, quality=BROTLI_QUALITY)):>9.0f}"
+        print(line)
+    print("\nETag 命中（If-None-Match）：304，响应体 0 字节")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""冷启动基准：导入耗时剖析 + 进程启动到可服务的时间、常驻内存、首个生成请求延迟
+
+- 导入剖析：python -X importtime 导入 app.main，列出累计耗时最多的模块，
+  并检查不该在启动时加载的重型依赖（openai / anthropic / pypdf / docx）；
+- 启动：启动 uvicorn，计时到 /health 可用，读取进程 RSS，并抓取一次 /metrics 确认能正常输出；可选对本地桩服务发一个 /generate，
+  看首个生成请求付出的 SDK 导入开销。"eager" 一行在导入 app 前先导入两个 SDK，模拟旧的启动方式。
+用法（在 backend 目录下）:
+    python bench/bench_startup.py
+    python bench/bench_startup.py --runs 5 --generate
+    python bench/bench_startup.py --max-import-ms 1200   # 超过阈值、加载了重型依赖或 /metrics 出错时退出码非 0，可放进 CI
+"""
+import argparse, os, re, socket, statistics, subprocess, sys, tempfile, time
+
+import httpx
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+HEAVY = ("openai", "anthropic", "pypdf", "docx")
+EAGER = "import openai, anthropic; "
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def env_for(workdir, extra=None):
+    return {**os.environ, "PYTHONPATH": BACKEND, "MINIMAX_API_KEY": "stub", "ANALYTICS_PERSIST": "0", **(extra or {})}
+
+
+# ---------- 导入剖析 ----------
+def import_profile(prelude=""):
+    """返回 (总耗时 ms, {模块: 累计 ms})；每次都在新的临时目录里用全新的数据库"""
+    workdir = tempfile.mkdtemp(prefix="startup-")
+    r = subprocess.run([sys.executable, "-X", "importtime", "-c", prelude + "import app.main"], cwd=workdir,
+                       env=env_for(workdir), capture_output=True, text=True)
+    if r.returncode: sys.exit(r.stderr[-2000:])
+    mods, total = {}, 0.0
+    for line in r.stderr.splitlines():
+        m = re.match(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|( +)(\S+)", line)
+        if not m: continue
+        mods[m.group(4)] = int(m.group(2)) / 1000
+        if len(m.group(3)) == 1: total += mods[m.group(4)]  # 最外层的导入，累计耗时之和即总耗时
+    return total, mods
+
+
+def report_imports(runs, top):
+    totals, last = [], {}
+    for _ in range(runs):
+        t, last = import_profile()
+        totals.append(t)
+    eager = [import_profile(EAGER)[0] for _ in range(runs)]
+    print(f"import app.main: {statistics.median(totals):.0f} ms（中位数，{runs} 次）；导入 SDK 的旧方式: {statistics.median(eager):.0f} ms")
+    print(f"\n{'module':<40} {'cumulative ms':>14}")
+    for name, ms in sorted(((k, v) for k, v in last.items() if "." not in k or k.startswith("app.")), key=lambda x: -x[1])[:top]:
+        print(f"{name:<40} {ms:>14.1f}")
+    heavy = [m for m in HEAVY if m in last]
+    print("\n启动时加载的重型依赖:", ", ".join(heavy) or "无")
+    return statistics.median(totals), heavy
+
+
+# ---------- 启动到可服务 ----------
+def rss_mb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"): return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+def start_server(prelude, stub_url, extra_env):
+    port, workdir = free_port(), tempfile.mkdtemp(prefix="startup-")
+    env = env_for(workdir, {"MINIMAX_BASE_URL": f"{stub_url}/anthropic", **extra_env} if stub_url else extra_env)
+    code = prelude + f"import uvicorn; uvicorn.run('app.main:app', port={port}, log_level='warning')"
+    t = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-c", code], cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+    url = f"http://127.0.0.1:{port}"
+    with httpx.Client(timeout=2) as c:
+        while True:
+            if proc.poll() is not None: sys.exit("后端启动失败")
+            try:
+                c.get(f"{url}/health")
+                break
+            except httpx.HTTPError:
+                time.sleep(0.01)
+    return proc, url, (time.perf_counter() - t) * 1000
+
+
+def measure_startup(name, runs, prelude="", stub_url=None, extra_env=None):
+    """返回失败描述列表（/metrics 抓取失败）"""
+    ready, rss, first, failed = [], [], [], []
+    for _ in range(runs):
+        proc, url, ms = start_server(prelude, stub_url, extra_env or {})
+        try:
+            ready.append(ms)
+            time.sleep(2)  # AI_PRELOAD 的后台导入在这段时间里完成
+            rss.append(rss_mb(proc.pid))
+            r = httpx.get(f"{url}/metrics", timeout=10)
+            if r.status_code != 200 or "memory_palace_jobs_queued" not in r.text: failed.append(f"{name}: /metrics 返回 {r.status_code}")
+            if stub_url:
+                t = time.perf_counter()
+                r = httpx.post(f"{url}/generate", json={"name": "s", "words": [{"word": "ubiquitous"}]}, timeout=60)
+                if r.status_code == 200: first.append((time.perf_counter() - t) * 1000)
+        finally:
+            proc.terminate()
+            proc.wait(10)
+    row = f"{name:<22} {statistics.median(ready):>10.0f} {statistics.median(rss):>9.1f}"
+    print(row + (f" {statistics.median(first):>14.0f}" if first else ""))
+    return failed[:1]
+
+
+def main():
+    ap = argparse.ArgumentParser(description="冷启动基准")
+    ap.add_argument("--runs", type=int, default=3)
+    ap.add_argument("--top", type=int, default=15, help="列出累计耗时最多的前 N 个模块")
+    ap.add_argument("--generate", action="store_true", help="启动本地桩服务，测首个 /generate 延迟")
+    ap.add_argument("--max-import-ms", type=float, default=0, help="导入耗时阈值（0 不检查）")
+    args = ap.parse_args()
+
+    import_ms, heavy = report_imports(args.runs, args.top)
+
+    stub, stub_url, failed = None, None, []
+    if args.generate:
+        port = free_port()
+        stub_url = f"http://127.0.0.1:{port}"
+        stub = subprocess.Popen([sys.executable, os.path.join(BACKEND, "bench", "stub_llm.py"), "--port", str(port), "--latency", "0", "--tps", "0"])
+        with httpx.Client() as c:
+            for _ in range(100):
+                try: c.get(f"{stub_url}/stub/stats"); break
+                except httpx.HTTPError: time.sleep(0.1)
+    try:
+        print(f"\n{'startup':<22} {'ready ms':>10} {'RSS MB':>9}" + (f" {'first gen ms':>14}" if stub_url else ""))
+        failed += measure_startup("lazy (default)", args.runs, stub_url=stub_url)
+        failed += measure_startup("lazy + AI_PRELOAD=1", args.runs, stub_url=stub_url, extra_env={"AI_PRELOAD": "1"})
+        failed += measure_startup("eager SDK import", args.runs, prelude=EAGER, stub_url=stub_url)
+    finally:
+        if stub: stub.terminate()
+
+    if heavy: failed.append(f"启动时加载了 {', '.join(heavy)}")
+    if args.max_import_ms and import_ms > args.max_import_ms: failed.append(f"导入耗时 {import_ms:.0f} ms 超过 {args.max_import_ms:.0f} ms")
+    if failed: sys.exit("回归: " + "；".join(failed))
+
+
+if __name__ == "__main__":
+    main()
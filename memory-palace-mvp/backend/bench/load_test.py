@@ -0,0 +1,181 @@
+"""端到端负载测试 - /generate、/parse-file、/track 的吞吐与延迟分位数
+
+默认 --spawn：在临时目录里启动 LLM 桩服务（bench/stub_llm.py）和后端，全部离线运行在本机，结束后自动关闭；
+也可以用 --url 指向一个已经在运行的后端。
+用法（在 backend 目录下）:
+    python bench/load_test.py --duration 20 --concurrency 8
+    python bench/load_test.py --scenarios generate --words 120 --stub-args "--latency 1 --tps 200 --error-rate 0.05"
+    python bench/load_test.py --url http://127.0.0.1:8000 --scenarios track,track_batch
+"""
+import argparse, asyncio, io, json, os, random, shlex, socket, statistics, string, subprocess, sys, tempfile, time
+
+import httpx
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def rand_word(rnd):
+    return "".join(rnd.choice(string.ascii_lowercase) for _ in range(rnd.randint(5, 11)))
+
+
+def word_items(rnd, n):
+    """每次请求都用新单词，避免命中生成缓存和片段库"""
+    return [{"word": rand_word(rnd), "pos": rnd.choice(["n.", "v.", "adj."]), "meaning": "释义"} for _ in range(n)]
+
+
+def word_file(rnd, n):
+    return "\n".join(f"{i + 1}. {rand_word(rnd)} 释义{i}" for i in range(n)).encode("utf-8")
+
+
+# ---------- 场景 ----------
+class Scenario:
+    def __init__(self, name, make_request):
+        self.name, self.make_request = name, make_request
+        self.latencies, self.errors, self.statuses = [], 0, {}
+
+    async def worker(self, client, deadline, rnd):
+        while time.monotonic() < deadline:
+            t = time.perf_counter()
+            try:
+                r = await self.make_request(client, rnd)
+                code = r.status_code
+            except httpx.HTTPError as e:
+                code = type(e).__name__
+            self.statuses[code] = self.statuses.get(code, 0) + 1
+            if code == 200: self.latencies.append((time.perf_counter() - t) * 1000)
+            else: self.errors += 1
+
+
+def scenarios(args):
+    def generate(client, rnd):
+        return client.post("/generate", json={"name": "load", "words": word_items(rnd, args.words)})
+
+    def generate_stream(client, rnd):
+        return client.post("/generate/stream", json={"name": "load", "words": word_items(rnd, args.words)})
+
+    def parse(client, rnd):
+        return client.post("/parse-file", files={"file": ("words.txt", io.BytesIO(word_file(rnd, args.file_lines)), "text/plain")})
+
+    def parse_words(client, rnd):
+        return client.post("/parse-words", content=word_file(rnd, args.file_lines), headers={"Content-Type": "text/plain; charset=utf-8"})
+
+    def track(client, rnd):
+        return client.post("/track", json={"event": "page_view", "data": {"page": rnd.choice(["home", "scene", "login"])}})
+
+    def track_batch(client, rnd):
+        now = time.time()
+        return client.post("/track/batch", json={"events": [{"event": "page_view", "data": {"page": "scene"}, "ts": now} for _ in range(50)]})
+
+    table = {"generate": generate, "generate_stream": generate_stream, "parse": parse, "parse_words": parse_words,
+             "track": track, "track_batch": track_batch}
+    unknown = [s for s in args.scenarios if s not in table]
+    if unknown: sys.exit(f"未知场景: {', '.join(unknown)}（可选: {', '.join(table)}）")
+    return [Scenario(s, table[s]) for s in args.scenarios]
+
+
+def pct(xs, q):
+    if not xs: return 0.0
+    if len(xs) == 1: return xs[0]
+    return statistics.quantiles(xs, n=100, method="inclusive")[q - 1]
+
+
+def report(results, duration):
+    print(f"\n{'endpoint':<16} {'ok':>7} {'err':>5} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}  status")
+    for s in results:
+        lat = s.latencies
+        print(f"{s.name:<16} {len(lat):>7} {s.errors:>5} {len(lat) / duration:>8.1f} {pct(lat, 50):>9.1f} {pct(lat, 95):>9.1f} "
+              f"{pct(lat, 99):>9.1f} {max(lat or [0]):>9.1f}  {s.statuses}")
+
+
+async def run(url, args):
+    results = scenarios(args)
+    rnd = random.Random(args.seed)
+    limits = httpx.Limits(max_connections=args.concurrency * len(results) + 4)
+    async with httpx.AsyncClient(base_url=url, timeout=args.timeout, limits=limits) as client:
+        deadline = time.monotonic() + args.duration
+        t = time.monotonic()
+        await asyncio.gather(*(s.worker(client, deadline, random.Random(rnd.random())) for s in results for _ in range(args.concurrency)))
+        report(results, time.monotonic() - t)
+        if args.workers > 1: await asyncio.sleep(3)  # 等各 worker 把最后一批用量计数上报到共享表
+        try:
+            stats = (await client.get("/admin/stats", params={"key": args.admin_key})).json()
+            print("\nLLM 调用:", json.dumps({k: stats["ai_usage"].get(k) for k in ("total_calls", "total_input_tokens", "total_output_tokens")}, ensure_ascii=False))
+            print("HTTP 连接池:", json.dumps(stats.get("http", {}).get("providers", {}), ensure_ascii=False))
+            print("完整性:", json.dumps(stats.get("completeness", {}), ensure_ascii=False))
+            adm = stats.get("admission", {})
+            print("准入控制:", json.dumps({k: adm.get(k) for k in ("admitted", "rejected_queue_full", "rejected_timeout", "rate_limited", "peak_queue")}, ensure_ascii=False))
+        except Exception:
+            pass
+
+
+# ---------- 启动桩服务和后端 ----------
+async def wait_ready(url, proc, timeout=30):
+    async with httpx.AsyncClient(timeout=2) as c:
+        end = time.monotonic() + timeout
+        while time.monotonic() < end:
+            if proc.poll() is not None: sys.exit(f"进程提前退出: {proc.args}")
+            try:
+                await c.get(url)
+                return
+            except httpx.HTTPError:
+                await asyncio.sleep(0.2)
+    sys.exit(f"等待 {url} 超时")
+
+
+async def spawn_and_run(args):
+    stub_port, app_port = free_port(), free_port()
+    stub_url = f"http://127.0.0.1:{stub_port}"
+    workdir = tempfile.mkdtemp(prefix="load-")  # 临时数据库，不碰 backend 目录下的 memory_palace.db
+    env = {**os.environ, "MINIMAX_BASE_URL": f"{stub_url}/anthropic", "ZHIPU_BASE_URL": f"{stub_url}/v1", "DEEPSEEK_BASE_URL": f"{stub_url}/v1",
+           "MINIMAX_API_KEY": "stub", "ZHIPU_API_KEY": "stub", "DEEPSEEK_API_KEY": "stub", "AI_PROVIDER": args.provider,
+           "ADMIN_KEY": args.admin_key}
+    procs = []
+    try:
+        stub = subprocess.Popen([sys.executable, os.path.join(BACKEND, "bench", "stub_llm.py"), "--port", str(stub_port), *shlex.split(args.stub_args)],
+                                cwd=workdir, env=env)
+        procs.append(stub)
+        await wait_ready(f"{stub_url}/stub/stats", stub)
+        log = open(os.path.join(workdir, "backend.log"), "w")
+        app = subprocess.Popen([sys.executable, "-m", "uvicorn", "app.main:app", "--app-dir", BACKEND, "--port", str(app_port),
+                                "--log-level", "warning", "--workers", str(args.workers)], cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+        procs.append(app)
+        url = f"http://127.0.0.1:{app_port}"
+        await wait_ready(f"{url}/health", app)
+        print(f"桩服务 {stub_url}，后端 {url}（日志 {log.name}）")
+        await run(url, args)
+        async with httpx.AsyncClient() as c:
+            print("桩服务:", (await c.get(f"{stub_url}/stub/stats")).json())
+    finally:
+        for p in reversed(procs):
+            p.terminate()
+            try: p.wait(10)
+            except subprocess.TimeoutExpired: p.kill()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="端到端负载测试")
+    ap.add_argument("--url", help="已在运行的后端地址；不指定时自动启动桩服务和后端")
+    ap.add_argument("--scenarios", default="generate,parse,track", type=lambda s: [x.strip() for x in s.split(",") if x.strip()],
+                    help="generate,generate_stream,parse,parse_words,track,track_batch")
+    ap.add_argument("--duration", type=float, default=20, help="每轮持续秒数")
+    ap.add_argument("--concurrency", type=int, default=8, help="每个场景的并发数")
+    ap.add_argument("--words", type=int, default=60, help="每次生成请求的单词数")
+    ap.add_argument("--file-lines", type=int, default=2000, help="上传文件的行数")
+    ap.add_argument("--timeout", type=float, default=120)
+    ap.add_argument("--provider", default="minimax")
+    ap.add_argument("--workers", type=int, default=1, help="后端 uvicorn worker 数（--spawn 时）")
+    ap.add_argument("--stub-args", default="", help='传给 stub_llm.py 的参数，例如 "--latency 1 --tps 200"')
+    ap.add_argument("--admin-key", default=os.getenv("ADMIN_KEY", "admin123"))
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+    asyncio.run(run(args.url, args) if args.url else spawn_and_run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+"""本地 LLM 桩服务 - 模拟 MiniMax（Anthropic messages）与智谱/DeepSeek（OpenAI chat completions）接口
+
+按提示词里的单词表生成格式正确的场景 JSON，支持流式与非流式，可配置首字延迟、输出速率和故障注入，
+调优和压测不再消耗真实的提供商额度。完全离线运行。
+
+用法（在 backend 目录下）:
+    python bench/stub_llm.py --port 9100 --latency 0.5 --tps 300 --error-rate 0.02
+然后让后端指向它:
+    MINIMAX_BASE_URL=http://127.0.0.1:9100/anthropic ZHIPU_BASE_URL=http://127.0.0.1:9100/v1 \\
+    DEEPSEEK_BASE_URL=http://127.0.0.1:9100/v1 MINIMAX_API_KEY=stub uvicorn app.main:app --port 8000
+"""
+import argparse, asyncio, hashlib, json, random, re, time, uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+
+class StubConfig:
+    latency = 0.3        # 首个 token 前的延迟（秒）
+    jitter = 0.2         # 延迟随机浮动比例
+    tps = 400.0          # 输出速率（token/秒，0 表示不限速）
+    error_rate = 0.0     # 直接返回错误状态码的概率
+    error_status = 500
+    drop_rate = 0.0      # 每个单词被故意漏掉（不写进场景）的概率
+    truncate_rate = 0.0  # 输出在中途被截断的概率
+    capacity = 0         # 同时处理的请求上限，超出返回 429（模拟提供商配额，0 不限）
+    seed = None
+
+
+cfg = StubConfig()
+rnd = random.Random()
+app = FastAPI(title="LLM stub")
+stats = {"requests": 0, "errors": 0, "truncated": 0, "stream": 0, "throttled": 0, "active": 0, "peak_active": 0}
+_seen_prefixes = set()
+
+WORDS_HEADER = re.compile(r"单词\((\d+)个")
+FILLER_ZH = ["清晨的阳光洒进来", "远处传来一阵笑声", "空气里弥漫着咖啡香", "人们在低声交谈"]
+FILLER_EN = ["morning light drifts in", "laughter echoes in the distance", "the air smells of coffee", "people talk in low voices"]
+
+
+# ---------- 场景 JSON ----------
+def prompt_words(prompt):
+    """从 _prompt 生成的 'word|pos|meaning' 行里取出单词"""
+    m = WORDS_HEADER.search(prompt)
+    lines = prompt[m.end():].split("\n")[1:] if m else prompt.split("\n")
+    return [ln.split("|")[0].strip() for ln in lines if ln.strip() and re.match(r"^[A-Za-z][\w\-' ]*(\||$)", ln.strip())]
+
+
+def scene_json(words):
+    """每场景最多 20 个单词、每段 4 个；drop_rate 控制故意漏掉的单词比例"""
+    kept = [w for w in words if rnd.random() >= cfg.drop_rate]
+    ids = rnd.sample(range(1, 51), 50)
+    scenes = []
+    for s in range(0, len(kept), 20):
+        group, paras = kept[s:s + 20], []
+        for p in range(0, len(group), 4):
+            ws = group[p:p + 4]
+            paras.append({
+                "zh": "，".join(f"{rnd.choice(FILLER_ZH)}，一位[[{w}]]的旅人停下脚步" for w in ws) + "。",
+                "en": ", ".join(f"{rnd.choice(FILLER_EN)}, a [[{w}]] traveler pauses" for w in ws) + ".",
+                "zh_pure": "，".join(f"{rnd.choice(FILLER_ZH)}，一位旅人停下脚步" for _ in ws) + "。",
+            })
+        scenes.append({"scene_id": ids[len(scenes) % 50], "words_in_scene": group, "paragraphs": paras})
+    text = json.dumps({"scenes": scenes}, ensure_ascii=False)
+    if text and rnd.random() < cfg.truncate_rate:
+        stats["truncated"] += 1
+        text = text[:rnd.randint(len(text) // 3, len(text) - 2)]
+    return text
+
+
+def tokens(text):
+    return max(1, len(text) // 3)
+
+
+def usage_for(system, prompt):
+    """同一 system 前缀第二次出现起按提示缓存命中计"""
+    key = hashlib.sha1(system.encode("utf-8")).hexdigest()
+    cached = tokens(system) if key in _seen_prefixes else 0
+    _seen_prefixes.add(key)
+    return tokens(system) + tokens(prompt) - cached, cached
+
+
+async def first_token_delay():
+    await asyncio.sleep(max(0.0, cfg.latency * (1 + rnd.uniform(-cfg.jitter, cfg.jitter))))
+
+
+def pieces(text, size=16):
+    for i in range(0, len(text), size): yield text[i:i + size]
+
+
+async def paced(text):
+    """按 tps 节奏逐块产出文本"""
+    for piece in pieces(text):
+        if cfg.tps > 0: await asyncio.sleep(tokens(piece) / cfg.tps)
+        yield piece
+
+
+def injected_error():
+    stats["requests"] += 1
+    if cfg.capacity and stats["active"] >= cfg.capacity:
+        stats["throttled"] += 1
+        return JSONResponse({"error": {"type": "rate_limit_error", "message": "stub capacity exceeded"}}, status_code=429)
+    if rnd.random() < cfg.error_rate:
+        stats["errors"] += 1
+        return JSONResponse({"error": {"type": "stub_error", "message": "injected failure"}}, status_code=cfg.error_status)
+    return None
+
+
+def sse(data, event=None):
+    return (f"event: {event}\n" if event else "") + f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _text_of(content):
+    if isinstance(content, str): return content
+    return "".join(c.get("text", "") for c in content or [] if isinstance(c, dict))
+
+
+@app.middleware("http")
+async def count_active(request, call_next):
+    """统计进行中的请求（流式响应在 body 发送完之前都算进行中）"""
+    stats["active"] += 1
+    stats["peak_active"] = max(stats["peak_active"], stats["active"])
+    done = False
+    def finish():
+        nonlocal done
+        if not done:
+            done = True
+            stats["active"] -= 1
+    try:
+        response = await call_next(request)
+    except Exception:
+        finish()
+        raise
+    body = response.body_iterator
+    async def tracked():
+        try:
+            async for chunk in body: yield chunk
+        finally:
+            finish()
+    response.body_iterator = tracked()
+    return response
+
+
+# ---------- Anthropic messages（MiniMax） ----------
+@app.post("/anthropic/v1/messages")
+async def anthropic_messages(request: Request):
+    if (err := injected_error()) is not None: return err
+    body = await request.json()
+    system, prompt = _text_of(body.get("system")), _text_of(body["messages"][-1]["content"])
+    text = scene_json(prompt_words(prompt))
+    fresh, cached = usage_for(system, prompt)
+    usage = {"input_tokens": fresh, "output_tokens": tokens(text), "cache_read_input_tokens": cached, "cache_creation_input_tokens": 0}
+    mid, model = f"msg_{uuid.uuid4().hex[:24]}", body.get("model", "stub")
+    await first_token_delay()
+    if not body.get("stream"):
+        if cfg.tps > 0: await asyncio.sleep(tokens(text) / cfg.tps)
+        return {"id": mid, "type": "message", "role": "assistant", "model": model, "content": [{"type": "text", "text": text}],
+                "stop_reason": "end_turn", "stop_sequence": None, "usage": usage}
+
+    async def events():
+        stats["stream"] += 1
+        yield sse({"type": "message_start", "message": {"id": mid, "type": "message", "role": "assistant", "model": model, "content": [],
+                   "stop_reason": None, "stop_sequence": None, "usage": {**usage, "output_tokens": 1}}}, "message_start")
+        yield sse({"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}}, "content_block_start")
+        async for piece in paced(text):
+            yield sse({"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": piece}}, "content_block_delta")
+        yield sse({"type": "content_block_stop", "index": 0}, "content_block_stop")
+        yield sse({"type": "message_delta", "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                   "usage": {"output_tokens": usage["output_tokens"]}}, "message_delta")
+        yield sse({"type": "message_stop"}, "message_stop")
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+# ---------- OpenAI chat completions（智谱 / DeepSeek） ----------
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    if (err := injected_error()) is not None: return err
+    body = await request.json()
+    msgs = body["messages"]
+    system = "".join(_text_of(m["content"]) for m in msgs if m["role"] == "system")
+    prompt = _text_of(msgs[-1]["content"])
+    text = scene_json(prompt_words(prompt))
+    fresh, cached = usage_for(system, prompt)
+    usage = {"prompt_tokens": fresh + cached, "completion_tokens": tokens(text), "total_tokens": fresh + cached + tokens(text),
+             "prompt_cache_hit_tokens": cached, "prompt_tokens_details": {"cached_tokens": cached}}
+    cid, model, created = f"chatcmpl-{uuid.uuid4().hex[:24]}", body.get("model", "stub"), int(time.time())
+    await first_token_delay()
+    if not body.get("stream"):
+        if cfg.tps > 0: await asyncio.sleep(tokens(text) / cfg.tps)
+        return {"id": cid, "object": "chat.completion", "created": created, "model": model, "usage": usage,
+                "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": text}}]}
+
+    def chunk(delta, finish=None):
+        return {"id": cid, "object": "chat.completion.chunk", "created": created, "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish}]}
+
+    async def events():
+        stats["stream"] += 1
+        yield sse(chunk({"role": "assistant", "content": ""}))
+        async for piece in paced(text): yield sse(chunk({"content": piece}))
+        yield sse(chunk({}, "stop"))
+        if (body.get("stream_options") or {}).get("include_usage"):
+            yield sse({"id": cid, "object": "chat.completion.chunk", "created": created, "model": model, "choices": [], "usage": usage})
+        yield "data: [DONE]\n\n"
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+# ---------- 其他 ----------
+@app.api_route("/", methods=["GET", "HEAD"])
+@app.api_route("/{path:path}", methods=["HEAD"])
+async def warm_target(path: str = ""):
+    """连接预热用的 HEAD 请求"""
+    return Response(status_code=204)
+
+
+@app.get("/stub/stats")
+async def stub_stats():
+    return {**stats, "config": {k: getattr(cfg, k) for k in vars(StubConfig) if not k.startswith("_")}}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="本地 LLM 桩服务")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=9100)
+    ap.add_argument("--latency", type=float, default=cfg.latency, help="首个 token 前的延迟（秒）")
+    ap.add_argument("--jitter", type=float, default=cfg.jitter, help="延迟随机浮动比例")
+    ap.add_argument("--tps", type=float, default=cfg.tps, help="输出 token/秒（0 不限速）")
+    ap.add_argument("--error-rate", type=float, default=cfg.error_rate)
+    ap.add_argument("--error-status", type=int, default=cfg.error_status)
+    ap.add_argument("--drop-rate", type=float, default=cfg.drop_rate, help="单词被漏掉的概率")
+    ap.add_argument("--truncate-rate", type=float, default=cfg.truncate_rate, help="输出被截断的概率")
+    ap.add_argument("--capacity", type=int, default=cfg.capacity, help="同时处理的请求上限，超出返回 429（0 不限）")
+    ap.add_argument("--seed", type=int, default=None)
+    args = ap.parse_args()
+    for k in ("latency", "jitter", "tps", "error_rate", "error_status", "drop_rate", "truncate_rate", "capacity", "seed"): setattr(cfg, k, getattr(args, k))
+    if cfg.seed is not None: rnd.seed(cfg.seed)
+    import uvicorn
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
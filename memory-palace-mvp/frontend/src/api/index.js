@@ -44,15 +44,24 @@ export const authApi = {
 }
 
 // ========== WordList API ==========
+// 游客保存的词表没有账号归属，读取/删除时带上创建时返回的 access_key
 export const wordListApi = {
-  create: (name, words) => 
-    api.post('/wordlists', { name, words }),
+  create: (name, words, scenes = []) => 
+    api.post('/wordlists', { name, words, scenes }),
   
-  getAll: () => 
-    api.get('/wordlists'),
+  // 键集分页：返回 { items, next_cursor }，next_cursor 为空表示没有更多
+  getAll: (cursor = null, limit = 20) => 
+    api.get('/wordlists', { params: { cursor, limit } }),
   
-  getOne: (id) => 
-    api.get(`/wordlists/${id}`)
+  getOne: (id, key) => 
+    api.get(`/wordlists/${id}`, { params: { key } }),
+  
+  // 场景分段加载：返回 { scenes, next }
+  getScenes: (id, key, start = 0, limit = 50) =>
+    api.get(`/wordlists/${id}/scenes`, { params: { key, start, limit } }),
+  
+  remove: (id, key) =>
+    api.delete(`/wordlists/${id}`, { params: { key } })
 }
 
 // ========== Generate API ==========
@@ -65,10 +74,104 @@ export const generateApi = {
     api.post('/guest/generate', { name, words })
 }
 
+// ========== 后台生成任务 API ==========
+export const jobApi = {
+  // 提交后返回 job_id；重复提交相同词表会合并到同一个任务
+  submit: (name, words) =>
+    api.post('/jobs', { name, words }),
+  
+  // wait > 0 时长轮询，任务结束或超时才返回
+  get: (jobId, wait = 0) =>
+    api.get(`/jobs/${jobId}`, { params: { wait } })
+}
+
+// ========== 流式响应 ==========
+// 逐行读取 NDJSON 响应体，每解析出一个对象就回调一次
+export async function readNdjson(res, onItem) {
+  const reader = res.body.getReader()
+  const decoder = new TextDecoder()
+  let buf = ''
+  for (;;) {
+    const { done, value } = await reader.read()
+    buf += decoder.decode(value || new Uint8Array(), { stream: !done })
+    let nl
+    while ((nl = buf.indexOf('\n')) >= 0) {
+      const line = buf.slice(0, nl).trim()
+      buf = buf.slice(nl + 1)
+      if (line) onItem(JSON.parse(line))
+    }
+    if (done) break
+  }
+  if (buf.trim()) onItem(JSON.parse(buf))
+}
+
+// ========== 单词提取 API ==========
+// 服务端流式提取（与 parseWords 规则一致），大文本和文件不在主线程里跑正则；单词分批回调
+const streamWords = async (url, init, onItem) => {
+  const res = await fetch(url, { method: 'POST', ...init })
+  if (!res.ok) throw new Error((await res.json().catch(() => ({}))).detail || '文件解析失败')
+  let error = null
+  await readNdjson(res, (item) => {
+    if (item.type === 'error') error = item.message
+    else onItem(item)
+  })
+  if (error) throw new Error(error)
+}
+
+export const parseApi = {
+  // 粘贴的大段文本
+  words: (text, onItem, signal) =>
+    streamWords('/api/parse-words', { headers: { 'Content-Type': 'text/plain; charset=utf-8' }, body: text, signal }, onItem),
+
+  // PDF / Word / TXT 文件，PDF 每解析完一段页就推送
+  fileWords: (file, onItem) => {
+    const formData = new FormData()
+    formData.append('file', file)
+    return streamWords('/api/parse-file/words', { body: formData }, onItem)
+  }
+}
+
+// 单词记录转回文本框内容（能被 parseWords 重新识别）
+export const wordsToText = (words) =>
+  words.map(w => [w.word + (w.pos ? ':' : ''), w.pos, w.meaning].filter(Boolean).join(' ')).join('\n')
+
 // ========== 埋点 API ==========
+// 事件先进缓冲区，定时或攒满后批量上报；页面隐藏/关闭时用 sendBeacon 把剩余事件发出去
+const TRACK_FLUSH_MS = 5000
+const TRACK_MAX_BUFFER = 50
+let trackBuffer = []
+let trackTimer = null
+
+const flushTrack = (useBeacon = false) => {
+  if (trackTimer) {
+    clearTimeout(trackTimer)
+    trackTimer = null
+  }
+  if (trackBuffer.length === 0) return
+  const events = trackBuffer
+  trackBuffer = []
+  if (useBeacon && navigator.sendBeacon) {
+    const blob = new Blob([JSON.stringify({ events })], { type: 'application/json' })
+    if (navigator.sendBeacon('/api/track/batch', blob)) return
+  }
+  api.post('/track/batch', { events }).catch(() => {})  // 静默失败
+}
+
+if (typeof window !== 'undefined') {
+  document.addEventListener('visibilitychange', () => {
+    if (document.visibilityState === 'hidden') flushTrack(true)
+  })
+  window.addEventListener('pagehide', () => flushTrack(true))
+}
+
 export const trackApi = {
-  track: (event, data = {}) =>
-    api.post('/track', { event, data }).catch(() => {})  // 静默失败
+  track: (event, data = {}) => {
+    trackBuffer.push({ event, data, ts: Date.now() / 1000 })
+    if (trackBuffer.length >= TRACK_MAX_BUFFER) flushTrack()
+    else if (!trackTimer) trackTimer = setTimeout(() => flushTrack(), TRACK_FLUSH_MS)
+    return Promise.resolve()
+  },
+  flush: () => flushTrack()
 }
 
 export default api
@@ -348,6 +348,8 @@ export default function Admin() {
                   <span className="text-cream">{getProviderName(provider)}</span>
                   <div className="text-right">
                     <span className="text-sage mr-3">{data.calls}次</span>
+                    {data.errors > 0 && <span className="text-red-400 mr-3">{data.errors}错</span>}
+                    {data.latency && <span className="text-sage mr-3">p95 {data.latency.p95}s</span>}
                     <span className="text-emerald-400">${data.cost.toFixed(4)}</span>
                   </div>
                 </div>
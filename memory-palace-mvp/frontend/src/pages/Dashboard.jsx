@@ -9,7 +9,7 @@ export default function Dashboard({ user, setUser }) {
 
   useEffect(() => {
     wordListApi.getAll()
-      .then(res => setWordLists(res.data))
+      .then(res => setWordLists(res.data.items))
       .catch(console.error)
       .finally(() => setLoading(false))
   }, [])
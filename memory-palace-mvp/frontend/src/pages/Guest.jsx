@@ -1,8 +1,11 @@
-import { useState, useRef } from 'react'
+import { useState, useRef, useEffect } from 'react'
 import { useNavigate } from 'react-router-dom'
-import { generateApi, trackApi } from '../api'
+import { generateApi, trackApi, parseApi, wordsToText } from '../api'
+import { backgroundUrl } from '../utils/sceneFormat'
 
 const GUEST_WORD_LIMIT = 50
+// 超过这个长度的文本交给服务端流式解析，避免正则卡住页面（与 WordInput 一致）
+const LOCAL_PARSE_LIMIT = 20000
 
 export default function Guest() {
   const [wordsText, setWordsText] = useState('')
@@ -11,7 +14,9 @@ export default function Guest() {
   const [scenes, setScenes] = useState(null)
   const [currentScene, setCurrentScene] = useState(0)
   const [lang, setLang] = useState('zh')
+  const [parsedWords, setParsedWords] = useState([])
   const fileInputRef = useRef(null)
+  const skipParseRef = useRef(false)  // 文本框内容由服务端解析结果回填时，不再重复解析
   const navigate = useNavigate()
 
   const parseWords = (text) => {
@@ -33,24 +38,51 @@ export default function Guest() {
     }).filter(w => w !== null)
   }
 
+  // 实时解析单词
+  useEffect(() => {
+    if (skipParseRef.current) {
+      skipParseRef.current = false
+      return
+    }
+    if (wordsText.length <= LOCAL_PARSE_LIMIT) {
+      setParsedWords(parseWords(wordsText))
+      return
+    }
+    const ctrl = new AbortController()
+    const timer = setTimeout(() => {
+      const words = []
+      parseApi.words(wordsText, (item) => {
+        if (item.type === 'words') {
+          words.push(...item.words)
+          setParsedWords([...words])
+        }
+      }, ctrl.signal).catch((err) => {
+        if (err.name !== 'AbortError') setStatus(`✗ ${err.message}`)
+      })
+    }, 300)
+    return () => {
+      clearTimeout(timer)
+      ctrl.abort()
+    }
+  }, [wordsText])
+
   const handleFileUpload = async (e) => {
     const file = e.target.files[0]
     if (!file) return
 
-    const formData = new FormData()
-    formData.append('file', file)
-
     setStatus('正在解析文件...')
     try {
-      const res = await fetch('/api/parse-file', {
-        method: 'POST',
-        body: formData
+      // 服务端提取单词，只把结果回填到文本框
+      const words = []
+      await parseApi.fileWords(file, (item) => {
+        if (item.type === 'words') words.push(...item.words)
+      })
+      setWordsText((prev) => {
+        const text = wordsToText(words)
+        if (text !== prev) skipParseRef.current = true
+        return text
       })
-      
-      if (!res.ok) throw new Error('文件解析失败')
-      
-      const data = await res.json()
-      setWordsText(data.text)
+      setParsedWords(words)
       setStatus('✓ 文件解析成功')
     } catch (err) {
       setStatus(`✗ ${err.message}`)
@@ -58,7 +90,7 @@ export default function Guest() {
   }
 
   const handleGenerate = async () => {
-    const words = parseWords(wordsText)
+    const words = parsedWords
     if (words.length === 0) {
       setStatus('请输入至少一个单词')
       return
@@ -95,7 +127,7 @@ export default function Guest() {
     }
   }
 
-  const wordCount = parseWords(wordsText).length
+  const wordCount = parsedWords.length
   const isOverLimit = wordCount > GUEST_WORD_LIMIT
 
   // 场景展示模式
@@ -104,7 +136,7 @@ export default function Guest() {
     return (
       <div className="min-h-screen relative">
         {scene?.bgImage && (
-          <div className="fixed inset-0 bg-cover bg-center" style={{ backgroundImage: `url(${scene.bgImage})` }}>
+          <div className="fixed inset-0 bg-cover bg-center" style={{ backgroundImage: `url(${backgroundUrl(scene)})` }}>
             <div className="absolute inset-0 bg-gradient-to-b from-black/30 via-transparent to-black/50"></div>
           </div>
         )}
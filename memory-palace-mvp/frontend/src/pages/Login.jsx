@@ -1,6 +1,6 @@
 import { useState, useEffect } from 'react'
 import { useNavigate } from 'react-router-dom'
-import { trackApi } from '../api'
+import { trackApi, wordListApi } from '../api'
 
 export default function Login() {
   const navigate = useNavigate()
@@ -31,6 +31,8 @@ export default function Login() {
 
   const handleDeleteHistory = (index, e) => {
     e.stopPropagation()
+    const item = histories[index]
+    if (item.wordListId) wordListApi.remove(item.wordListId, item.accessKey).catch(() => {})
     const newHistories = histories.filter((_, i) => i !== index)
     setHistories(newHistories)
     localStorage.setItem('sceneHistories', JSON.stringify(newHistories))
@@ -76,7 +78,7 @@ export default function Login() {
                     <div>
                       <div className="text-cream text-sm">{item.name}</div>
                       <div className="text-sage/60 text-xs">
-                        {item.scenes?.length || 0} 个场景 · {new Date(item.createdAt).toLocaleDateString()}
+                        {item.sceneCount ?? item.scenes?.length ?? 0} 个场景 · {new Date(item.createdAt).toLocaleDateString()}
                       </div>
                     </div>
                   </div>
@@ -1,5 +1,7 @@
-import { useState, useEffect, useRef } from 'react'
+import { useState, useEffect, useRef, useMemo } from 'react'
 import { useNavigate } from 'react-router-dom'
+import { wordListApi } from '../api'
+import { renderScene, backgroundUrl } from '../utils/sceneFormat'
 
 export default function Scene() {
   const navigate = useNavigate()
@@ -14,23 +16,45 @@ export default function Scene() {
   useEffect(() => {
     const historyIndex = localStorage.getItem('currentHistoryIndex')
     const storedHistories = localStorage.getItem('sceneHistories')
-    
-    if (storedHistories && historyIndex !== null) {
+    let entry = null
+    try {
+      entry = JSON.parse(storedHistories || '[]')[parseInt(historyIndex)]
+    } catch (e) {}
+    if (!entry) {
+      navigate('/')
+      setLoading(false)
+      return
+    }
+    if (!entry.wordListId) {
+      setData(entry)
+      setLoading(false)
+      return
+    }
+
+    // 服务端词表：先拿第一段场景马上展示，其余在后台续传；单词表（紧凑场景渲染用）与第一段并行请求
+    let cancelled = false
+    const load = async () => {
+      const scenes = []
+      let start = 0
       try {
-        const histories = JSON.parse(storedHistories)
-        const index = parseInt(historyIndex)
-        if (histories[index]) {
-          setData(histories[index])
-        } else {
-          navigate('/')
+        const wordsReq = wordListApi.getOne(entry.wordListId, entry.accessKey)
+        let words = null
+        while (start != null && !cancelled) {
+          const { data: page } = await wordListApi.getScenes(entry.wordListId, entry.accessKey, start)
+          if (words == null) words = (await wordsReq).data.words || []
+          scenes.push(...page.scenes)
+          start = page.next
+          if (!cancelled) {
+            setData({ ...entry, words, scenes: [...scenes] })
+            setLoading(false)
+          }
         }
       } catch (e) {
-        navigate('/')
+        if (!cancelled && scenes.length === 0) navigate('/')
       }
-    } else {
-      navigate('/')
     }
-    setLoading(false)
+    load()
+    return () => { cancelled = true }
   }, [navigate])
 
   useEffect(() => {
@@ -50,6 +74,12 @@ export default function Scene() {
     setExpandedPara(null)
   }, [currentScene])
 
+  // 紧凑场景只在展示时渲染当前这一个
+  const renderedScene = useMemo(
+    () => renderScene(data?.scenes?.[currentScene], data?.words),
+    [data, currentScene]
+  )
+
   const prevScene = () => setCurrentScene(s => Math.max(0, s - 1))
   const nextScene = () => setCurrentScene(s => Math.min((data?.scenes?.length || 1) - 1, s + 1))
   const toggleLang = () => setLang(l => l === 'zh' ? 'en' : 'zh')
@@ -73,7 +103,7 @@ export default function Scene() {
   }
 
   const scenes = data?.scenes || []
-  const scene = scenes[currentScene]
+  const scene = renderedScene
   const translationParagraphs = scene?.zh?.translationParagraphs || []
 
   // 解析内容为段落数组
@@ -91,7 +121,7 @@ export default function Scene() {
       {scene?.bgImage && (
         <div 
           className="fixed inset-0 bg-cover bg-center z-0"
-          style={{ backgroundImage: `url(${scene.bgImage})` }}
+          style={{ backgroundImage: `url(${backgroundUrl(scene)})` }}
         >
           <div className="absolute inset-0 bg-gradient-to-b from-black/30 via-transparent to-black/50"></div>
         </div>
@@ -1,5 +1,9 @@
 import { useState, useRef, useEffect } from 'react'
 import { useNavigate } from 'react-router-dom'
+import { readNdjson, parseApi, wordsToText, wordListApi } from '../api'
+
+// 超过这个长度的文本交给服务端流式解析，避免正则卡住页面
+const LOCAL_PARSE_LIMIT = 20000
 
 export default function WordInput() {
   const [name, setName] = useState('')
@@ -7,29 +11,44 @@ export default function WordInput() {
   const [loading, setLoading] = useState(false)
   const [status, setStatus] = useState('')
   const [fileName, setFileName] = useState('')
-  const [remainingWords, setRemainingWords] = useState(null)
   const [parsedWords, setParsedWords] = useState([])
   const [isDragging, setIsDragging] = useState(false)
   const fileInputRef = useRef(null)
   const dropZoneRef = useRef(null)
+  const skipParseRef = useRef(false)  // 文本框内容由服务端解析结果回填时，不再重复解析
   const navigate = useNavigate()
 
-  // 检查是否有剩余单词待生成
+  // 旧版本遗留的分批待生成记录，服务端已支持整表生成
   useEffect(() => {
-    const stored = localStorage.getItem('remainingWords')
-    if (stored) {
-      try {
-        setRemainingWords(JSON.parse(stored))
-      } catch (e) {
-        console.error('Failed to parse remaining words:', e)
-      }
-    }
+    localStorage.removeItem('remainingWords')
   }, [])
 
   // 实时解析单词
   useEffect(() => {
-    const words = parseWords(wordsText)
-    setParsedWords(words)
+    if (skipParseRef.current) {
+      skipParseRef.current = false
+      return
+    }
+    if (wordsText.length <= LOCAL_PARSE_LIMIT) {
+      setParsedWords(parseWords(wordsText))
+      return
+    }
+    const ctrl = new AbortController()
+    const timer = setTimeout(() => {
+      const words = []
+      parseApi.words(wordsText, (item) => {
+        if (item.type === 'words') {
+          words.push(...item.words)
+          setParsedWords([...words])
+        }
+      }, ctrl.signal).catch((err) => {
+        if (err.name !== 'AbortError') setStatus(`✗ ${err.message}`)
+      })
+    }, 300)
+    return () => {
+      clearTimeout(timer)
+      ctrl.abort()
+    }
   }, [wordsText])
 
   const generateRandomName = () => {
@@ -119,17 +138,27 @@ export default function WordInput() {
       return
     }
 
-    // PDF/Word 发送到后端解析
-    const formData = new FormData()
-    formData.append('file', file)
-
+    // PDF/Word 发送到后端解析，单词边解析边显示
     setStatus('正在解析文件...')
     try {
-      const res = await fetch('/api/parse-file', { method: 'POST', body: formData })
-      if (!res.ok) throw new Error((await res.json()).detail || '文件解析失败')
-      const data = await res.json()
-      setWordsText(data.text)
-      setStatus('✓ 文件解析成功')
+      const words = []
+      await parseApi.fileWords(file, (item) => {
+        if (item.type === 'words') {
+          words.push(...item.words)
+          setParsedWords([...words])
+        } else if (item.type === 'progress') {
+          setStatus(`正在解析文件... ${item.pages_parsed}/${item.pages} 页，已识别 ${words.length} 个单词`)
+        } else if (item.type === 'done' && item.truncated) {
+          setStatus(`✓ 已解析前 ${item.pages_parsed}/${item.pages} 页`)
+        }
+      })
+      setWordsText((prev) => {
+        const text = wordsToText(words)
+        if (text !== prev) skipParseRef.current = true
+        return text
+      })
+      setParsedWords(words)
+      setStatus((prev) => prev.startsWith('✓') ? prev : '✓ 文件解析成功')
     } catch (err) {
       setStatus(`✗ ${err.message}`)
     }
@@ -190,60 +219,42 @@ export default function WordInput() {
 
     const finalName = name.trim() || generateRandomName()
     setLoading(true)
-    setStatus(parsedWords.length > 200 ? `正在生成前 200 个单词的场景...（共 ${parsedWords.length} 词）` : '正在生成记忆场景...')
+    setStatus(parsedWords.length > 200 ? `正在并行生成 ${parsedWords.length} 个单词的场景...` : '正在生成记忆场景...')
 
     try {
-      const res = await fetch('/api/generate', {
+      // 流式生成：每个场景一完成就推送过来，边生成边显示进度
+      const res = await fetch('/api/generate/stream', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({ name: finalName, words: parsedWords })
       })
       if (!res.ok) throw new Error('生成失败')
       
-      const data = await res.json()
-      setStatus(data.message)
-      
-      saveToHistory({ name: finalName, scenes: data.scenes, createdAt: new Date().toISOString() })
-      
-      if (data.remaining_words?.length > 0) {
-        localStorage.setItem('remainingWords', JSON.stringify({ words: data.remaining_words, originalName: finalName }))
-      } else {
-        localStorage.removeItem('remainingWords')
-      }
-      
-      setTimeout(() => navigate('/scene/view'), 1000)
-    } catch (err) {
-      setStatus('✗ 服务出现了问题，请稍后再试')
-      setLoading(false)
-    }
-  }
-
-  const handleGenerateRemaining = async () => {
-    if (!remainingWords) return
-    setLoading(true)
-    setStatus(`正在生成剩余 ${remainingWords.words.length} 个单词的场景...`)
-    
-    try {
-      const res = await fetch('/api/generate', {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ name: `${remainingWords.originalName}（续）`, words: remainingWords.words })
+      const scenes = []
+      let words = parsedWords
+      await readNdjson(res, (item) => {
+        if (item.type === 'meta' && item.words) {
+          words = item.words  // 紧凑场景的 wordIndex 指向这张表
+        } else if (item.type === 'scene') {
+          scenes.push(item.scene)
+          setStatus(`已生成 ${scenes.length} 个场景：${item.scene.zh?.title || ''}`)
+        } else if (item.type === 'error') {
+          console.error('Generate stream error:', item.message)
+        }
       })
-      if (!res.ok) throw new Error('生成失败')
-      
-      const data = await res.json()
-      saveToHistory({ name: `${remainingWords.originalName}（续）`, scenes: data.scenes, createdAt: new Date().toISOString() })
+      if (scenes.length === 0) throw new Error('生成失败')
+      setStatus(`成功生成 ${scenes.length} 个记忆场景`)
       
-      if (data.remaining_words?.length > 0) {
-        const newRemaining = { words: data.remaining_words, originalName: remainingWords.originalName }
-        localStorage.setItem('remainingWords', JSON.stringify(newRemaining))
-        setRemainingWords(newRemaining)
-      } else {
-        localStorage.removeItem('remainingWords')
-        setRemainingWords(null)
+      // 场景存到服务端，本地只记索引；保存失败时退回把场景整体放进 localStorage
+      const createdAt = new Date().toISOString()
+      try {
+        const { data } = await wordListApi.create(finalName, words, scenes)
+        saveToHistory({ name: finalName, wordListId: data.id, accessKey: data.access_key, sceneCount: scenes.length, createdAt })
+      } catch (err) {
+        saveToHistory({ name: finalName, words, scenes, createdAt })
       }
       
-      navigate('/scene/view')
+      setTimeout(() => navigate('/scene/view'), 1000)
     } catch (err) {
       setStatus('✗ 服务出现了问题，请稍后再试')
       setLoading(false)
@@ -272,27 +283,6 @@ export default function WordInput() {
         </div>
       </header>
 
-      {remainingWords && (
-        <div className="max-w-2xl mx-auto px-4 py-2">
-          <div className="glass-card p-4 border-yellow-500/30">
-            <div className="flex items-center justify-between">
-              <div className="flex items-center gap-3">
-                <div className="w-10 h-10 rounded-full bg-yellow-500/20 flex items-center justify-center">
-                  <i className="fa fa-clock-o text-yellow-400"></i>
-                </div>
-                <div>
-                  <div className="text-cream">有 {remainingWords.words.length} 个单词待生成</div>
-                  <div className="text-sage/60 text-sm">来自「{remainingWords.originalName}」</div>
-                </div>
-              </div>
-              <button onClick={handleGenerateRemaining} disabled={loading} className="btn-primary px-4 py-2 text-sm">
-                继续生成
-              </button>
-            </div>
-          </div>
-        </div>
-      )}
-
       <main className="max-w-2xl mx-auto px-4 py-6 relative z-10">
         <form onSubmit={handleSubmit} className="space-y-6">
           <div className="glass-card p-6">
@@ -353,7 +343,7 @@ export default function WordInput() {
               </div>
               <span className="text-sage">
                 已识别 <span className="text-emerald-400 font-bold">{parsedWords.length}</span> 个单词
-                {parsedWords.length > 200 && <span className="text-yellow-400 ml-2">（将分批生成，每次最多 200 词）</span>}
+                {parsedWords.length > 200 && <span className="text-yellow-400 ml-2">（将自动分块并行生成）</span>}
               </span>
             </div>
             
@@ -0,0 +1,54 @@
+// 紧凑场景格式的前端渲染：纯文本段落 + [offset, length, wordIndex] 标注 + 每个响应一份的单词表
+// 输出与旧版预渲染 HTML 结构相同（zh/en.content、zh.translationParagraphs），页面组件无需改动
+
+const escapeHtml = (s) => s.replace(/&/g, '&amp;').replace(/</g, '&lt;').replace(/>/g, '&gt;')
+
+const tipOf = (w) => escapeHtml(`${w.word}: ${w.pos || ''} ${w.meaning || ''}`.trim())
+
+// offset/length 以 Unicode 码点计；只有含代理对（emoji 等）时才需要按码点切分
+const renderText = (text, marks, tips) => {
+  if (!text) return ''
+  const chars = /[\uD800-\uDFFF]/.test(text) ? Array.from(text) : text
+  const slice = (a, b) => (typeof chars === 'string' ? chars.slice(a, b) : chars.slice(a, b).join(''))
+  let out = ''
+  let pos = 0
+  for (const [o, n, i] of marks || []) {
+    out += escapeHtml(slice(pos, o))
+    const tip = tips[i]
+    const word = escapeHtml(slice(o, o + n))
+    out += tip == null ? word : `<span class='word-highlight'>${word}<span class='tooltip'>${tip}</span></span>`
+    pos = o + n
+  }
+  return out + escapeHtml(slice(pos, chars.length))
+}
+
+export const isCompactScene = (scene) => Array.isArray(scene?.paragraphs)
+
+export const renderScene = (scene, words = []) => {
+  if (!isCompactScene(scene)) return scene  // 旧版 HTML 场景原样使用
+  const tips = words.map(tipOf)
+  const zh = []
+  const en = []
+  const tr = []
+  for (const p of scene.paragraphs) {
+    const m = p.marks || {}
+    zh.push(`<p class='mb-3'>${renderText(p.zh, m.zh, tips)}</p>`)
+    en.push(`<p class='mb-3'>${renderText(p.en, m.en, tips)}</p>`)
+    tr.push(renderText(p.tr, m.tr, tips))
+  }
+  const { paragraphs, ...rest } = scene
+  return {
+    ...rest,
+    zh: { ...scene.zh, content: zh.join(''), translationParagraphs: tr },
+    en: { ...scene.en, content: en.join('') }
+  }
+}
+
+// 背景图：场景图已导入本地时有 bgImageSet（宽度升序），挑能铺满视口（bg-cover）的最小变体；否则用 bgImage。
+// 按 CSS 像素挑，不乘设备像素比：背景压在渐变遮罩和毛玻璃卡片下面，高清屏上多出的像素看不出来，手机上却要多下几倍
+export const backgroundUrl = (scene) => {
+  const set = scene?.bgImageSet
+  if (!set?.length) return scene?.bgImage
+  const fits = (v) => v.w >= Math.max(window.innerWidth, window.innerHeight * v.w / v.h)
+  return (set.find(fits) || set[set.length - 1]).url
+}
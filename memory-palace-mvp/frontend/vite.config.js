@@ -10,6 +10,10 @@ export default defineConfig({
         target: 'http://localhost:8000',
         changeOrigin: true,
         rewrite: (path) => path.replace(/^\/api/, '')
+      },
+      '/static': {
+        target: 'http://localhost:8000',
+        changeOrigin: true
       }
     }
   }